@@ -0,0 +1,182 @@
+import os
+import time
+import threading
+import cv2
+
+# 等待摄像头新帧的超时时间（秒），超时视为摄像头已断开
+CAPTURE_READ_TIMEOUT = float(os.getenv('CAPTURE_READ_TIMEOUT', 5))
+# 停止采集时等待采集线程退出的时间（秒）
+CAPTURE_STOP_TIMEOUT = 2.0
+
+
+class CameraCapture:
+    def __init__(self, source, opener):
+        """
+        摄像头采集线程
+        独立线程持续读取摄像头，只保留最新一帧（单槽缓冲，新帧覆盖旧帧），
+        采集节奏不再受推理耗时和客户端读取速度影响，驱动缓冲中不会积压旧帧
+        :param source: 摄像头标识（如设备号）
+        :param opener: 打开摄像头的函数，返回 cv2.VideoCapture；在采集线程中调用，摄像头只由该线程访问
+        """
+        self.source = source
+        self.consumers = 0
+        self.frames_captured = 0
+        self.started_at = time.time()
+        self._opener = opener
+        self._frame = None
+        self._seq = 0
+        self._opened = threading.Event()
+        self._stopped = threading.Event()
+        self._ended = False
+        self._is_opened = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._loop, name=f'camera-capture-{source}', daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        cap = None
+        try:
+            cap = self._opener()
+            self._is_opened = cap.isOpened()
+            if self._is_opened:
+                # 尽量减小驱动缓冲，部分后端不支持时忽略
+                cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            self._opened.set()
+            while self._is_opened and not self._stopped.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    print(f"[DEBUG] 摄像头 {self.source} 读取失败，停止采集")
+                    break
+                with self._cond:
+                    self._frame = frame
+                    self._seq += 1
+                    self.frames_captured += 1
+                    self._cond.notify_all()
+        except Exception as e:
+            print(f"[ERROR] 摄像头 {self.source} 采集异常: {e}")
+        finally:
+            self._opened.set()
+            if cap is not None:
+                cap.release()
+            with self._cond:
+                self._ended = True
+                self._cond.notify_all()
+
+    def isOpened(self):
+        self._opened.wait(CAPTURE_READ_TIMEOUT)
+        return self._is_opened and not self._ended
+
+    @property
+    def ended(self):
+        return self._ended
+
+    def wait_frame(self, last_seq, timeout=CAPTURE_READ_TIMEOUT):
+        """
+        等待比 last_seq 更新的帧
+        :return: (帧序号, 帧)；采集已结束或超时返回 (None, None)
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > last_seq or self._ended, timeout):
+                print(f"[DEBUG] 摄像头 {self.source} 等待新帧超时")
+                return None, None
+            if self._seq <= last_seq:
+                return None, None
+            return self._seq, self._frame
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join(CAPTURE_STOP_TIMEOUT)
+
+    def get_stats(self):
+        elapsed = time.time() - self.started_at
+        return {
+            'source': self.source,
+            'consumers': self.consumers,
+            'frames_captured': self.frames_captured,
+            'capture_fps': round(self.frames_captured / elapsed, 2) if elapsed > 0 else 0.0,
+            'running': not self._ended
+        }
+
+
+class CaptureReader:
+    def __init__(self, registry, capture):
+        """
+        采集线程的单个读取方，接口与 cv2.VideoCapture 的 read/isOpened/release 一致
+        每次 read 取最新一帧，期间被覆盖、未被读到的帧计为丢弃帧
+        """
+        self._registry = registry
+        self.capture = capture
+        self._last_seq = None
+        self._released = False
+        self.frames_read = 0
+        self.frames_dropped = 0
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def read(self):
+        if self._released:
+            return False, None
+        seq, frame = self.capture.wait_frame(self._last_seq or 0)
+        if seq is None:
+            return False, None
+        if self._last_seq is not None:
+            self.frames_dropped += seq - self._last_seq - 1
+        self._last_seq = seq
+        self.frames_read += 1
+        # 采集线程发布的帧可能被其他读取方共用（读取方随时可能加入），始终返回副本供绘制
+        return True, frame.copy()
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._registry.release(self)
+
+    def get_stats(self):
+        seen = self.frames_read + self.frames_dropped
+        return dict(self.capture.get_stats(),
+                    frames_read=self.frames_read,
+                    frames_dropped=self.frames_dropped,
+                    drop_rate=round(self.frames_dropped / seen, 3) if seen else 0.0)
+
+
+class CaptureRegistry:
+    def __init__(self):
+        """
+        摄像头采集线程注册表
+        同一摄像头只启动一个采集线程，多个检测流共用；最后一个读取方释放时停止采集并关闭摄像头
+        """
+        self._captures = {}
+        self._lock = threading.Lock()
+
+    def open(self, source, opener):
+        """
+        获取摄像头的读取方，摄像头未在采集时启动采集线程
+        :param source: 摄像头标识
+        :param opener: 打开摄像头的函数
+        """
+        with self._lock:
+            capture = self._captures.get(source)
+            if capture is None or capture.ended:
+                capture = CameraCapture(source, opener)
+                self._captures[source] = capture
+            capture.consumers += 1
+            return CaptureReader(self, capture)
+
+    def release(self, reader):
+        capture = reader.capture
+        with self._lock:
+            capture.consumers -= 1
+            if capture.consumers > 0:
+                return
+            if self._captures.get(capture.source) is capture:
+                del self._captures[capture.source]
+        capture.stop()
+
+    def get_stats(self):
+        with self._lock:
+            return [capture.get_stats() for capture in self._captures.values()]
+
+
+# 全局摄像头采集注册表
+camera_captures = CaptureRegistry()
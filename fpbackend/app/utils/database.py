@@ -92,7 +92,38 @@ class DatabaseManager:
         """执行增删改操作"""
         cursor = self.execute_query(sql, params)
         return cursor.rowcount
-    
+
+    def execute_many(self, sql, params_list):
+        """批量执行增删改操作：一次 executemany、一次提交，INSERT 会被合并为多行写入"""
+        params_list = list(params_list)
+        if not params_list:
+            return 0
+        try:
+            if not self.connection or not self.connection.open:
+                self.connect()
+            cursor = self.connection.cursor()
+            cursor.executemany(sql, params_list)
+            self.connection.commit()
+            return cursor.rowcount
+        except pymysql.err.OperationalError as e:
+            # 连接断开时自动重连一次
+            if e.args[0] in (2006, 2013):
+                logger.warning(f"数据库连接断开，尝试自动重连... 错误: {e}")
+                self.connect()
+                cursor = self.connection.cursor()
+                cursor.executemany(sql, params_list)
+                self.connection.commit()
+                return cursor.rowcount
+            logger.error(f"批量执行失败: {e}")
+            if self.connection:
+                self.connection.rollback()
+            raise
+        except Exception as e:
+            logger.error(f"批量执行失败: {e}")
+            if self.connection:
+                self.connection.rollback()
+            raise
+
     def close(self):
         """关闭数据库连接"""
         if self.connection and self.connection.open:
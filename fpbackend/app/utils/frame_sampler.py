@@ -0,0 +1,69 @@
+import os
+import threading
+
+# 自适应采样的最小/最大帧间隔
+ADAPTIVE_MIN_STRIDE = int(os.getenv('ADAPTIVE_MIN_STRIDE', 1))
+ADAPTIVE_MAX_STRIDE = int(os.getenv('ADAPTIVE_MAX_STRIDE', 6))
+# 连续多少个采样帧无疲劳迹象后放宽一次采样间隔
+ADAPTIVE_RELAX_AFTER = int(os.getenv('ADAPTIVE_RELAX_AFTER', 5))
+
+
+class AdaptiveFrameSampler:
+    def __init__(self, min_stride=ADAPTIVE_MIN_STRIDE, max_stride=ADAPTIVE_MAX_STRIDE,
+                 relax_after=ADAPTIVE_RELAX_AFTER):
+        """
+        根据疲劳状态自适应调整视频采样间隔
+        驾驶员状态正常时稀疏采样，一旦出现闭眼或张嘴立即回到最密采样，
+        之后连续 relax_after 个采样帧正常再逐步放宽间隔（每次翻倍，不超过 max_stride）
+        :param min_stride: 最小采样间隔（1 表示逐帧）
+        :param max_stride: 最大采样间隔
+        :param relax_after: 放宽间隔前需要连续正常的采样帧数
+        """
+        self.min_stride = max(1, int(min_stride))
+        self.max_stride = max(self.min_stride, int(max_stride))
+        self.relax_after = max(1, int(relax_after))
+        # 开始时按警觉状态稀疏采样
+        self._stride = self.max_stride
+        self._calm_samples = 0
+        self._lock = threading.Lock()
+
+        self.sampled_frames = 0
+        self.skipped_frames = 0
+
+    @property
+    def stride(self):
+        """当前采样间隔，解码阶段据此跳过后续帧"""
+        with self._lock:
+            return self._stride
+
+    def record_sample(self, skipped):
+        """记录一次采样及其后跳过的帧数"""
+        with self._lock:
+            self.sampled_frames += 1
+            self.skipped_frames += skipped
+
+    def update(self, closed_eyes, open_mouth):
+        """
+        用采样帧的检测结果更新采样间隔
+        :param closed_eyes: 该帧闭眼检测数
+        :param open_mouth: 该帧张嘴检测数
+        """
+        with self._lock:
+            if closed_eyes > 0 or open_mouth > 0:
+                self._stride = self.min_stride
+                self._calm_samples = 0
+                return
+            self._calm_samples += 1
+            if self._calm_samples >= self.relax_after:
+                self._stride = min(self._stride * 2, self.max_stride)
+                self._calm_samples = 0
+
+    def get_stats(self):
+        with self._lock:
+            total = self.sampled_frames + self.skipped_frames
+            return {
+                'sampled_frames': self.sampled_frames,
+                'skipped_frames': self.skipped_frames,
+                'sample_ratio': round(self.sampled_frames / total, 3) if total else 0.0,
+                'current_stride': self._stride
+            }
@@ -0,0 +1,170 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# 单次前向的最大批大小
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', 16))
+# 第一帧到达后最多等待多久再凑批（毫秒）
+INFERENCE_MAX_QUEUE_DELAY_MS = float(os.getenv('INFERENCE_MAX_QUEUE_DELAY_MS', 5))
+
+
+class _Request:
+    __slots__ = ('source', 'kwargs', 'key', 'future')
+
+    def __init__(self, source, kwargs):
+        self.source = source
+        self.kwargs = kwargs
+        # 文件路径会被 ultralytics 转成 PIL 图片后丢失原文件名，只能单独推理
+        batchable = not isinstance(source, str)
+        self.key = (batchable, tuple(sorted(kwargs.items())))
+        hash(self.key)  # 参数必须可哈希（imgsz 用元组），在提交时就报错
+        self.future = Future()
+
+
+class InferenceServer:
+    def __init__(self, model, max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+                 max_queue_delay_ms=INFERENCE_MAX_QUEUE_DELAY_MS):
+        """
+        进程内推理服务：汇总所有会话提交的帧，按动态微批统一送入模型
+        :param model: YOLO 模型
+        :param max_batch_size: 单次前向的最大帧数
+        :param max_queue_delay_ms: 第一帧到达后等待凑批的最长时间
+        """
+        self.model = model
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_queue_delay = max(0.0, float(max_queue_delay_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+
+        # 运行统计
+        self.batches = 0
+        self.frames = 0
+
+        self._thread = threading.Thread(target=self._loop, name='inference-server', daemon=True)
+        self._thread.start()
+
+    def submit(self, source, **kwargs):
+        """
+        提交单帧推理
+        :param source: numpy 图像帧或图片路径
+        :param kwargs: 传给 model.predict 的参数，如 conf、imgsz
+        :return: Future，结果为该帧的 Results
+        """
+        if self._stop.is_set():
+            raise RuntimeError("推理服务已停止")
+        kwargs.setdefault('verbose', False)
+        request = _Request(source, kwargs)
+        self._queue.put(request)
+        return request.future
+
+    def submit_many(self, sources, **kwargs):
+        """按顺序提交多帧，返回对应的 Future 列表"""
+        return [self.submit(source, **dict(kwargs)) for source in sources]
+
+    def predict(self, sources, **kwargs):
+        """提交多帧并等待结果，返回与输入顺序一致的 Results 列表"""
+        return [future.result() for future in self.submit_many(sources, **kwargs)]
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        # 未处理的请求直接失败，避免调用方一直等待
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            request.future.set_exception(RuntimeError("推理服务已停止"))
+
+    def get_stats(self):
+        return {
+            'batches': self.batches,
+            'frames': self.frames,
+            'avg_batch_size': round(self.frames / self.batches, 2) if self.batches else 0.0,
+            'queue_depth': self._queue.qsize(),
+            'max_batch_size': self.max_batch_size,
+            'max_queue_delay_ms': self.max_queue_delay * 1000.0
+        }
+
+    def _loop(self):
+        # 停止后仍处理完已排队的请求再退出
+        while not self._stop.is_set() or not self._queue.empty():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            # 在最大等待时间内尽量凑满一批
+            pending = [first]
+            deadline = time.perf_counter() + self.max_queue_delay
+            while len(pending) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining > 0:
+                        pending.append(self._queue.get(timeout=remaining))
+                    else:
+                        pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # 推理参数不同的请求不能合并到同一次前向
+            groups = {}
+            for request in pending:
+                groups.setdefault(request.key, []).append(request)
+            for (batchable, _), requests in groups.items():
+                if batchable:
+                    self._run_batch(requests)
+                else:
+                    for request in requests:
+                        self._run_batch([request])
+
+    def _run_batch(self, requests):
+        requests = [request for request in requests if request.future.set_running_or_notify_cancel()]
+        if not requests:
+            return
+        try:
+            sources = [request.source for request in requests]
+            source = sources if len(sources) > 1 else sources[0]
+            results = self.model.predict(source=source, **requests[0].kwargs)
+            if len(results) != len(requests):
+                raise RuntimeError(f"推理结果数量不匹配: {len(results)} != {len(requests)}")
+            self.batches += 1
+            self.frames += len(requests)
+            for request, result in zip(requests, results):
+                request.future.set_result(result)
+        except Exception as e:
+            print(f"[ERROR] 批量推理失败: {e}")
+            for request in requests:
+                request.future.set_exception(e)
+
+
+# 每个模型实例共用一个推理服务
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def get_inference_server(model):
+    """获取（必要时创建）模型对应的推理服务"""
+    with _servers_lock:
+        server = _servers.get(id(model))
+        if server is None or server.model is not model:
+            server = InferenceServer(model)
+            _servers[id(model)] = server
+        return server
+
+
+def shutdown_inference_server(model):
+    """停止模型对应的推理服务，模型卸载时调用"""
+    with _servers_lock:
+        server = _servers.pop(id(model), None)
+    if server is not None:
+        server.stop()
+
+
+def get_inference_stats():
+    """所有推理服务的运行统计"""
+    with _servers_lock:
+        servers = list(_servers.values())
+    return [server.get_stats() for server in servers]
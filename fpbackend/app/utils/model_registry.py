@@ -0,0 +1,272 @@
+import os
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from ultralytics import YOLO
+from app.utils.inference_server import shutdown_inference_server
+from app.utils.onnx_backend import export_onnx, OnnxYOLO
+from app.utils.quantization import int8_model_path
+
+# 常驻模型的内存预算（MB），超出后按LRU卸载空闲模型
+MODEL_MEMORY_BUDGET_MB = float(os.getenv('MODEL_MEMORY_BUDGET_MB', 1024))
+
+# 推理后端：torch 为 ultralytics 原生 PyTorch，onnx 为导出后的 ONNX Runtime，
+# onnx-int8 为训练后量化得到的 INT8 模型（需先调用量化接口生成）
+SUPPORTED_BACKENDS = ('torch', 'onnx', 'onnx-int8')
+# 默认推理后端
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'torch')
+# 按模型指定默认后端，格式: "best.pt=onnx,other.pt=torch"
+MODEL_BACKENDS = os.getenv('MODEL_BACKENDS', '')
+
+# 模型文件查找目录
+MODEL_SEARCH_DIRS = [
+    os.path.join('models', 'uploads'),
+    os.path.join('..', 'fpdemo', 'models', 'uploads'),
+    '.'
+]
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """计算文件内容的 sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_model_backends(spec):
+    """解析 "best.pt=onnx,other.pt=torch" 形式的按模型后端配置"""
+    backends = {}
+    for part in str(spec or '').split(','):
+        name, sep, backend = part.strip().partition('=')
+        if sep and backend.strip() in SUPPORTED_BACKENDS:
+            backends[name.strip()] = backend.strip()
+    return backends
+
+
+def estimate_model_memory(model, path):
+    """估算模型常驻内存：参数与缓冲区张量大小之和，无法获取时退化为文件大小"""
+    try:
+        module = model.model
+        total = sum(p.numel() * p.element_size() for p in module.parameters())
+        total += sum(b.numel() * b.element_size() for b in module.buffers())
+        if total > 0:
+            return total
+    except Exception:
+        pass
+    # ONNX 等无法枚举张量的后端按模型文件大小估算
+    return os.path.getsize(getattr(model, 'path', None) or path)
+
+
+class _ModelEntry:
+    def __init__(self, key, content_hash, backend, path, model, memory_bytes):
+        self.key = key
+        self.content_hash = content_hash
+        self.backend = backend
+        self.path = path
+        self.model = model
+        self.memory_bytes = memory_bytes
+        self.refcount = 0
+        self.names = set()
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+
+
+class ModelRegistry:
+    def __init__(self, memory_budget_mb=MODEL_MEMORY_BUDGET_MB, search_dirs=None):
+        """
+        统一模型注册表
+        按文件内容哈希去重，统计每个模型的常驻内存，超出预算时按LRU卸载未被占用的模型
+        :param memory_budget_mb: 常驻模型内存预算（MB）
+        :param search_dirs: 模型文件查找目录
+        """
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.search_dirs = list(search_dirs or MODEL_SEARCH_DIRS)
+        self._entries = OrderedDict()     # (内容哈希, 后端) -> _ModelEntry，按最近使用排序
+        self._hash_cache = {}             # (真实路径, 大小, 修改时间) -> 内容哈希
+        self._load_locks = {}             # (内容哈希, 后端) -> 加载锁，避免同一模型并发重复加载
+        self._model_backends = parse_model_backends(MODEL_BACKENDS)
+        self._lock = threading.RLock()
+
+    def resolve_backend(self, model_filename, backend=None):
+        """确定模型使用的推理后端：请求参数 > 按模型配置 > 全局默认"""
+        backend = (backend or self._model_backends.get(model_filename) or INFERENCE_BACKEND).strip().lower()
+        if backend not in SUPPORTED_BACKENDS:
+            raise ValueError(f"不支持的推理后端: {backend}，支持: {list(SUPPORTED_BACKENDS)}")
+        return backend
+
+    def set_model_backend(self, model_filename, backend):
+        """设置模型的默认推理后端"""
+        with self._lock:
+            self._model_backends[model_filename] = self.resolve_backend(model_filename, backend)
+
+    def resolve_path(self, model_filename):
+        """按文件名在模型目录中查找模型文件"""
+        candidates = [os.path.join(d, model_filename) for d in self.search_dirs] + [model_filename]
+        for path in candidates:
+            if os.path.isfile(path):
+                return path
+        raise FileNotFoundError(f"模型文件不存在: {model_filename}")
+
+    def resolve(self, model_filename):
+        """返回模型文件路径及其内容哈希"""
+        path = self.resolve_path(model_filename)
+        return path, self._content_hash(path)
+
+    def _content_hash(self, path):
+        real_path = os.path.realpath(path)
+        st = os.stat(real_path)
+        cache_key = (real_path, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            cached = self._hash_cache.get(cache_key)
+        if cached:
+            return cached
+        content_hash = file_sha256(real_path)
+        with self._lock:
+            self._hash_cache[cache_key] = content_hash
+        return content_hash
+
+    def get(self, model_filename, backend=None):
+        """按文件名加载或复用模型（不占用）"""
+        return self._get_entry(model_filename, backend).model
+
+    def acquire(self, model_filename, backend=None):
+        """加载模型并增加引用计数，被占用的模型不会被卸载"""
+        entry = self._get_entry(model_filename, backend, pin=True)
+        return entry.model
+
+    def release(self, model):
+        """释放 acquire/pin 的占用"""
+        with self._lock:
+            entry = self._find_entry(model)
+            if entry is None:
+                return
+            entry.refcount = max(0, entry.refcount - 1)
+            entry.last_used = time.time()
+            self._evict_if_needed()
+
+    def pin(self, model):
+        """占用已加载的模型（如实时流正在使用），返回是否成功"""
+        with self._lock:
+            entry = self._find_entry(model)
+            if entry is None:
+                return False
+            entry.refcount += 1
+            entry.last_used = time.time()
+            self._entries.move_to_end(entry.key)
+            return True
+
+    @contextmanager
+    def pinned(self, model):
+        """在 with 代码块内占用模型"""
+        pinned = self.pin(model)
+        try:
+            yield model
+        finally:
+            if pinned:
+                self.release(model)
+
+    def _find_entry(self, model):
+        for entry in self._entries.values():
+            if entry.model is model:
+                return entry
+        return None
+
+    def _get_entry(self, model_filename, backend=None, pin=False):
+        backend = self.resolve_backend(model_filename, backend)
+        path = self.resolve_path(model_filename)
+        content_hash = self._content_hash(path)
+        key = (content_hash, backend)
+
+        with self._lock:
+            entry = self._touch(key, model_filename, pin)
+            if entry is not None:
+                return entry
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # 等锁期间可能已被其他线程加载
+            with self._lock:
+                entry = self._touch(key, model_filename, pin)
+                if entry is not None:
+                    return entry
+
+            print(f"[DEBUG] 加载模型: {path} ({content_hash[:12]}, 后端: {backend})")
+            try:
+                model = self._load(path, content_hash, backend)
+                entry = _ModelEntry(key, content_hash, backend, path, model, estimate_model_memory(model, path))
+                with self._lock:
+                    self._entries[key] = entry
+                    self._touch(key, model_filename, pin)
+                    self._evict_if_needed(keep=key)
+            finally:
+                with self._lock:
+                    self._load_locks.pop(key, None)
+            return entry
+
+    def _load(self, path, content_hash, backend):
+        if backend == 'onnx-int8':
+            int8_path = int8_model_path(path, content_hash)
+            if not os.path.exists(int8_path):
+                raise FileNotFoundError(f"INT8模型不存在，请先执行量化: {os.path.basename(path)}")
+            return OnnxYOLO(int8_path)
+        if backend == 'onnx':
+            # .pt 首次使用时导出为 ONNX 并缓存，之后直接加载导出文件
+            onnx_path = path if path.endswith('.onnx') else export_onnx(path, content_hash)
+            return OnnxYOLO(onnx_path)
+        return YOLO(path)
+
+    def _touch(self, key, model_filename, pin):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        entry.names.add(model_filename)
+        entry.last_used = time.time()
+        if pin:
+            entry.refcount += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def _evict_if_needed(self, keep=None):
+        """超出内存预算时，从最久未使用的空闲模型开始卸载"""
+        total = sum(entry.memory_bytes for entry in self._entries.values())
+        if total <= self.memory_budget:
+            return
+        for key in list(self._entries):
+            if total <= self.memory_budget:
+                break
+            entry = self._entries[key]
+            if entry.refcount > 0 or key == keep:
+                continue
+            del self._entries[key]
+            total -= entry.memory_bytes
+            print(f"[DEBUG] 卸载空闲模型: {entry.path}, 释放 {entry.memory_bytes / 1024 / 1024:.1f}MB")
+            shutdown_inference_server(entry.model)
+        if total > self.memory_budget:
+            print(f"[DEBUG] 模型内存 {total / 1024 / 1024:.1f}MB 超出预算，剩余模型均被占用")
+
+    def get_stats(self):
+        """已加载模型的内存与占用情况"""
+        with self._lock:
+            models = [{
+                'names': sorted(entry.names),
+                'path': entry.path,
+                'content_hash': entry.content_hash,
+                'backend': entry.backend,
+                'memory_mb': round(entry.memory_bytes / 1024 / 1024, 2),
+                'refcount': entry.refcount,
+                'loaded_at': entry.loaded_at,
+                'last_used': entry.last_used
+            } for entry in self._entries.values()]
+        return {
+            'memory_budget_mb': round(self.memory_budget / 1024 / 1024, 2),
+            'memory_used_mb': round(sum(m['memory_mb'] for m in models), 2),
+            'models': models
+        }
+
+
+# 全局模型注册表
+model_registry = ModelRegistry()
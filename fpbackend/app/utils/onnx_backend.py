@@ -0,0 +1,119 @@
+import os
+import ast
+import shutil
+import cv2
+import numpy as np
+
+# ONNX 导出文件缓存目录
+ONNX_CACHE_DIR = os.getenv('ONNX_CACHE_DIR', os.path.join('models', 'onnx'))
+# ONNX Runtime 线程配置：算子内并行线程数 / 算子间并行线程数
+ORT_INTRA_OP_THREADS = int(os.getenv('ORT_INTRA_OP_THREADS', os.cpu_count() or 1))
+ORT_INTER_OP_THREADS = int(os.getenv('ORT_INTER_OP_THREADS', 1))
+
+
+def onnx_cache_path(pt_path, content_hash, suffix=''):
+    """导出文件路径：<模型名>_<哈希前12位><后缀>.onnx"""
+    stem = os.path.splitext(os.path.basename(pt_path))[0]
+    return os.path.join(ONNX_CACHE_DIR, f"{stem}_{content_hash[:12]}{suffix}.onnx")
+
+
+def preprocess_batch(images, shape):
+    """
+    按 ultralytics 的方式 letterbox 并归一化，得到模型输入
+    :param images: BGR 图像列表
+    :param shape: (高, 宽) 输入尺寸
+    :return: float32 NCHW 数组
+    """
+    from ultralytics.data.augment import LetterBox
+
+    letterbox = LetterBox(new_shape=shape, auto=False)
+    batch = np.stack([letterbox(image=image) for image in images])
+    # BGR HWC uint8 -> RGB CHW float32
+    return np.ascontiguousarray(batch[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32) / 255.0
+
+
+def export_onnx(pt_path, content_hash, imgsz=640):
+    """
+    把 .pt 模型导出为 ONNX，按内容哈希缓存，同一模型只导出一次
+    :param pt_path: .pt 模型路径
+    :param content_hash: 模型文件内容哈希
+    :param imgsz: 导出输入尺寸
+    :return: ONNX 文件路径
+    """
+    os.makedirs(ONNX_CACHE_DIR, exist_ok=True)
+    onnx_path = onnx_cache_path(pt_path, content_hash)
+    if os.path.exists(onnx_path):
+        return onnx_path
+
+    from ultralytics import YOLO
+    print(f"[DEBUG] 导出ONNX模型: {pt_path} -> {onnx_path}")
+    # dynamic=True 支持任意批大小，便于推理服务动态凑批
+    exported = YOLO(pt_path).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=False)
+    tmp_path = onnx_path + '.tmp'
+    shutil.move(str(exported), tmp_path)
+    os.replace(tmp_path, onnx_path)
+    return onnx_path
+
+
+class OnnxYOLO:
+    def __init__(self, onnx_path, intra_op_threads=ORT_INTRA_OP_THREADS, inter_op_threads=ORT_INTER_OP_THREADS):
+        """
+        基于 ONNX Runtime 的 CPU 推理后端
+        predict 返回 ultralytics 的 Results 对象，现有的 boxes.cls / boxes.conf 解析与 plot() 绘制无需修改
+        :param onnx_path: ONNX 模型路径
+        :param intra_op_threads: 算子内并行线程数
+        :param inter_op_threads: 算子间并行线程数
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.path = onnx_path
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+        # 类别名称由 ultralytics 导出时写入模型元数据
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        names = metadata.get('names')
+        self.names = ast.literal_eval(names) if names else {0: 'closed_eyes', 1: 'closed_mouth', 2: 'open_eyes', 3: 'open_mouth'}
+
+    def predict(self, source=None, conf=0.25, iou=0.7, imgsz=640, max_det=300, verbose=False, **kwargs):
+        """
+        与 YOLO.predict 兼容的推理接口
+        :param source: numpy 图像、图片路径或它们的列表
+        :return: Results 列表
+        """
+        import torch
+        from ultralytics.engine.results import Results
+        from ultralytics.utils import ops
+
+        sources = source if isinstance(source, (list, tuple)) else [source]
+        images, paths = [], []
+        for index, item in enumerate(sources):
+            if isinstance(item, str):
+                image = cv2.imread(item)
+                if image is None:
+                    raise FileNotFoundError(f"无法读取图片: {item}")
+                images.append(image)
+                paths.append(item)
+            else:
+                images.append(item)
+                paths.append(f"image{index}.jpg")
+
+        shape = (imgsz, imgsz) if isinstance(imgsz, int) else tuple(imgsz)
+        batch = preprocess_batch(images, shape)
+
+        output = self.session.run(None, {self.input_name: batch})[0]
+        detections = ops.non_max_suppression(torch.from_numpy(output), conf, iou, max_det=max_det)
+
+        results = []
+        for image, path, det in zip(images, paths, detections):
+            det[:, :4] = ops.scale_boxes(shape, det[:, :4], image.shape)
+            results.append(Results(image, path=path, names=self.names, boxes=det))
+        return results
+
+    __call__ = predict
@@ -0,0 +1,246 @@
+import os
+import json
+import cv2
+import threading
+import numpy as np
+from collections import OrderedDict
+from app.utils.postprocess import CLASS_NAMES, class_name, result_arrays, result_xyxy
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+# 检测框颜色（BGR）：疲劳指标用暖色，正常状态用冷色
+BOX_COLORS = {
+    0: (0, 0, 255),       # 闭眼 - 红色
+    1: (255, 128, 0),     # 闭嘴 - 蓝色
+    2: (0, 200, 0),       # 睁眼 - 绿色
+    3: (0, 165, 255),     # 张嘴 - 橙色
+}
+DEFAULT_BOX_COLOR = (200, 200, 200)
+LABEL_TEXT_COLOR = (255, 255, 255)
+BOX_LABEL_SCALE = 0.5
+BOX_LABEL_THICKNESS = 1
+
+# 左上角统计信息布局：标签、位置、字号与颜色固定，只有数值变化
+STATS_LABELS = ('Frame: ', 'Time: ', 'Total: ', 'Eyes: ', 'Mouth: ')
+STATS_ORIGIN_X = 10
+STATS_LINE_Y = (30, 60, 90, 120, 150)
+STATS_SCALE = 0.6
+STATS_COLOR = (255, 255, 0)
+STATS_THICKNESS = 2
+
+# 疲劳等级横幅
+FATIGUE_BANNERS = {
+    'none': ('No Fatigue', (0, 255, 0)),          # 绿色 - 不疲劳
+    'mild': ('Mild Fatigue', (0, 255, 255)),      # 黄色 - 轻度疲劳
+    'moderate': ('Moderate Fatigue', (0, 165, 255)),  # 橙色 - 中度疲劳
+    'severe': ('Severe Fatigue', (0, 0, 255)),    # 红色 - 重度疲劳
+}
+BANNER_Y = 180
+BANNER_SCALE = 0.8
+
+
+# 动态文字（计数、置信度）位图缓存上限
+TEXT_CACHE_SIZE = 1024
+
+
+class _TextMask:
+    """预先渲染的文字位图：mask 为文字像素，patch 为同尺寸纯色块，(dx, dy) 为左上角相对基线起点的偏移"""
+    __slots__ = ('mask', 'patch', 'dx', 'dy', 'advance')
+
+    def __init__(self, text, scale, thickness, color):
+        (width, height), baseline = cv2.getTextSize(text, FONT, scale, thickness)
+        pad = thickness
+        self.mask = np.zeros((height + baseline + 2 * pad, width + 2 * pad), dtype=np.uint8)
+        cv2.putText(self.mask, text, (pad, pad + height), FONT, scale, 255, thickness)
+        self.patch = np.empty(self.mask.shape + (3,), dtype=np.uint8)
+        self.patch[:] = color
+        self.dx = -pad
+        self.dy = -(pad + height)
+        self.advance = width
+
+
+class OverlayRenderer:
+    def __init__(self, names=None, cache_size=TEXT_CACHE_SIZE):
+        """
+        轻量叠加层绘制
+        直接在帧缓冲上绘制检测框，不再通过 result.plot() 复制整帧；
+        固定的统计标签、默认类别名与疲劳横幅预渲染为位图，计数、置信度和其他模型的类别名等文字按字符串缓存位图（按最近使用淘汰），
+        绘制时用 cv2.copyTo 按掩码贴图，比逐帧 putText 光栅化更快
+        :param names: 默认类别名映射，绘制时未传入模型的类别名时使用
+        :param cache_size: 动态文字位图缓存上限
+        """
+        self.names = dict(names or CLASS_NAMES)
+        self.cache_size = cache_size
+        self._static = {}
+        self._dynamic = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 预渲染固定文字
+        for label in STATS_LABELS:
+            self._static_mask(label, STATS_SCALE, STATS_THICKNESS, STATS_COLOR)
+        for text, color in FATIGUE_BANNERS.values():
+            self._static_mask(text, BANNER_SCALE, STATS_THICKNESS, color)
+        for name in self.names.values():
+            self._static_mask(name + ' ', BOX_LABEL_SCALE, BOX_LABEL_THICKNESS, LABEL_TEXT_COLOR)
+
+    def _static_mask(self, text, scale, thickness, color):
+        key = (text, scale, thickness, color)
+        with self._lock:
+            mask = self._static.get(key)
+        if mask is None:
+            mask = _TextMask(text, scale, thickness, color)
+            with self._lock:
+                mask = self._static.setdefault(key, mask)
+        return mask
+
+    def _dynamic_mask(self, text, scale, thickness, color):
+        key = (text, scale, thickness, color)
+        with self._lock:
+            mask = self._dynamic.get(key)
+            if mask is not None:
+                self._dynamic.move_to_end(key)
+                return mask
+        mask = _TextMask(text, scale, thickness, color)
+        with self._lock:
+            self._dynamic[key] = mask
+            while len(self._dynamic) > self.cache_size:
+                self._dynamic.popitem(last=False)
+        return mask
+
+    @staticmethod
+    def _blit(image, mask, x, y):
+        """把文字位图贴到 (x, y) 基线起点处，超出画面的部分裁掉"""
+        top, left = y + mask.dy, x + mask.dx
+        height, width = mask.mask.shape
+        y0, x0 = max(top, 0), max(left, 0)
+        y1, x1 = min(top + height, image.shape[0]), min(left + width, image.shape[1])
+        if y0 >= y1 or x0 >= x1:
+            return
+        rows, cols = slice(y0 - top, y1 - top), slice(x0 - left, x1 - left)
+        cv2.copyTo(mask.patch[rows, cols], mask.mask[rows, cols], image[y0:y1, x0:x1])
+
+    def draw_text(self, image, text, org, scale, color, thickness, cache=True):
+        """
+        绘制文字
+        :param cache: 是否缓存位图；每帧都不同的文字（帧号、时间）直接 putText
+        :return: 文字末尾的 x 坐标
+        """
+        if not cache:
+            cv2.putText(image, text, org, FONT, scale, color, thickness)
+            return org[0] + cv2.getTextSize(text, FONT, scale, thickness)[0][0]
+        key = (text, scale, thickness, color)
+        mask = self._static.get(key) or self._dynamic_mask(text, scale, thickness, color)
+        self._blit(image, mask, *org)
+        return org[0] + mask.advance
+
+    def draw_boxes(self, image, xyxy, cls, conf, names=None):
+        """
+        在帧上原地绘制检测框和 "类别 置信度" 标签
+        :param xyxy: (N, 4) 检测框
+        :param cls: (N,) 类别
+        :param conf: (N,) 置信度
+        :param names: 产生检测结果的模型的类别名（result.names / model.names），不传时使用默认类别名
+        """
+        names = self.names if names is None else names
+        height, width = image.shape[:2]
+        for (x1, y1, x2, y2), c, p in zip(np.asarray(xyxy).astype(int).tolist(), cls.tolist(), conf.tolist()):
+            color = BOX_COLORS.get(c, DEFAULT_BOX_COLOR)
+            cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
+
+            label = names.get(c, class_name(c)) + ' '
+            # 只有默认类别名常驻，其他模型的类别名进入有上限的动态缓存
+            name = self._static.get((label, BOX_LABEL_SCALE, BOX_LABEL_THICKNESS, LABEL_TEXT_COLOR)) or \
+                self._dynamic_mask(label, BOX_LABEL_SCALE, BOX_LABEL_THICKNESS, LABEL_TEXT_COLOR)
+            score = self._dynamic_mask(f"{p:.2f}", BOX_LABEL_SCALE, BOX_LABEL_THICKNESS, LABEL_TEXT_COLOR)
+            label_width = name.advance + score.advance
+            label_height = -name.dy
+            # 标签放在框上方，贴近画面顶部时放到框内
+            top = y1 - label_height - 4 if y1 - label_height - 4 >= 0 else y1
+            bottom = top + label_height + 4
+            cv2.rectangle(image, (x1, top), (min(x1 + label_width + 4, width - 1), min(bottom, height - 1)), color, -1)
+            baseline_y = bottom - 3
+            x = x1 + 2
+            self._blit(image, name, x, baseline_y)
+            self._blit(image, score, x + name.advance, baseline_y)
+        return image
+
+    def draw_stats(self, image, values, fatigue_level):
+        """
+        绘制左上角统计信息与疲劳等级横幅
+        :param values: 与 STATS_LABELS 对应的数值文字，前两项（帧号、时间）每帧变化不缓存
+        :param fatigue_level: 疲劳等级
+        """
+        for index, (label, value, y) in enumerate(zip(STATS_LABELS, values, STATS_LINE_Y)):
+            x = self.draw_text(image, label, (STATS_ORIGIN_X, y), STATS_SCALE, STATS_COLOR, STATS_THICKNESS)
+            self.draw_text(image, value, (x, y), STATS_SCALE, STATS_COLOR, STATS_THICKNESS, cache=index >= 2)
+
+        text, color = FATIGUE_BANNERS.get(fatigue_level, (fatigue_level, (255, 255, 255)))
+        self.draw_text(image, text, (STATS_ORIGIN_X, BANNER_Y), BANNER_SCALE, color, STATS_THICKNESS)
+        return image
+
+    def render(self, image, result, values, fatigue_level):
+        """在帧缓冲上绘制一帧的检测框与统计信息"""
+        cls, conf = result_arrays(result)
+        self.draw_boxes(image, result_xyxy(result), cls, conf, result.names)
+        return self.draw_stats(image, values, fatigue_level)
+
+
+# 全局绘制器，文字位图缓存在各会话间共享；类别名随每次绘制的检测结果传入
+overlay_renderer = OverlayRenderer()
+
+
+class OverlaySidecar:
+    def __init__(self, source_url, fps, width, height, names=None):
+        """
+        叠加层旁路文件：保存逐帧检测框与疲劳等级，由前端播放原视频时在画布上绘制，不再重新编码标注视频
+        检测框按 [x1, y1, x2, y2, 类别, 置信度百分比] 展平为整数；只记录有检测框的帧和疲劳等级变化点
+        :param source_url: 原视频地址
+        :param fps: 视频帧率
+        :param width: 视频宽度
+        :param height: 视频高度
+        """
+        self.source_url = source_url
+        self.fps = fps
+        self.width = width
+        self.height = height
+        self.names = dict(names or CLASS_NAMES)
+        self.levels = list(FATIGUE_BANNERS)
+        self.frames = []        # [起始帧, 覆盖帧数, 展平的检测框]
+        self.level_changes = []  # [起始帧, 疲劳等级序号]
+        self.total_frames = 0
+
+    def add_frame(self, index, span, fatigue_level, xyxy, cls, conf):
+        """
+        记录一个采样帧
+        :param index: 起始帧号
+        :param span: 该采样帧覆盖的源帧数（自适应采样时大于1）
+        """
+        level = self.levels.index(fatigue_level) if fatigue_level in self.levels else -1
+        if not self.level_changes or self.level_changes[-1][1] != level:
+            self.level_changes.append([index, level])
+        if len(cls):
+            boxes = np.column_stack([np.rint(xyxy), cls, np.rint(conf * 100)]).astype(int)
+            self.frames.append([index, span, boxes.ravel().tolist()])
+        self.total_frames = index + span
+
+    def to_dict(self):
+        return {
+            'version': 1,
+            'source': self.source_url,
+            'fps': self.fps,
+            'width': self.width,
+            'height': self.height,
+            'total_frames': self.total_frames,
+            'names': {str(k): v for k, v in self.names.items()},
+            'levels': self.levels,
+            'level_changes': self.level_changes,
+            'frames': self.frames
+        }
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        return path
@@ -0,0 +1,110 @@
+import numpy as np
+
+# 标签映射：0=闭眼，1=闭嘴，2=睁眼，3=张嘴
+CLASS_NAMES = {0: 'closed_eyes', 1: 'closed_mouth', 2: 'open_eyes', 3: 'open_mouth'}
+NUM_CLASSES = len(CLASS_NAMES)
+CLOSED_EYES, CLOSED_MOUTH, OPEN_EYES, OPEN_MOUTH = 0, 1, 2, 3
+# 疲劳指标类别：闭眼和张嘴
+FATIGUE_CLASSES = (CLOSED_EYES, OPEN_MOUTH)
+# 统计使用的置信度阈值
+CONF_THRESHOLD = 0.5
+
+
+def _to_numpy(values):
+    if hasattr(values, 'cpu'):
+        values = values.cpu().numpy()
+    return np.asarray(values).reshape(-1)
+
+
+def result_arrays(result):
+    """
+    一次性取出单帧检测结果的类别与置信度
+    :return: (cls int64 数组, conf float32 数组)
+    """
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    return _to_numpy(boxes.cls).astype(np.int64), _to_numpy(boxes.conf).astype(np.float32)
+
+
+def result_xyxy(result):
+    """取出单帧检测框 (N, 4) xyxy"""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return np.zeros((0, 4), dtype=np.float32)
+    xyxy = boxes.xyxy
+    if hasattr(xyxy, 'cpu'):
+        xyxy = xyxy.cpu().numpy()
+    return np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+
+
+def batch_arrays(results):
+    """
+    把一批检测结果拼成扁平数组
+    :return: (帧序号, cls, conf)
+    """
+    arrays = [result_arrays(result) for result in results]
+    if not arrays:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    frame_index = np.repeat(np.arange(len(arrays)), [len(cls) for cls, _ in arrays])
+    cls = np.concatenate([cls for cls, _ in arrays])
+    conf = np.concatenate([conf for _, conf in arrays])
+    return frame_index, cls, conf
+
+
+def count_batch(results, threshold=CONF_THRESHOLD):
+    """
+    统计一批结果中每帧置信度大于阈值的各类别数量
+    :return: (各帧类别计数 (帧数, NUM_CLASSES), 各帧超过阈值的检测总数 (帧数,))
+    """
+    frame_index, cls, conf = batch_arrays(results)
+    keep = conf > threshold
+    frame_index, cls = frame_index[keep], cls[keep]
+    totals = np.bincount(frame_index, minlength=len(results))
+
+    # 未知类别只计入总数，不参与分类计数
+    known = (cls >= 0) & (cls < NUM_CLASSES)
+    flat = np.bincount(frame_index[known] * NUM_CLASSES + cls[known], minlength=len(results) * NUM_CLASSES)
+    return flat.reshape(len(results), NUM_CLASSES), totals
+
+
+def count_arrays(cls, conf, threshold=CONF_THRESHOLD):
+    """统计置信度大于阈值的各类别数量，返回长度为 NUM_CLASSES 的数组"""
+    cls = cls[(conf > threshold) & (cls >= 0) & (cls < NUM_CLASSES)]
+    return np.bincount(cls, minlength=NUM_CLASSES)
+
+
+def count_classes(results, threshold=CONF_THRESHOLD):
+    """统计一批结果中置信度大于阈值的各类别数量之和"""
+    _, cls, conf = batch_arrays(results)
+    return count_arrays(cls, conf, threshold)
+
+
+def class_name(cls):
+    return CLASS_NAMES.get(cls, f'class_{cls}')
+
+
+def build_detections(cls, conf, threshold=None):
+    """
+    批量构造检测列表
+    :param threshold: 置信度阈值，None 表示不过滤
+    :return: [{'class': 类别名, 'confidence': 置信度, 'class_id': 类别}]
+    """
+    if threshold is not None:
+        keep = conf > threshold
+        cls, conf = cls[keep], conf[keep]
+    return [
+        {'class': class_name(c), 'confidence': p, 'class_id': c}
+        for c, p in zip(cls.tolist(), conf.tolist())
+    ]
+
+
+def build_fatigue_indicators(cls, conf, threshold=None):
+    """批量构造疲劳指标列表（闭眼、张嘴）：[{'type': 类别名, 'confidence': 置信度}]"""
+    keep = np.isin(cls, FATIGUE_CLASSES)
+    if threshold is not None:
+        keep &= conf > threshold
+    return [
+        {'type': CLASS_NAMES[c], 'confidence': p}
+        for c, p in zip(cls[keep].tolist(), conf[keep].tolist())
+    ]
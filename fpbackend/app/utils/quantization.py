@@ -0,0 +1,235 @@
+import os
+import json
+import random
+import time
+import cv2
+import numpy as np
+from app.utils.onnx_backend import export_onnx, onnx_cache_path, preprocess_batch, OnnxYOLO
+
+# 标定帧来源目录（历史上传的图片和视频）
+CALIBRATION_SOURCE_DIR = os.path.join('static', 'uploads')
+# 默认标定帧数量与每个视频最多抽取的帧数
+CALIBRATION_MAX_FRAMES = int(os.getenv('CALIBRATION_MAX_FRAMES', 200))
+CALIBRATION_FRAMES_PER_VIDEO = int(os.getenv('CALIBRATION_FRAMES_PER_VIDEO', 10))
+
+IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.bmp'}
+VIDEO_EXTS = {'.mp4', '.avi', '.mov', '.mkv'}
+
+# 疲劳检测的四个类别：0=闭眼，1=闭嘴，2=睁眼，3=张嘴
+FATIGUE_CLASSES = {0: 'closed_eyes', 1: 'closed_mouth', 2: 'open_eyes', 3: 'open_mouth'}
+
+
+def sample_calibration_frames(source_dir=CALIBRATION_SOURCE_DIR, max_frames=CALIBRATION_MAX_FRAMES,
+                              frames_per_video=CALIBRATION_FRAMES_PER_VIDEO, seed=0):
+    """
+    从历史上传中抽取标定帧：图片直接读取，视频按时长均匀抽帧
+    检测结果目录 results 下是已绘制的输出，不参与标定
+    :return: BGR 图像列表
+    """
+    if not os.path.isdir(source_dir):
+        return []
+
+    files = sorted(
+        os.path.join(source_dir, name) for name in os.listdir(source_dir)
+        if os.path.isfile(os.path.join(source_dir, name))
+        and os.path.splitext(name)[1].lower() in IMAGE_EXTS | VIDEO_EXTS
+    )
+    random.Random(seed).shuffle(files)
+
+    frames = []
+    for path in files:
+        if len(frames) >= max_frames:
+            break
+        ext = os.path.splitext(path)[1].lower()
+        if ext in IMAGE_EXTS:
+            image = cv2.imread(path)
+            if image is not None:
+                frames.append(image)
+            continue
+
+        cap = cv2.VideoCapture(path)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if total > 0:
+            count = min(frames_per_video, total, max_frames - len(frames))
+            for index in np.linspace(0, total - 1, count).astype(int):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+                ret, frame = cap.read()
+                if ret:
+                    frames.append(frame)
+        cap.release()
+
+    return frames
+
+
+class _CalibrationReader:
+    """onnxruntime.quantization 的标定数据读取器，每次提供一帧"""
+
+    def __init__(self, input_name, frames, imgsz):
+        self.input_name = input_name
+        self.frames = iter(frames)
+        self.shape = (imgsz, imgsz)
+
+    def get_next(self):
+        frame = next(self.frames, None)
+        if frame is None:
+            return None
+        return {self.input_name: preprocess_batch([frame], self.shape)}
+
+
+def _box_iou(a, b):
+    """两组 xyxy 框的 IoU 矩阵"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def _match_count(reference, candidate, iou_threshold):
+    """按 IoU 贪心匹配，返回匹配上的框数"""
+    iou = _box_iou(reference, candidate)
+    matched = 0
+    while iou.size and iou.max() >= iou_threshold:
+        i, j = np.unravel_index(iou.argmax(), iou.shape)
+        matched += 1
+        iou[i, :] = -1
+        iou[:, j] = -1
+    return matched
+
+
+def _time_inference(model, frames, conf, imgsz):
+    """逐帧推理，返回 (每帧检测结果, 每帧耗时毫秒)"""
+    detections, latencies = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        result = model.predict(frame, conf=conf, imgsz=imgsz)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        boxes = result.boxes
+        detections.append((
+            boxes.xyxy.cpu().numpy(),
+            boxes.cls.cpu().numpy().astype(int),
+            boxes.conf.cpu().numpy()
+        ))
+    return detections, latencies
+
+
+def evaluate_int8(fp32_model, int8_model, frames, conf=0.5, imgsz=640, iou_threshold=0.5):
+    """
+    以 FP32 模型输出为参照评估 INT8 模型
+    四个疲劳类别分别统计检测数量变化、与 FP32 的匹配精确率/召回率及平均置信度变化，并对比单帧延迟
+    """
+    fp32_dets, fp32_latency = _time_inference(fp32_model, frames, conf, imgsz)
+    int8_dets, int8_latency = _time_inference(int8_model, frames, conf, imgsz)
+
+    classes = {}
+    for cls, name in FATIGUE_CLASSES.items():
+        ref_total = cand_total = matched = 0
+        ref_conf, cand_conf = [], []
+        for (ref_boxes, ref_cls, ref_scores), (cand_boxes, cand_cls, cand_scores) in zip(fp32_dets, int8_dets):
+            ref_mask = ref_cls == cls
+            cand_mask = cand_cls == cls
+            ref_total += int(ref_mask.sum())
+            cand_total += int(cand_mask.sum())
+            ref_conf.extend(ref_scores[ref_mask].tolist())
+            cand_conf.extend(cand_scores[cand_mask].tolist())
+            matched += _match_count(ref_boxes[ref_mask], cand_boxes[cand_mask], iou_threshold)
+
+        precision = matched / cand_total if cand_total else 1.0
+        recall = matched / ref_total if ref_total else 1.0
+        classes[name] = {
+            'fp32_count': ref_total,
+            'int8_count': cand_total,
+            'count_delta': cand_total - ref_total,
+            'precision_vs_fp32': round(precision, 4),
+            'recall_vs_fp32': round(recall, 4),
+            'f1_vs_fp32': round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+            'mean_conf_delta': round(float(np.mean(cand_conf) - np.mean(ref_conf)), 4) if ref_conf and cand_conf else 0.0
+        }
+
+    fp32_ms = float(np.median(fp32_latency)) if fp32_latency else 0.0
+    int8_ms = float(np.median(int8_latency)) if int8_latency else 0.0
+    return {
+        'eval_frames': len(frames),
+        'classes': classes,
+        'mean_f1_vs_fp32': round(float(np.mean([c['f1_vs_fp32'] for c in classes.values()])), 4),
+        'latency': {
+            'fp32_median_ms': round(fp32_ms, 2),
+            'int8_median_ms': round(int8_ms, 2),
+            'speedup': round(fp32_ms / int8_ms, 3) if int8_ms else 0.0
+        }
+    }
+
+
+def int8_model_path(pt_path, content_hash):
+    """INT8 模型路径"""
+    return onnx_cache_path(pt_path, content_hash, '_int8')
+
+
+def int8_report_path(pt_path, content_hash):
+    """INT8 评估报告路径"""
+    return os.path.splitext(int8_model_path(pt_path, content_hash))[0] + '.json'
+
+
+def quantize_int8(pt_path, content_hash, frames=None, eval_ratio=0.2, imgsz=640, seed=0):
+    """
+    INT8 训练后量化
+    先导出 FP32 ONNX，用标定帧做静态量化（QDQ，逐通道权重），再用留出帧评估精度变化和延迟收益
+    :param pt_path: .pt 模型路径
+    :param content_hash: 模型文件内容哈希
+    :param frames: 标定帧，为空时从 static/uploads 抽取
+    :param eval_ratio: 留作评估、不参与标定的帧比例
+    :return: 评估报告
+    """
+    from onnxruntime.quantization import quantize_static, CalibrationMethod, QuantFormat, QuantType
+
+    if frames is None:
+        frames = sample_calibration_frames(seed=seed)
+    if len(frames) < 2:
+        raise ValueError("标定帧不足，请先上传图片或视频")
+
+    frames = list(frames)
+    random.Random(seed).shuffle(frames)
+    eval_count = max(1, int(len(frames) * eval_ratio))
+    eval_frames, calib_frames = frames[:eval_count], frames[eval_count:]
+
+    fp32_path = export_onnx(pt_path, content_hash, imgsz=imgsz)
+    int8_path = int8_model_path(pt_path, content_hash)
+    fp32_model = OnnxYOLO(fp32_path)
+
+    print(f"[DEBUG] INT8量化: {fp32_path} -> {int8_path}, 标定帧: {len(calib_frames)}, 评估帧: {len(eval_frames)}")
+    tmp_path = int8_path + '.tmp'
+    quantize_static(
+        fp32_path,
+        tmp_path,
+        _CalibrationReader(fp32_model.input_name, calib_frames, imgsz),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax
+    )
+    os.replace(tmp_path, int8_path)
+
+    report = evaluate_int8(fp32_model, OnnxYOLO(int8_path), eval_frames, imgsz=imgsz)
+    report.update({
+        'model': os.path.basename(pt_path),
+        'content_hash': content_hash,
+        'int8_path': int8_path,
+        'calibration_frames': len(calib_frames),
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S')
+    })
+    with open(int8_report_path(pt_path, content_hash), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def load_int8_report(pt_path, content_hash):
+    """读取已保存的 INT8 评估报告，不存在时返回 None"""
+    path = int8_report_path(pt_path, content_hash)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 是否启用检测结果缓存
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', '1').strip().lower() in ('1', 'true', 'yes')
+# 缓存的结果文件总大小上限（MB）与条目数上限，超出后按最近最少使用淘汰并删除结果文件
+RESULT_CACHE_MAX_MB = float(os.getenv('RESULT_CACHE_MAX_MB', 2048))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 512))
+# 相同请求正在处理时，后到的请求最多等待的时间（秒），超时后自行处理
+RESULT_CACHE_WAIT_TIMEOUT = float(os.getenv('RESULT_CACHE_WAIT_TIMEOUT', 600))
+# 结果目录、缓存索引文件与响应目录
+RESULT_CACHE_DIR = os.path.join('static', 'uploads', 'results')
+RESULT_CACHE_INDEX = '.result_cache.json'
+RESULT_CACHE_RESPONSES = '.responses'
+
+
+def make_cache_key(content_hash, model_hash, params):
+    """
+    生成缓存键
+    :param content_hash: 上传文件内容的 sha256
+    :param model_hash: 模型文件内容的 sha256
+    :param params: 影响检测结果或输出文件的参数（推理后端、输出模式、采样等）
+    """
+    payload = json.dumps({'content': content_hash, 'model': model_hash, 'params': params},
+                         sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class _InFlight:
+    """正在处理中的请求：owner 为会话或任务ID，其他相同请求等待 event"""
+    __slots__ = ('owner', 'is_job', 'event', 'response')
+
+    def __init__(self, owner, is_job):
+        self.owner = owner
+        self.is_job = is_job
+        self.event = threading.Event()
+        self.response = None
+
+
+class ResultCache:
+    def __init__(self, cache_dir=RESULT_CACHE_DIR, max_mb=RESULT_CACHE_MAX_MB, max_entries=RESULT_CACHE_MAX_ENTRIES):
+        """
+        按内容寻址的检测结果缓存
+        以 (上传内容哈希, 模型哈希, 推理参数) 为键保存接口响应及其结果文件；
+        相同请求并发到达时只由第一个请求处理，其余等待其结果。
+        条目只登记结果目录内的文件，淘汰时一并删除，文件被外部删除的条目在查询时失效；
+        每个响应单独保存为以缓存键命名的文件，索引只记录文件、大小等元数据，
+        在锁外写入，服务重启后继续有效
+        :param cache_dir: 结果目录
+        :param max_mb: 结果文件总大小上限（MB）
+        :param max_entries: 条目数上限
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()   # 缓存键 -> {'files', 'size', 'created_at', 'hits'}
+        self._inflight = {}             # 缓存键 -> _InFlight
+        self._owners = {}               # 会话/任务ID -> 缓存键
+        self._total_bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def index_path(self):
+        return os.path.join(self.cache_dir, RESULT_CACHE_INDEX)
+
+    def _response_path(self, key):
+        return os.path.join(self.cache_dir, RESULT_CACHE_RESPONSES, key + '.json')
+
+    def _write_response(self, key, response):
+        path = self._response_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(response, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read_response(self, key):
+        try:
+            with open(self._response_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _remove_response(self, key):
+        try:
+            os.remove(self._response_path(key))
+        except OSError:
+            pass
+
+    def _load(self):
+        """首次使用时读取结果目录中的索引"""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, entry in entries:
+            if not os.path.isfile(self._response_path(key)) or \
+                    not all(os.path.isfile(path) for path in entry['files']):
+                continue
+            self._entries[key] = entry
+            self._total_bytes += entry['size']
+
+    def _save(self):
+        """
+        写入索引：锁内只复制元数据，文件写入在锁外进行；
+        写入之间由 _save_lock 串行，后写入的总是较新的快照
+        """
+        with self._save_lock:
+            with self._lock:
+                entries = [(key, dict(entry)) for key, entry in self._entries.items()]
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = self.index_path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f, ensure_ascii=False)
+                os.replace(tmp_path, self.index_path)
+            except OSError as e:
+                print(f"[ERROR] 保存结果缓存索引失败: {e}")
+
+    def get(self, key):
+        """查询缓存，命中时返回保存的响应；结果文件已不存在的条目直接失效"""
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            valid = all(os.path.isfile(path) for path in entry['files'])
+        response = self._read_response(key) if valid else None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if response is None:
+                self._drop(key, delete_files=False)
+                self._remove_response(key)
+            else:
+                self._entries.move_to_end(key)
+                entry['hits'] = entry.get('hits', 0) + 1
+                self.hits += 1
+        if response is None:
+            self._save()
+        return response
+
+    def acquire(self, key, owner, is_job=False):
+        """
+        登记正在处理的请求
+        :param owner: 会话ID或任务ID
+        :param is_job: 是否为异步任务
+        :return: None 表示由调用方处理；否则返回已在处理的请求信息 {'owner', 'is_job'}
+        """
+        with self._lock:
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                self.coalesced += 1
+                return {'owner': inflight.owner, 'is_job': inflight.is_job}
+            self._inflight[key] = _InFlight(owner, is_job)
+            self._owners[owner] = key
+            self.misses += 1
+            return None
+
+    def wait(self, key, timeout=RESULT_CACHE_WAIT_TIMEOUT):
+        """等待相同请求处理完成，返回其响应；失败或超时返回 None"""
+        with self._lock:
+            inflight = self._inflight.get(key)
+        if inflight is None:
+            return self.get(key)
+        if not inflight.event.wait(timeout):
+            return None
+        return dict(inflight.response) if inflight.response else None
+
+    def complete(self, owner, response, files):
+        """
+        处理成功：保存响应并唤醒等待的请求
+        :param files: 响应引用的结果文件，只登记结果目录内的文件
+        """
+        cache_dir = os.path.realpath(self.cache_dir)
+        files = [path for path in files if path and os.path.isfile(path)
+                 and os.path.realpath(path).startswith(cache_dir + os.sep)]
+        size = sum(os.path.getsize(path) for path in files)
+        with self._lock:
+            self._load()
+            key = self._owners.get(owner)
+        if key is None:
+            return
+        try:
+            self._write_response(key, response)
+            saved = True
+        except (OSError, TypeError, ValueError) as e:
+            print(f"[ERROR] 保存检测结果缓存失败: {e}")
+            saved = False
+        with self._lock:
+            self._owners.pop(owner, None)
+            inflight = self._inflight.pop(key, None)
+            if saved:
+                if key in self._entries:
+                    self._drop(key, delete_files=False)
+                self._entries[key] = {'files': files, 'size': size, 'created_at': time.time(), 'hits': 0}
+                self._total_bytes += size
+                self._evict(keep=key)
+        if saved:
+            self._save()
+        if inflight is not None:
+            inflight.response = response
+            inflight.event.set()
+
+    def abandon(self, owner):
+        """处理失败或取消：撤销登记，等待的请求各自重新处理"""
+        with self._lock:
+            key = self._owners.pop(owner, None)
+            inflight = self._inflight.pop(key, None) if key is not None else None
+        if inflight is not None:
+            inflight.event.set()
+
+    def _drop(self, key, delete_files=True):
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry['size']
+        if delete_files:
+            self._remove_response(key)
+            for path in entry['files']:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _evict(self, keep=None):
+        """超出大小或条目数上限时按最近最少使用淘汰，并删除结果文件"""
+        while len(self._entries) > 1 and (self._total_bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            print(f"[DEBUG] 淘汰检测结果缓存: {key[:12]}")
+            self._drop(key)
+
+    def clear(self):
+        """清空缓存并删除结果文件"""
+        with self._lock:
+            self._load()
+            for key in list(self._entries):
+                self._drop(key)
+        self._save()
+
+    def get_stats(self):
+        with self._lock:
+            self._load()
+            return {
+                'enabled': RESULT_CACHE_ENABLED,
+                'entries': len(self._entries),
+                'total_mb': round(self._total_bytes / 1024 / 1024, 2),
+                'max_mb': round(self.max_bytes / 1024 / 1024, 2),
+                'max_entries': self.max_entries,
+                'in_flight': len(self._inflight),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced
+            }
+
+
+# 全局检测结果缓存
+result_cache = ResultCache()
@@ -0,0 +1,158 @@
+import os
+import threading
+import numpy as np
+
+# 每隔多少帧强制做一次整帧检测，重新定位人脸区域
+ROI_FULL_FRAME_INTERVAL = int(os.getenv('ROI_FULL_FRAME_INTERVAL', 30))
+# 裁剪区域相对检测框外扩比例（按框宽高计算，每侧）
+ROI_EXPAND_RATIO = float(os.getenv('ROI_EXPAND_RATIO', 0.6))
+# 裁剪区域推理尺寸
+ROI_IMGSZ = int(os.getenv('ROI_IMGSZ', 320))
+# 裁剪区域最小边长（像素），避免区域过小丢失目标
+ROI_MIN_SIZE = int(os.getenv('ROI_MIN_SIZE', 160))
+# 裁剪推理的最高置信度低于该值，或相对上次整帧检测下降超过 ROI_CONF_DROP 时回退整帧
+ROI_MIN_CONF = float(os.getenv('ROI_MIN_CONF', 0.5))
+ROI_CONF_DROP = float(os.getenv('ROI_CONF_DROP', 0.2))
+# 区域面积超过整帧该比例时裁剪没有收益，直接整帧检测
+ROI_MAX_AREA_RATIO = 0.6
+
+
+def _boxes_array(result):
+    """取出检测框数据 (N, 6): x1, y1, x2, y2, conf, cls"""
+    if result.boxes is None or len(result.boxes) == 0:
+        return np.zeros((0, 6), dtype=np.float32)
+    data = result.boxes.data
+    data = data.cpu().numpy() if hasattr(data, 'cpu') else np.asarray(data)
+    return data.reshape(-1, 6)
+
+
+def _max_conf(result):
+    data = _boxes_array(result)
+    return float(data[:, 4].max()) if len(data) else 0.0
+
+
+class RoiTracker:
+    def __init__(self, full_interval=ROI_FULL_FRAME_INTERVAL, expand_ratio=ROI_EXPAND_RATIO, imgsz=ROI_IMGSZ,
+                 min_size=ROI_MIN_SIZE, min_conf=ROI_MIN_CONF, conf_drop=ROI_CONF_DROP):
+        """
+        人脸区域跟踪推理
+        眼睛和嘴巴只占画面中很小且几乎不动的区域：整帧检测定位后，后续帧只在外扩的区域内以较小尺寸推理，
+        检测框再平移回整帧坐标。每隔 full_interval 帧，或裁剪推理置信度明显下降时，重新做整帧检测
+        :param full_interval: 整帧检测间隔（帧）
+        :param expand_ratio: 区域外扩比例
+        :param imgsz: 裁剪区域推理尺寸
+        :param min_size: 区域最小边长
+        :param min_conf: 裁剪推理的最低可信置信度
+        :param conf_drop: 相对整帧检测置信度允许的下降幅度
+        """
+        self.full_interval = max(1, int(full_interval))
+        self.expand_ratio = expand_ratio
+        self.imgsz = imgsz
+        self.min_size = min_size
+        self.min_conf = min_conf
+        self.conf_drop = conf_drop
+
+        self._roi = None                # 当前跟踪区域 (x1, y1, x2, y2)
+        self._ref_conf = 0.0            # 最近一次整帧检测的最高置信度
+        self._frames_since_full = 0
+        self._lock = threading.Lock()
+
+        self.full_frames = 0
+        self.roi_frames = 0
+        self.fallback_frames = 0
+
+    def predict(self, server, frames, **kwargs):
+        """
+        对一批帧推理，返回整帧坐标下的 Results 列表
+        同一批帧共用进入该批时的跟踪区域，以便仍能合并推理
+        :param server: 推理服务（InferenceServer）
+        :param frames: BGR 帧列表
+        :param kwargs: 整帧检测的推理参数，裁剪推理时仅替换 imgsz
+        """
+        with self._lock:
+            roi = self._roi if self._frames_since_full < self.full_interval else None
+
+        if roi is None:
+            results = server.predict(frames, **kwargs)
+            with self._lock:
+                self.full_frames += len(frames)
+                self._frames_since_full = 0
+                self._relocate(results[-1], frames[-1].shape)
+            return results
+
+        x1, y1, x2, y2 = roi
+        crops = [np.ascontiguousarray(frame[y1:y2, x1:x2]) for frame in frames]
+        crop_results = server.predict(crops, **dict(kwargs, imgsz=self.imgsz))
+
+        results, lost = [], []
+        for index, (frame, result) in enumerate(zip(frames, crop_results)):
+            if self._is_lost(result):
+                lost.append(index)
+                results.append(None)
+            else:
+                results.append(self._to_full_frame(result, frame, x1, y1))
+
+        # 目标丢失或置信度下降的帧立即回退整帧检测，不漏检
+        if lost:
+            full_results = server.predict([frames[i] for i in lost], **kwargs)
+            for index, result in zip(lost, full_results):
+                results[index] = result
+
+        with self._lock:
+            self.roi_frames += len(frames) - len(lost)
+            self.fallback_frames += len(lost)
+            if lost:
+                self._frames_since_full = 0
+                self._relocate(results[lost[-1]], frames[lost[-1]].shape)
+            else:
+                self._frames_since_full += len(frames)
+        return results
+
+    def _is_lost(self, result):
+        score = _max_conf(result)
+        return score < self.min_conf or score < self._ref_conf - self.conf_drop
+
+    def _relocate(self, result, frame_shape):
+        """根据整帧检测结果更新跟踪区域，没有检测到目标时下一批继续整帧检测"""
+        data = _boxes_array(result)
+        data = data[data[:, 4] >= self.min_conf]
+        if len(data) == 0:
+            self._roi = None
+            self._ref_conf = 0.0
+            return
+
+        height, width = frame_shape[:2]
+        x1, y1 = data[:, 0].min(), data[:, 1].min()
+        x2, y2 = data[:, 2].max(), data[:, 3].max()
+        pad_x = max((x2 - x1) * self.expand_ratio, (self.min_size - (x2 - x1)) / 2, 0)
+        pad_y = max((y2 - y1) * self.expand_ratio, (self.min_size - (y2 - y1)) / 2, 0)
+        roi = (
+            int(max(0, x1 - pad_x)), int(max(0, y1 - pad_y)),
+            int(min(width, x2 + pad_x)), int(min(height, y2 + pad_y))
+        )
+
+        area = (roi[2] - roi[0]) * (roi[3] - roi[1])
+        self._roi = roi if area < width * height * ROI_MAX_AREA_RATIO else None
+        self._ref_conf = float(data[:, 4].max())
+
+    @staticmethod
+    def _to_full_frame(result, frame, offset_x, offset_y):
+        """把裁剪区域内的检测框平移回整帧坐标，并以整帧构造 Results 供绘制"""
+        from ultralytics.engine.results import Results
+
+        data = result.boxes.data
+        data = data.clone() if hasattr(data, 'clone') else data.copy()
+        data[:, [0, 2]] += offset_x
+        data[:, [1, 3]] += offset_y
+        return Results(frame, path=result.path, names=result.names, boxes=data)
+
+    def get_stats(self):
+        with self._lock:
+            total = self.full_frames + self.roi_frames + self.fallback_frames
+            return {
+                'full_frames': self.full_frames,
+                'roi_frames': self.roi_frames,
+                'fallback_frames': self.fallback_frames,
+                'roi_ratio': round(self.roi_frames / total, 3) if total else 0.0,
+                'current_roi': list(self._roi) if self._roi else None
+            }
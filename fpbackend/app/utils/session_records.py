@@ -0,0 +1,124 @@
+class SessionRecord:
+    """
+    会话计数记录的基类
+    字段固定，使用 __slots__ 存储，单条记录比同样内容的 dict 小得多；
+    保留 dict 的读写方式（record['key']、get、keys、dict(record)），原有代码无需改动。
+    值为 None 的字段视为未设置：不出现在 keys() 中，get 返回默认值
+    """
+    __slots__ = ()
+    # 字段及默认值，由子类定义
+    DEFAULTS = {}
+
+    def __init__(self, **values):
+        for field, default in self.DEFAULTS.items():
+            setattr(self, field, values.pop(field, default))
+        if values:
+            raise TypeError(f"{type(self).__name__} 不支持的字段: {sorted(values)}")
+
+    @classmethod
+    def from_dict(cls, data, **overrides):
+        """由 dict 构造记录，忽略不属于该记录的键"""
+        values = {key: value for key, value in data.items() if key in cls.DEFAULTS}
+        values.update(overrides)
+        return cls(**values)
+
+    def __getitem__(self, key):
+        value = getattr(self, key) if key in self.DEFAULTS else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self.DEFAULTS:
+            raise KeyError(f"{type(self).__name__} 不支持的字段: {key}")
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.DEFAULTS and getattr(self, key) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, key, default=None):
+        value = getattr(self, key) if key in self.DEFAULTS else None
+        return default if value is None else value
+
+    def keys(self):
+        return [field for field in self.DEFAULTS if getattr(self, field) is not None]
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in self.keys()]
+
+    def update(self, values=(), **kwargs):
+        for key, value in dict(values, **kwargs).items():
+            self[key] = value
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()})"
+
+
+class CameraSessionStats(SessionRecord):
+    """摄像头会话累计统计"""
+    DEFAULTS = {
+        'closed_eyes_count': 0,
+        'open_mouth_count': 0,
+        'open_eyes_count': 0,
+        'closed_mouth_count': 0,
+        'total_detections': 0,
+        'start_time': None,
+        'last_update': None,
+        'detection_active': None
+    }
+    __slots__ = tuple(DEFAULTS)
+
+
+class VideoSessionStats(SessionRecord):
+    """视频会话累计统计，以及处理完成后附带的时间线与各类运行统计"""
+    DEFAULTS = {
+        'closed_eyes_count': 0,
+        'open_mouth_count': 0,
+        'open_eyes_count': 0,
+        'closed_mouth_count': 0,
+        'total_detections': 0,
+        'total_frames': 0,
+        'frames_with_detections': 0,
+        'detection_active': False,
+        'video_total_frames': None,
+        'started_at': None,
+        'finished_at': None,
+        'timeline': None,
+        'pipeline_stats': None,
+        'segment_stats': None,
+        'video_io': None,
+        'sampling_stats': None,
+        'roi_stats': None
+    }
+    __slots__ = tuple(DEFAULTS)
+
+
+class RealtimeSessionData(SessionRecord):
+    """摄像头会话的实时检测数据：滑动窗口计数与最近更新时间"""
+    DEFAULTS = {
+        'window': None,
+        'last_update': 0.0,
+        'last_fatigue_check': 0.0,
+        'current_fatigue_level': 'low',
+        'detection_active': False
+    }
+    __slots__ = tuple(DEFAULTS)
+
+
+class FatigueCounter(SessionRecord):
+    """YOLODetector 的会话疲劳判断状态"""
+    DEFAULTS = {
+        'window': None,
+        'last_check': 0.0,
+        'fatigue_level': 'low'
+    }
+    __slots__ = tuple(DEFAULTS)
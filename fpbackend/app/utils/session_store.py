@@ -0,0 +1,252 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+# 会话数据的空闲过期时间（秒），超过该时间未被访问的会话被清理
+SESSION_TTL = float(os.getenv('SESSION_TTL', 6 * 3600))
+# 单个存储的会话数上限，超出后清理最久未访问的会话
+SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', 1000))
+# 会话计数锁的分段数
+SESSION_LOCK_STRIPES = int(os.getenv('SESSION_LOCK_STRIPES', 64))
+
+
+class SessionStore(MutableMapping):
+    def __init__(self, name, ttl=SESSION_TTL, max_entries=SESSION_MAX_ENTRIES, default_factory=None,
+                 keep_alive=None):
+        """
+        带过期清理的会话数据存储，用法与 dict（提供 default_factory 时与 defaultdict）一致
+        按最近访问排序，读写都会刷新访问时间；写入时顺带清理空闲超过 ttl 的会话，
+        会话数超过 max_entries 时清理最久未访问的会话，长期运行内存保持稳定
+        :param name: 存储名称，用于日志与统计
+        :param ttl: 空闲过期时间（秒），0 表示不按时间过期
+        :param max_entries: 会话数上限
+        :param default_factory: 访问不存在的会话时用于创建默认值
+        :param keep_alive: keep_alive(value) 为真的会话（如仍在检测中）不会因空闲过期，只在超出上限时清理
+        """
+        self.name = name
+        self.ttl = float(ttl)
+        self.max_entries = max(1, int(max_entries))
+        self.default_factory = default_factory
+        self.keep_alive = keep_alive
+        self._data = OrderedDict()
+        self._access = {}
+        self._lock = threading.RLock()
+        self.expired = 0
+        self.evicted = 0
+        session_registry.register(self)
+
+    def _touch(self, key, now=None):
+        self._data.move_to_end(key)
+        self._access[key] = time.time() if now is None else now
+
+    def __getitem__(self, key):
+        with self._lock:
+            if key not in self._data:
+                if self.default_factory is None:
+                    raise KeyError(key)
+                self[key] = self.default_factory()
+            self._touch(key)
+            return self._data[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            now = time.time()
+            self._data[key] = value
+            self._touch(key, now)
+            self._cleanup(now)
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
+            del self._access[key]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._data))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def items(self):
+        """会话快照，不刷新访问时间"""
+        with self._lock:
+            return list(self._data.items())
+
+    def values(self):
+        with self._lock:
+            return list(self._data.values())
+
+    def _cleanup(self, now):
+        """清理空闲过期的会话（位于队首），再按上限清理最久未访问的会话"""
+        if self.ttl > 0:
+            checked = 0
+            while self._data and checked < len(self._data):
+                key = next(iter(self._data))
+                if now - self._access[key] < self.ttl:
+                    break
+                checked += 1
+                value = self._data[key]
+                if self.keep_alive is not None and self.keep_alive(value):
+                    # 仍在使用的会话视为刚被访问
+                    self._touch(key, now)
+                    continue
+                self._remove(key, 'expired')
+                self.expired += 1
+        while len(self._data) > self.max_entries:
+            self._remove(next(iter(self._data)), 'evicted')
+            self.evicted += 1
+
+    def _remove(self, key, reason):
+        value = self._data.pop(key)
+        del self._access[key]
+        print(f"[DEBUG] 清理会话数据 {self.name}: {key} ({reason})")
+        session_registry.notify(key, value, reason, self.name)
+
+    def end(self, key):
+        """结束会话：删除数据并触发会话结束回调，返回被删除的值"""
+        with self._lock:
+            if key not in self._data:
+                return None
+            value = self._data[key]
+            self._remove(key, 'ended')
+            return value
+
+    def cleanup(self):
+        """主动清理过期会话"""
+        with self._lock:
+            self._cleanup(time.time())
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'expired': self.expired,
+                'evicted': self.evicted
+            }
+
+
+class SessionRegistry:
+    def __init__(self):
+        """
+        会话存储注册表
+        记录所有 SessionStore，提供一次结束某会话在全部存储中的数据，以及会话数据被清理时的回调
+        """
+        self._stores = []
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def register(self, store):
+        with self._lock:
+            self._stores.append(store)
+
+    def on_session_end(self, hook):
+        """
+        注册会话结束回调 hook(session_id, value, reason, store_name)
+        reason 为 'ended'（主动结束）、'expired'（空闲过期）或 'evicted'（超出上限）；可作装饰器使用
+        """
+        with self._lock:
+            self._hooks.append(hook)
+        return hook
+
+    def notify(self, key, value, reason, store_name):
+        for hook in list(self._hooks):
+            try:
+                hook(key, value, reason, store_name)
+            except Exception as e:
+                print(f"[ERROR] 会话结束回调失败: {e}")
+
+    def end_session(self, session_id):
+        """在所有存储中结束该会话"""
+        for store in list(self._stores):
+            store.end(session_id)
+
+    def cleanup(self):
+        for store in list(self._stores):
+            store.cleanup()
+
+    def get_stats(self):
+        return {store.name: store.get_stats() for store in list(self._stores)}
+
+
+# 全局会话存储注册表
+session_registry = SessionRegistry()
+
+
+class StripedCounterStore:
+    def __init__(self, store, factory, stripes=SESSION_LOCK_STRIPES):
+        """
+        会话计数的并发安全访问
+        按会话ID哈希到固定数量的锁（锁分段），同一会话的读改写串行执行，不同会话之间互不阻塞；
+        读取返回加锁复制的快照，不会读到更新到一半的计数
+        :param store: 保存计数记录的 SessionStore
+        :param factory: 会话不存在时创建记录，factory() 返回 SessionRecord
+        :param stripes: 锁的数量
+        """
+        self.store = store
+        self.factory = factory
+        self._locks = [threading.Lock() for _ in range(max(1, int(stripes)))]
+
+    def lock(self, session_id):
+        """该会话对应的锁"""
+        return self._locks[hash(session_id) % len(self._locks)]
+
+    def _record(self, session_id, create):
+        # 先判断是否存在，避免触发存储的 default_factory
+        record = self.store.get(session_id) if session_id in self.store else None
+        if record is None and create:
+            record = self.factory()
+            self.store[session_id] = record
+        return record
+
+    def apply(self, session_id, func, create=True):
+        """
+        在会话锁内执行 func(record) 并返回其结果，用于多个字段的原子读改写
+        :param create: 会话不存在时是否创建；为 False 且不存在时返回 None
+        """
+        with self.lock(session_id):
+            record = self._record(session_id, create)
+            return func(record) if record is not None else None
+
+    def increment(self, session_id, counts, **fields):
+        """
+        原子累加计数并设置其他字段，返回更新后的快照
+        :param counts: {字段名: 增量}
+        :param fields: 直接赋值的字段，如 last_update
+        """
+        def update(record):
+            for key, value in counts.items():
+                record[key] += value
+            for key, value in fields.items():
+                record[key] = value
+            return record.to_dict()
+        return self.apply(session_id, update)
+
+    def snapshot(self, session_id, create=False):
+        """会话计数的一致快照（dict），不存在时返回 None"""
+        return self.apply(session_id, lambda record: record.to_dict(), create=create)
+
+    def replace(self, session_id, record, only_existing=False):
+        """
+        原子替换会话记录，返回替换前的快照
+        :param only_existing: 为 True 时只替换已存在的会话，不存在时不写入
+        """
+        with self.lock(session_id):
+            old = self.store.get(session_id)
+            if old is not None or not only_existing:
+                self.store[session_id] = record
+            return old.to_dict() if old is not None else None
+
+    def pop(self, session_id):
+        """原子取出并结束会话，返回最终快照"""
+        with self.lock(session_id):
+            old = self.store.end(session_id)
+            return old.to_dict() if old is not None else None
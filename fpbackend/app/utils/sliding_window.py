@@ -0,0 +1,101 @@
+import time
+import threading
+
+
+class SlidingWindowCounter:
+    def __init__(self, fields, windows=(10, 60), bucket_seconds=1.0):
+        """
+        按时间分桶的滑动窗口计数器
+        环形数组中每个桶累计一个时间片（默认1秒）内各字段的值，并为每个窗口长度维护一份滚动和：
+        时间前进时只减去移出窗口的桶，查询“最近 N 秒”直接返回滚动和，不再遍历历史记录；
+        内存固定为 最长窗口/桶长 个桶，与写入频率无关。窗口边界精确到一个桶
+        :param fields: 计数字段名，如 ('closed_eyes', 'open_mouth')
+        :param windows: 支持查询的窗口长度（秒），可同时维护多个
+        :param bucket_seconds: 每个桶的时间长度（秒）
+        """
+        self.fields = tuple(fields)
+        self.bucket_seconds = float(bucket_seconds)
+        self.windows = tuple(sorted({int(round(w / self.bucket_seconds)) for w in windows if w > 0}))
+        if not self.fields or not self.windows:
+            raise ValueError("滑动窗口需要至少一个字段和一个窗口长度")
+        self._index = {field: i for i, field in enumerate(self.fields)}
+        self._size = self.windows[-1]
+        self._buckets = [[0] * len(self.fields) for _ in range(self._size)]
+        self._sums = {w: [0] * len(self.fields) for w in self.windows}
+        self._head = None   # 最新桶的序号（时间 / 桶长）
+        self._lock = threading.Lock()
+
+    def _window_buckets(self, seconds):
+        buckets = int(round(seconds / self.bucket_seconds))
+        if buckets not in self._sums:
+            raise ValueError(f"未配置的窗口长度: {seconds}秒，可用: {[w * self.bucket_seconds for w in self.windows]}")
+        return buckets
+
+    def _advance(self, now):
+        """前进到 now 所在的桶，逐桶减去移出各窗口的值；间隔超过最长窗口时直接清空"""
+        head = int(now // self.bucket_seconds)
+        if self._head is None:
+            self._head = head
+            return
+        steps = head - self._head
+        if steps <= 0:
+            # 同一个桶内，或时钟回拨时计入当前桶
+            return
+        if steps >= self._size:
+            for bucket in self._buckets:
+                bucket[:] = [0] * len(self.fields)
+            for sums in self._sums.values():
+                sums[:] = [0] * len(self.fields)
+            self._head = head
+            return
+        for _ in range(steps):
+            self._head += 1
+            for w, sums in self._sums.items():
+                leaving = self._buckets[(self._head - w) % self._size]
+                for i, value in enumerate(leaving):
+                    if value:
+                        sums[i] -= value
+            # 复用的槽位此时已移出所有窗口
+            self._buckets[self._head % self._size] = [0] * len(self.fields)
+
+    def add(self, values, now=None):
+        """
+        累计一次观测
+        :param values: {字段名: 数值}，未列出的字段视为0
+        :param now: 观测时间，默认当前时间
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._advance(now)
+            bucket = self._buckets[self._head % self._size]
+            for field, value in values.items():
+                if not value:
+                    continue
+                i = self._index[field]
+                bucket[i] += value
+                for sums in self._sums.values():
+                    sums[i] += value
+
+    def total(self, field, seconds, now=None):
+        """最近 seconds 秒内某字段的累计值"""
+        now = time.time() if now is None else now
+        with self._lock:
+            w = self._window_buckets(seconds)
+            self._advance(now)
+            return self._sums[w][self._index[field]]
+
+    def totals(self, seconds, now=None):
+        """最近 seconds 秒内所有字段的累计值：{字段名: 数值}"""
+        now = time.time() if now is None else now
+        with self._lock:
+            w = self._window_buckets(seconds)
+            self._advance(now)
+            return dict(zip(self.fields, self._sums[w]))
+
+    def reset(self):
+        with self._lock:
+            for bucket in self._buckets:
+                bucket[:] = [0] * len(self.fields)
+            for sums in self._sums.values():
+                sums[:] = [0] * len(self.fields)
+            self._head = None
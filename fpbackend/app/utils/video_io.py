@@ -0,0 +1,191 @@
+import os
+import shutil
+import tempfile
+import subprocess
+import cv2
+import numpy as np
+
+# 视频读写方式：auto 有 ffmpeg 时用 ffmpeg 管道，否则用 OpenCV；也可指定 ffmpeg 或 opencv
+VIDEO_IO_BACKEND = os.getenv('VIDEO_IO_BACKEND', 'auto').strip().lower()
+# ffmpeg 可执行文件，默认从 PATH 查找
+FFMPEG_BIN = os.getenv('FFMPEG_BIN', '') or shutil.which('ffmpeg')
+# 解码/编码线程数，0 表示由 ffmpeg 按 CPU 核数决定
+FFMPEG_THREADS = int(os.getenv('FFMPEG_THREADS', 0))
+# H.264 编码速度预设与质量（CRF 越大文件越小、画质越低）
+FFMPEG_PRESET = os.getenv('FFMPEG_PRESET', 'veryfast')
+FFMPEG_CRF = int(os.getenv('FFMPEG_CRF', 23))
+
+FFMPEG_PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow')
+
+
+def ffmpeg_available():
+    """是否使用 ffmpeg 管道读写视频"""
+    return VIDEO_IO_BACKEND != 'opencv' and bool(FFMPEG_BIN)
+
+
+def probe_video(video_path):
+    """
+    读取视频参数
+    :return: {'fps', 'width', 'height', 'total_frames'}，帧率异常时按 25 FPS 处理
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError("无法打开视频文件")
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if not fps or fps < 1 or fps > 240:
+            fps = 25.0  # 默认FPS
+        return {
+            'fps': fps,
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'total_frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        }
+    finally:
+        cap.release()
+
+
+class FFmpegReader:
+    def __init__(self, video_path, width, height, threads=FFMPEG_THREADS):
+        """
+        通过 ffmpeg 子进程多线程解码，以 BGR24 原始帧从管道读出
+        接口与 cv2.VideoCapture 的 read/grab/isOpened/release 一致，可直接替换
+        :param width: 帧宽
+        :param height: 帧高
+        :param threads: 解码线程数
+        """
+        self.width = width
+        self.height = height
+        self.frame_bytes = width * height * 3
+        self._scratch = None
+        self._proc = subprocess.Popen(
+            [FFMPEG_BIN, '-loglevel', 'error', '-nostdin', '-threads', str(threads), '-i', video_path,
+             '-an', '-sn', '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=self.frame_bytes
+        )
+
+    def isOpened(self):
+        return self._proc is not None and self.frame_bytes > 0
+
+    def _read_into(self, buffer):
+        view = memoryview(buffer).cast('B')
+        filled = 0
+        while filled < self.frame_bytes:
+            count = self._proc.stdout.readinto(view[filled:])
+            if not count:
+                return False
+            filled += count
+        return True
+
+    def read(self):
+        """读取下一帧，每帧返回新的数组，可在后续阶段原地绘制"""
+        if self._proc is None:
+            return False, None
+        frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        if not self._read_into(frame):
+            return False, None
+        return True, frame
+
+    def grab(self):
+        """跳过一帧；ffmpeg 已完成解码，这里只省去数组分配"""
+        if self._proc is None:
+            return False
+        if self._scratch is None:
+            self._scratch = bytearray(self.frame_bytes)
+        return self._read_into(self._scratch)
+
+    def release(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.terminate()
+        proc.wait()
+
+
+class FFmpegWriter:
+    def __init__(self, out_path, fps, size, preset=FFMPEG_PRESET, crf=FFMPEG_CRF, threads=FFMPEG_THREADS):
+        """
+        通过 ffmpeg 子进程编码 H.264 MP4
+        输出 yuv420p 并把 moov 前置（faststart），浏览器下载开头即可开始播放；
+        接口与 cv2.VideoWriter 的 write/isOpened/release 一致
+        :param fps: 帧率
+        :param size: (宽, 高)
+        :param preset: x264 速度预设
+        :param crf: x264 质量参数
+        :param threads: 编码线程数
+        """
+        width, height = size
+        self.out_path = out_path
+        self.frame_bytes = width * height * 3
+        # x264 的 yuv420p 要求宽高为偶数，奇数尺寸补一像素边
+        self._log = tempfile.TemporaryFile()
+        self._proc = subprocess.Popen(
+            [FFMPEG_BIN, '-loglevel', 'error', '-nostdin', '-y',
+             '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', f'{fps}', '-i', '-',
+             '-an', '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+             '-c:v', 'libx264', '-preset', preset, '-crf', str(crf), '-threads', str(threads),
+             '-pix_fmt', 'yuv420p', '-movflags', '+faststart', out_path],
+            stdin=subprocess.PIPE, stderr=self._log
+        )
+
+    def isOpened(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def write(self, frame):
+        frame = np.ascontiguousarray(frame)
+        if frame.nbytes != self.frame_bytes:
+            raise ValueError(f"帧尺寸与编码器不一致: {frame.shape}")
+        self._proc.stdin.write(memoryview(frame).cast('B'))
+
+    def release(self):
+        """结束输入并等待 ffmpeg 写完文件（含 faststart 的 moov 前移）"""
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        if proc.wait() != 0:
+            self._log.seek(0)
+            message = self._log.read().decode('utf-8', 'replace').strip()
+            print(f"[ERROR] ffmpeg 编码失败 ({proc.returncode}): {message}")
+        self._log.close()
+
+
+def open_video_reader(video_path, width, height):
+    """
+    打开视频解码器：优先 ffmpeg 管道，不可用时回退 cv2.VideoCapture
+    :param width: 帧宽（由 probe_video 获得）
+    :param height: 帧高
+    """
+    if ffmpeg_available() and width > 0 and height > 0:
+        return FFmpegReader(video_path, width, height)
+    return cv2.VideoCapture(video_path)
+
+
+def open_video_writer(out_path, fps, width, height, preset=FFMPEG_PRESET, crf=FFMPEG_CRF):
+    """
+    打开视频编码器：优先 ffmpeg 管道编码 H.264（可设 preset/CRF，faststart），
+    不可用时回退 cv2.VideoWriter（先 avc1，再 mp4v）
+    """
+    if ffmpeg_available():
+        writer = FFmpegWriter(out_path, fps, (width, height), preset, crf)
+        if writer.isOpened():
+            return writer
+        writer.release()
+        print("[ERROR] ffmpeg 编码器启动失败，回退 OpenCV")
+
+    fourcc_h264 = cv2.VideoWriter_fourcc(*'avc1')
+    writer = cv2.VideoWriter(out_path, fourcc_h264, fps, (width, height))
+    if not writer.isOpened():
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        writer = cv2.VideoWriter(out_path, fourcc, fps, (width, height))
+    return writer
+
+
+def io_backend_name(handle):
+    """读写器的实现名称，用于统计输出"""
+    return 'ffmpeg' if isinstance(handle, (FFmpegReader, FFmpegWriter)) else 'opencv'
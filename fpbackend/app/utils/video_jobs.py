@@ -0,0 +1,239 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# 同时处理视频的进程数
+VIDEO_JOB_WORKERS = int(os.getenv('VIDEO_JOB_WORKERS', 2))
+# 排队等待的任务上限，超出后拒绝新任务
+VIDEO_JOB_MAX_PENDING = int(os.getenv('VIDEO_JOB_MAX_PENDING', 8))
+# 工作进程上报进度的最小间隔（秒）
+VIDEO_JOB_PROGRESS_INTERVAL = float(os.getenv('VIDEO_JOB_PROGRESS_INTERVAL', 0.5))
+# 已结束任务的保留时间（秒）
+VIDEO_JOB_RETENTION = int(os.getenv('VIDEO_JOB_RETENTION', 3600))
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobCancelled(Exception):
+    """任务在处理过程中被取消"""
+
+
+class JobQueueFull(Exception):
+    """排队任务数已达上限"""
+
+
+class JobProgress:
+    def __init__(self, job_id, progress, cancelled, interval=VIDEO_JOB_PROGRESS_INTERVAL):
+        """
+        工作进程内的进度上报器，经 Manager 共享字典回传给 Web 进程
+        每次上报时检查取消标记，已取消则抛出 JobCancelled 终止处理
+        :param job_id: 任务ID
+        :param progress: 共享进度字典
+        :param cancelled: 共享取消标记字典
+        :param interval: 最小上报间隔（秒）
+        """
+        self.job_id = job_id
+        self.progress = progress
+        self.cancelled = cancelled
+        self.interval = interval
+        self.started_at = time.time()
+        self._last_report = 0.0
+
+    def __call__(self, frames_done, total_frames, stats=None, force=False):
+        now = time.time()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        if self.cancelled.get(self.job_id):
+            raise JobCancelled(self.job_id)
+        self.progress[self.job_id] = {
+            'status': JOB_RUNNING,
+            'started_at': self.started_at,
+            'updated_at': now,
+            'frames_done': int(frames_done),
+            'total_frames': int(total_frames or 0),
+            'stats': dict(stats or {})
+        }
+
+
+# 当前进程是否为视频任务的工作进程
+_in_job_worker = False
+
+
+def in_job_worker():
+    """当前进程是否为视频任务的工作进程，工作进程内不应再创建子进程池"""
+    return _in_job_worker
+
+
+def _run_job(job_id, func, kwargs, progress, cancelled):
+    """工作进程入口：执行任务函数并注入进度上报器"""
+    global _in_job_worker
+    _in_job_worker = True
+    reporter = JobProgress(job_id, progress, cancelled)
+    reporter(0, 0, force=True)
+    return func(progress=reporter, **kwargs)
+
+
+class VideoJobManager:
+    def __init__(self, max_workers=VIDEO_JOB_WORKERS, max_pending=VIDEO_JOB_MAX_PENDING):
+        """
+        视频检测任务队列
+        任务在有界的 spawn 进程池中执行，不占用 Web 线程；
+        进度和取消标记通过 multiprocessing Manager 共享，排队任务数超过 max_pending 时拒绝提交
+        :param max_workers: 工作进程数
+        :param max_pending: 排队任务上限
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(0, int(max_pending))
+        self._context = multiprocessing.get_context('spawn')
+        self._executor = None
+        self._manager = None
+        self._progress = None
+        self._cancelled = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        """首次提交时再启动进程池和 Manager，避免导入模块时就创建子进程"""
+        if self._executor is None:
+            self._manager = self._context.Manager()
+            self._progress = self._manager.dict()
+            self._cancelled = self._manager.dict()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._context)
+
+    def submit(self, job_id, func, kwargs, on_done=None):
+        """
+        提交任务
+        :param job_id: 任务ID
+        :param func: 任务函数（需可在子进程中导入），以关键字参数 progress 接收进度上报器
+        :param kwargs: 任务参数（需可序列化）
+        :param on_done: 任务结束后在 Web 进程中调用的回调 on_done(job)
+        :return: 任务快照
+        """
+        with self._lock:
+            self._purge_finished()
+            pending = sum(1 for job in self._jobs.values() if job['status'] == JOB_QUEUED)
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"排队中的视频任务已达上限 {self.max_pending}")
+
+            self._ensure_started()
+            job = {
+                'job_id': job_id,
+                'status': JOB_QUEUED,
+                'submitted_at': time.time(),
+                'finished_at': None,
+                'result': None,
+                'error': None,
+                'future': None
+            }
+            self._jobs[job_id] = job
+            job['future'] = self._executor.submit(_run_job, job_id, func, kwargs, self._progress, self._cancelled)
+
+        job['future'].add_done_callback(lambda future: self._finish(job_id, future, on_done))
+        return self.get(job_id)
+
+    def _finish(self, job_id, future, on_done):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if future.cancelled():
+                job['status'] = JOB_CANCELLED
+            else:
+                error = future.exception()
+                if error is None:
+                    job['status'] = JOB_COMPLETED
+                    job['result'] = future.result()
+                elif isinstance(error, JobCancelled):
+                    job['status'] = JOB_CANCELLED
+                else:
+                    job['status'] = JOB_FAILED
+                    job['error'] = str(error)
+            job['finished_at'] = time.time()
+            self._cancelled.pop(job_id, None)
+
+        if job['status'] == JOB_FAILED:
+            print(f"[ERROR] 视频任务失败 {job_id}: {job['error']}")
+        if on_done is not None:
+            try:
+                on_done(self.get(job_id))
+            except Exception as e:
+                print(f"[ERROR] 视频任务回调失败 {job_id}: {e}")
+
+    def cancel(self, job_id):
+        """取消任务：排队中的直接移出队列，运行中的在下次上报进度时终止，返回是否存在该任务"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            if job['status'] in FINISHED_STATES:
+                return True
+            self._cancelled[job_id] = True
+        job['future'].cancel()
+        return True
+
+    def get(self, job_id):
+        """任务快照：状态、进度、处理速度与预计剩余时间，结束后附带结果"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = {key: value for key, value in job.items() if key != 'future'}
+        progress = dict(self._progress.get(job_id) or {}) if self._progress is not None else {}
+
+        if snapshot['status'] == JOB_QUEUED and progress.get('status') == JOB_RUNNING:
+            snapshot['status'] = JOB_RUNNING
+        frames_done = progress.get('frames_done', 0)
+        total_frames = progress.get('total_frames', 0)
+        started_at = progress.get('started_at')
+        end_time = snapshot['finished_at'] or progress.get('updated_at') or time.time()
+        elapsed = end_time - started_at if started_at else 0.0
+        fps = frames_done / elapsed if elapsed > 0 else 0.0
+
+        snapshot.update({
+            'started_at': started_at,
+            'frames_done': frames_done,
+            'total_frames': total_frames,
+            'percent': round(frames_done * 100.0 / total_frames, 1) if total_frames else 0.0,
+            'fps': round(fps, 2),
+            'eta_seconds': round((total_frames - frames_done) / fps, 1)
+            if snapshot['status'] == JOB_RUNNING and fps > 0 and total_frames > frames_done else None,
+            'stats': progress.get('stats', {})
+        })
+        if snapshot['status'] == JOB_COMPLETED:
+            snapshot['percent'] = 100.0
+        return snapshot
+
+    def list_jobs(self):
+        with self._lock:
+            job_ids = list(self._jobs)
+        return [self.get(job_id) for job_id in job_ids]
+
+    def _purge_finished(self):
+        """清理超过保留时间的已结束任务"""
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job['status'] in FINISHED_STATES and now - job['finished_at'] > VIDEO_JOB_RETENTION]:
+            self._jobs.pop(job_id, None)
+            if self._progress is not None:
+                self._progress.pop(job_id, None)
+
+    def shutdown(self):
+        with self._lock:
+            executor, manager = self._executor, self._manager
+            self._executor = self._manager = None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
+
+
+# 全局视频任务队列
+video_job_manager = VideoJobManager()
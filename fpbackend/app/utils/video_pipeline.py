@@ -0,0 +1,237 @@
+import os
+import queue
+import threading
+import time
+
+# 阶段之间有界队列的默认深度
+PIPELINE_QUEUE_SIZE = int(os.getenv('VIDEO_PIPELINE_QUEUE_SIZE', 4))
+# 各阶段默认工作线程数，格式: "infer=1,annotate=2"
+# 推理阶段共用同一个模型实例，ultralytics 预测器不是线程安全的，infer 建议保持为1
+PIPELINE_WORKERS = os.getenv('VIDEO_PIPELINE_WORKERS', 'infer=1,annotate=2')
+
+# 流结束标记
+_END = object()
+
+
+def parse_stage_workers(spec):
+    """
+    解析阶段工作线程配置
+    :param spec: 形如 "infer=1,annotate=2" 的字符串
+    :return: {阶段名: 线程数}
+    """
+    workers = {}
+    if not spec:
+        return workers
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, sep, value = part.partition('=')
+        if not sep:
+            raise ValueError(f"无效的阶段配置: {part}")
+        count = int(value)
+        if count < 1:
+            raise ValueError(f"阶段 {name.strip()} 的线程数必须大于0")
+        workers[name.strip()] = count
+    return workers
+
+
+class PipelineStage:
+    def __init__(self, name, func, workers=1, ordered=False):
+        """
+        流水线阶段
+        :param name: 阶段名称
+        :param func: 处理函数，接收上一阶段的输出并返回本阶段的输出
+        :param workers: 工作线程数
+        :param ordered: 有状态阶段（如累计统计、写视频）只能单线程按序执行
+        """
+        self.name = name
+        self.func = func
+        self.workers = 1 if ordered else max(1, int(workers))
+        self.ordered = ordered
+
+        # 占用统计
+        self.items = 0
+        self.busy_time = 0.0
+        self.wait_input_time = 0.0
+        self.wait_output_time = 0.0
+        self.queue_samples = 0
+        self.queue_fill_sum = 0
+        self._lock = threading.Lock()
+
+    def record(self, busy, wait_input, wait_output, queue_fill):
+        with self._lock:
+            self.items += 1
+            self.busy_time += busy
+            self.wait_input_time += wait_input
+            self.wait_output_time += wait_output
+            self.queue_samples += 1
+            self.queue_fill_sum += queue_fill
+
+
+class _OrderedOutput:
+    """按序号把多线程阶段的输出依次放入下游队列"""
+
+    def __init__(self, target, stop_event):
+        self.target = target
+        self.stop_event = stop_event
+        self.next_seq = 0
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def put(self, seq, item):
+        """返回阻塞在下游队列上的时间"""
+        waited = 0.0
+        with self.lock:
+            self.pending[seq] = item
+            while self.next_seq in self.pending:
+                ready = self.pending.pop(self.next_seq)
+                start = time.perf_counter()
+                _put(self.target, (self.next_seq, ready), self.stop_event)
+                waited += time.perf_counter() - start
+                self.next_seq += 1
+        return waited
+
+
+def _put(q, item, stop_event):
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(q, stop_event):
+    while not stop_event.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+
+class VideoPipeline:
+    def __init__(self, source, stages, queue_size=PIPELINE_QUEUE_SIZE, source_name='decode'):
+        """
+        解码 → 推理 → 绘制 → 编码 多阶段流水线，阶段之间使用有界队列
+        :param source: 生成器函数，按顺序产出待处理的数据（在独立线程中运行）
+        :param stages: PipelineStage 列表，最后一个阶段的输出被丢弃
+        :param queue_size: 阶段之间队列的最大深度
+        :param source_name: 数据源阶段名称
+        """
+        self.source = source
+        self.source_stage = PipelineStage(source_name, None, ordered=True)
+        self.stages = list(stages)
+        self.queue_size = max(1, int(queue_size))
+        self.stop_event = threading.Event()
+        self.errors = []
+        self.wall_time = 0.0
+
+    def _run_source(self, output):
+        stage = self.source_stage
+        seq = 0
+        try:
+            iterator = iter(self.source())
+            while not self.stop_event.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                busy = time.perf_counter() - start
+                waited = output.put(seq, item)
+                stage.record(busy, 0.0, waited, 0)
+                seq += 1
+        except Exception as e:
+            self._fail(stage, e)
+        finally:
+            output.put(seq, _END)
+
+    def _run_stage(self, stage, input_queue, output, remaining):
+        while True:
+            fill = input_queue.qsize()
+            start = time.perf_counter()
+            entry = _get(input_queue, self.stop_event)
+            wait_input = time.perf_counter() - start
+            if entry is None:
+                return
+            seq, item = entry
+
+            if item is _END:
+                # 把结束标记留给同阶段的其他线程，最后一个线程再传给下游
+                input_queue.put(entry)
+                with remaining['lock']:
+                    remaining['count'] -= 1
+                    last = remaining['count'] == 0
+                if last and output is not None:
+                    output.put(seq, _END)
+                return
+
+            start = time.perf_counter()
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                self._fail(stage, e)
+                return
+            busy = time.perf_counter() - start
+
+            wait_output = output.put(seq, result) if output is not None else 0.0
+            stage.record(busy, wait_input, wait_output, fill)
+
+    def _fail(self, stage, error):
+        print(f"[ERROR] 流水线阶段 {stage.name} 失败: {error}")
+        self.errors.append(error)
+        self.stop_event.set()
+
+    def run(self):
+        """运行流水线直到数据源耗尽，返回各阶段占用统计"""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        outputs = [_OrderedOutput(q, self.stop_event) for q in queues]
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._run_source, args=(outputs[0],), daemon=True)]
+        for index, stage in enumerate(self.stages):
+            output = outputs[index + 1] if index + 1 < len(outputs) else None
+            remaining = {'count': stage.workers, 'lock': threading.Lock()}
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._run_stage,
+                    args=(stage, queues[index], output, remaining),
+                    daemon=True
+                ))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.wall_time = time.perf_counter() - start
+
+        if self.errors:
+            raise self.errors[0]
+        return self.get_stats()
+
+    def get_stats(self):
+        """
+        各阶段占用情况
+        occupancy 为忙碌时间占 (总耗时 × 线程数) 的比例，最高者即为吞吐瓶颈
+        """
+        wall = self.wall_time or 1e-9
+        stats = {}
+        for stage in [self.source_stage] + self.stages:
+            stats[stage.name] = {
+                'workers': stage.workers,
+                'items': stage.items,
+                'busy_seconds': round(stage.busy_time, 3),
+                'wait_input_seconds': round(stage.wait_input_time, 3),
+                'wait_output_seconds': round(stage.wait_output_time, 3),
+                'occupancy': round(stage.busy_time / (wall * stage.workers), 3),
+                'avg_queue_fill': round(stage.queue_fill_sum / stage.queue_samples / self.queue_size, 3) if stage.queue_samples else 0.0
+            }
+        bottleneck = max(stats, key=lambda name: stats[name]['occupancy']) if stats else None
+        return {
+            'wall_seconds': round(self.wall_time, 3),
+            'queue_size': self.queue_size,
+            'bottleneck': bottleneck,
+            'stages': stats
+        }
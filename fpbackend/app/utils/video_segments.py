@@ -0,0 +1,183 @@
+import os
+import shutil
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import cv2
+from app.utils.video_jobs import in_job_worker
+
+# 分段推理的工作进程数，每个进程各自加载一份模型；小于2时不分段
+VIDEO_SEGMENT_WORKERS = int(os.getenv('VIDEO_SEGMENT_WORKERS', 2))
+# 总帧数达到该值的视频才分段处理，短视频分段的进程与模型加载开销得不偿失
+VIDEO_SEGMENT_MIN_FRAMES = int(os.getenv('VIDEO_SEGMENT_MIN_FRAMES', 1500))
+# 单个分段的最小帧数
+VIDEO_SEGMENT_MIN_LENGTH = int(os.getenv('VIDEO_SEGMENT_MIN_LENGTH', 250))
+# 单个请求的分段数上限
+MAX_VIDEO_SEGMENTS = 16
+# 探测关键帧时在每个计划切分点附近扫描的时长（秒）
+KEYFRAME_PROBE_WINDOW = float(os.getenv('KEYFRAME_PROBE_WINDOW', 4))
+# 探测关键帧的超时时间（秒）
+KEYFRAME_PROBE_TIMEOUT = 10
+
+
+def probe_keyframes(video_path, fps, positions, window=KEYFRAME_PROBE_WINDOW):
+    """
+    用 ffprobe 读取计划切分点附近的关键帧位置
+    只扫描首个数据包和每个切分点前后 window/2 秒内的数据包（-read_intervals），不解码也不读完整个文件，
+    耗时与视频长度无关；帧号按显示时间换算：(pts - 首个数据包 pts) * fps
+    :param fps: 视频帧率
+    :param positions: 计划切分点帧号
+    :return: 关键帧帧号列表（升序），没有 ffprobe 或探测失败时返回空列表
+    """
+    ffprobe = shutil.which('ffprobe')
+    if not ffprobe or fps <= 0 or not positions:
+        return []
+    intervals = ['%+#1'] + [f"{max(0.0, position / fps - window / 2):.3f}%+{window:g}"
+                            for position in sorted(positions)]
+    try:
+        output = subprocess.run(
+            [ffprobe, '-v', 'error', '-select_streams', 'v:0', '-read_intervals', ','.join(intervals),
+             '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', video_path],
+            capture_output=True, text=True, timeout=KEYFRAME_PROBE_TIMEOUT, check=True
+        ).stdout
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"[ERROR] 探测关键帧失败: {e}")
+        return []
+
+    packets = []
+    for line in output.splitlines():
+        pts, _, flags = line.strip().partition(',')
+        try:
+            packets.append((float(pts), 'K' in flags))
+        except ValueError:
+            continue
+    if not packets:
+        return []
+    # 第一行来自 '%+#1'，即视频的首个数据包
+    origin = packets[0][0]
+    return sorted({int(round((pts - origin) * fps)) for pts, key in packets if key})
+
+
+def _segment_cuts(total_frames, segments, min_length):
+    """按帧数均分的计划切分点"""
+    segments = max(1, min(int(segments), total_frames // max(1, min_length)))
+    return [total_frames * index // segments for index in range(1, segments)]
+
+
+def plan_segments(total_frames, segments, keyframes=None, min_length=VIDEO_SEGMENT_MIN_LENGTH):
+    """
+    把视频划分为若干连续分段
+    切分点优先对齐到最近的关键帧，使各工作进程定位起点时不必从前一个关键帧解码；没有关键帧信息时按帧数均分
+    :param total_frames: 总帧数
+    :param segments: 期望分段数
+    :param keyframes: 关键帧帧号列表
+    :param min_length: 单个分段的最小帧数
+    :return: [(起始帧, 结束帧)]，结束帧不含；最后一段结束帧为 None，读到视频末尾为止
+    """
+    keyframes = sorted(k for k in (keyframes or []) if 0 < k < total_frames)
+
+    cuts = []
+    for cut in _segment_cuts(total_frames, segments, min_length):
+        if keyframes:
+            cut = min(keyframes, key=lambda k: abs(k - cut))
+        # 对齐后与前一个切分点过近的合并掉
+        previous = cuts[-1] if cuts else 0
+        if cut - previous >= min_length and total_frames - cut >= min_length:
+            cuts.append(cut)
+
+    bounds = [0] + cuts
+    return [(start, end) for start, end in zip(bounds, cuts + [None])]
+
+
+def plan_video_segments(video_path, segments, min_frames=VIDEO_SEGMENT_MIN_FRAMES):
+    """
+    为视频生成分段计划
+    :return: (分段列表, 是否按关键帧对齐)；视频过短或不需要分段时只有一段
+    """
+    if segments < 2:
+        return [(0, None)], False
+    cap = cv2.VideoCapture(video_path)
+    try:
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+        fps = cap.get(cv2.CAP_PROP_FPS) if cap.isOpened() else 0
+    finally:
+        cap.release()
+    if total_frames < min_frames:
+        return [(0, None)], False
+
+    keyframes = probe_keyframes(video_path, fps, _segment_cuts(total_frames, segments, VIDEO_SEGMENT_MIN_LENGTH))
+    return plan_segments(total_frames, segments, keyframes), bool(keyframes)
+
+
+class SegmentMismatchError(RuntimeError):
+    """分段结果与拼接位置对不上（定位或解码帧数不一致），调用方应改为顺序处理"""
+
+
+def open_segment(video_path, start):
+    """
+    打开视频并定位到分段起始帧
+    按帧号跳转后解码一帧，用该帧的时间戳（CAP_PROP_POS_MSEC）核对实际落点；
+    跳转后读到的 CAP_PROP_POS_FRAMES 只是请求的位置，不能说明定位准确。
+    落点不符（如时间戳不规则的视频）时退回从头 grab() 到起始帧，保证分段之间不重不漏
+    :return: (cap, 已解码的起始帧)；起始帧为0时未预先解码，返回 (cap, None)
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError("无法打开视频文件")
+    if start <= 0:
+        return cap, None
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    ret, frame = cap.read()
+    if ret and fps > 0:
+        landed = cap.get(cv2.CAP_PROP_POS_MSEC) * fps / 1000.0
+        if abs(landed - start) < 0.5:
+            return cap, frame
+
+    print(f"[DEBUG] 视频跳转到第 {start} 帧不准确，改为逐帧定位")
+    cap.release()
+    cap = cv2.VideoCapture(video_path)
+    for _ in range(start):
+        if not cap.grab():
+            break
+    return cap, None
+
+
+class SegmentExecutor:
+    def __init__(self, max_workers=VIDEO_SEGMENT_WORKERS):
+        """
+        分段推理进程池
+        使用 spawn 方式启动，首次提交时才创建；工作进程常驻，模型在进程内由注册表缓存，后续视频直接复用。
+        已在视频任务的工作进程中时不再嵌套创建进程池，改用本进程内的线程池，共用本进程的模型和推理服务
+        :param max_workers: 工作进程数
+        """
+        self.max_workers = max(1, int(max_workers))
+        self._context = multiprocessing.get_context('spawn')
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        with self._lock:
+            if self._executor is None:
+                if in_job_worker():
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix='video-segment')
+                else:
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._context)
+            return self._executor.submit(func, *args, **kwargs)
+
+    @property
+    def in_process(self):
+        """分段是否在本进程的线程中推理"""
+        return isinstance(self._executor, ThreadPoolExecutor)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 全局分段推理进程池
+segment_executor = SegmentExecutor()
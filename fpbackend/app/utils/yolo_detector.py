@@ -1,44 +1,150 @@
 import os
+import sys
 import cv2
+import heapq
 import numpy as np
-from ultralytics import YOLO
 from PIL import Image
 import tempfile
 import uuid
 from datetime import datetime
 import string
 import time
-from collections import defaultdict, deque
+from app.utils.inference_server import get_inference_server
+from app.utils.model_registry import model_registry
+from app.utils.sliding_window import SlidingWindowCounter
+from app.utils.session_store import SessionStore
+from app.utils.session_records import FatigueCounter
+from app.utils.postprocess import (count_classes, batch_arrays, build_detections, build_fatigue_indicators,
+                                   CLASS_NAMES, FATIGUE_CLASSES, CLOSED_EYES, OPEN_MOUTH)
+from app.utils.video_pipeline import VideoPipeline, PipelineStage, parse_stage_workers, PIPELINE_QUEUE_SIZE, PIPELINE_WORKERS
 
 # 全局变量 - 语音播报控制
 tplay = 0  # 语音上次播放时间
 
+# 疲劳判断与统计使用的滑动窗口（秒）
+FATIGUE_CHECK_WINDOW = 10
+FATIGUE_STATS_WINDOW = 60
+# 滑动窗口字段：闭眼/张嘴目标数，以及出现闭眼/张嘴的检测次数
+FATIGUE_WINDOW_FIELDS = ('closed_eyes', 'open_mouth', 'closed_eyes_hits', 'open_mouth_hits')
+
+# 视频结果汇总中保留的疲劳指标条数上限（按置信度取最高的若干条），0 表示不限制、按检测顺序保留全部
+VIDEO_INDICATOR_LIMIT = int(os.getenv('VIDEO_INDICATOR_LIMIT', 0))
+# 视频检测期间每隔多少帧采样一次进程内存
+RSS_SAMPLE_INTERVAL = 30
+
+
+def _rss_mb():
+    """当前进程常驻内存（MB），读取 /proc/self/statm，不支持的平台返回 None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _peak_rss_mb():
+    """进程常驻内存峰值（MB）：优先读取 /proc/self/status 的 VmHWM，其次 resource.getrusage 的 ru_maxrss"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位为 KB，macOS 为字节
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    except (ImportError, OSError):
+        return None
+
+
+class VideoResultAccumulator:
+    def __init__(self, indicator_limit=VIDEO_INDICATOR_LIMIT):
+        """
+        视频检测结果的流式汇总
+        每批结果到达时只更新计数，不保留 Results（及其原始帧）；
+        疲劳指标按类别计数，明细默认全部保留，设置 indicator_limit 后只保留置信度最高的若干条，
+        汇总中的 fatigue_indicators_total / fatigue_indicators_truncated 标明明细是否完整
+        :param indicator_limit: 保留的疲劳指标明细条数，0 表示不限制
+        """
+        self.indicator_limit = max(0, int(indicator_limit))
+        self._indicators = []       # 不限制条数时按检测顺序保存 (类别名, 置信度)
+        self.total_frames = 0
+        self.frames_with_detections = 0
+        self.total_objects = 0
+        self.indicator_counts = {CLASS_NAMES[c]: 0 for c in FATIGUE_CLASSES}
+        self._top_indicators = []   # 小顶堆 (置信度, 序号, 类别名)
+        self._seq = 0
+
+    def add(self, results):
+        """累计一批帧的检测结果"""
+        frame_index, cls, conf = batch_arrays(results)
+        self.total_frames += len(results)
+        self.frames_with_detections += int(len(np.unique(frame_index)))
+        self.total_objects += int(len(cls))
+
+        keep = np.isin(cls, FATIGUE_CLASSES)
+        for c, p in zip(cls[keep].tolist(), conf[keep].tolist()):
+            name = CLASS_NAMES[c]
+            self.indicator_counts[name] += 1
+            if self.indicator_limit == 0:
+                self._indicators.append((name, p))
+                continue
+            self._seq += 1
+            item = (p, self._seq, name)
+            if len(self._top_indicators) < self.indicator_limit:
+                heapq.heappush(self._top_indicators, item)
+            elif item > self._top_indicators[0]:
+                heapq.heapreplace(self._top_indicators, item)
+
+    def summary(self):
+        """汇总结果；限制条数时疲劳指标明细按置信度从高到低排列，否则按检测顺序"""
+        if self.indicator_limit == 0:
+            indicators = [{'type': name, 'confidence': p} for name, p in self._indicators]
+        else:
+            indicators = [{'type': name, 'confidence': p}
+                          for p, _, name in sorted(self._top_indicators, reverse=True)]
+        total = sum(self.indicator_counts.values())
+        return {
+            'total_frames': self.total_frames,
+            'frames_with_detections': self.frames_with_detections,
+            'total_objects': self.total_objects,
+            'fatigue_indicators': indicators,
+            'fatigue_indicators_total': total,
+            'fatigue_indicators_truncated': len(indicators) < total,
+            'fatigue_indicator_counts': dict(self.indicator_counts)
+        }
+
 
 class YOLODetector:
     def __init__(self, model_path=None):
         """
         初始化YOLO检测器
         :param model_path: 模型路径，如果为None则使用默认模型
+        模型由统一模型注册表加载和管理，与 detect_api 共用同一份实例
         """
+        if model_path and os.path.exists(model_path):
+            self.model_path = model_path
+        else:
+            # 使用默认的 best.pt 模型
+            self.model_path = 'best.pt'
+
+        # 疲劳检测相关 - 修复数据结构类型
+        # 每次图片/视频检测都会生成新的会话ID，由 SessionStore 过期清理
+        self.fatigue_counters = SessionStore('fatigue_counters', default_factory=lambda: FatigueCounter(
+            window=SlidingWindowCounter(FATIGUE_WINDOW_FIELDS, windows=(FATIGUE_CHECK_WINDOW, FATIGUE_STATS_WINDOW))
+        ))
+
+    @property
+    def model(self):
+        """从模型注册表获取模型，首次使用时加载，空闲时可能被注册表卸载"""
         try:
-            if model_path and os.path.exists(model_path):
-                self.model = YOLO(model_path)
-            else:
-                # 使用默认的YOLOv8n模型
-                self.model = YOLO('best.pt')
-            print("YOLO模型加载成功")
-
-            # 疲劳检测相关 - 修复数据结构类型
-            self.fatigue_counters = defaultdict(lambda: {
-                'closed_eyes': deque(maxlen=100),
-                'open_mouth': deque(maxlen=100),
-                'last_check': 0.0,
-                'fatigue_level': 'low'
-            })
-
+            return model_registry.get(self.model_path)
         except Exception as e:
             print(f"YOLO模型加载失败: {e}")
-            self.model = None
+            return None
 
     def secure_filename(self, filename):
         """
@@ -72,65 +178,52 @@ class YOLODetector:
         current_time = time.time()
         counter = self.fatigue_counters[session_id]
 
-        closed_eyes_count = 0
-        open_mouth_count = 0
-
-        # 分析YOLO检测结果 - 根据用户的标签定义
-        for result in results:
-            if result.boxes is not None:
-                for box in result.boxes:
-                    cls = int(box.cls[0])
-                    conf = float(box.conf[0])
-
-                    # 根据用户提供的标签映射：
-                    # 0=闭眼，1=闭嘴，2=睁眼，3=张嘴
-                    if cls == 0 and conf > 0.5:  # 闭眼
-                        closed_eyes_count += 1
-                    elif cls == 3 and conf > 0.5:  # 张嘴（疲劳指标）
-                        open_mouth_count += 1
-                    # cls == 1 (闭嘴) 和 cls == 2 (睁眼) 是正常状态，不计入疲劳指标
+        # 分析YOLO检测结果 - 根据用户的标签定义：0=闭眼，1=闭嘴，2=睁眼，3=张嘴
+        # 只有闭眼和张嘴计入疲劳指标，闭嘴和睁眼是正常状态
+        counts = count_classes(results, threshold=0.5)
+        closed_eyes_count = int(counts[CLOSED_EYES])
+        open_mouth_count = int(counts[OPEN_MOUTH])
 
         # 记录检测结果
-        counter['closed_eyes'].append((current_time, closed_eyes_count))
-        counter['open_mouth'].append((current_time, open_mouth_count))
+        counter.window.add({
+            'closed_eyes': closed_eyes_count,
+            'open_mouth': open_mouth_count,
+            'closed_eyes_hits': int(closed_eyes_count > 0),
+            'open_mouth_hits': int(open_mouth_count > 0)
+        }, current_time)
 
         # 每10秒进行一次疲劳程度判断
-        if current_time - counter['last_check'] >= 10:
-            counter['last_check'] = current_time
+        if current_time - counter.last_check >= FATIGUE_CHECK_WINDOW:
+            counter.last_check = current_time
 
             # 统计最近10秒的疲劳指标
-            recent_time = current_time - 10
-            recent_closed_eyes = sum(count for timestamp, count in counter['closed_eyes'] if timestamp > recent_time)
-            recent_open_mouth = sum(count for timestamp, count in counter['open_mouth'] if timestamp > recent_time)
+            recent = counter.window.totals(FATIGUE_CHECK_WINDOW, current_time)
+            recent_closed_eyes = recent['closed_eyes']
+            recent_open_mouth = recent['open_mouth']
 
             # 疲劳程度判断逻辑 - 三个等级：低等、中等、高等
             if recent_closed_eyes >= 5 or recent_open_mouth >= 3:
-                counter['fatigue_level'] = 'high'  # 高等疲劳
+                counter.fatigue_level = 'high'  # 高等疲劳
             elif recent_closed_eyes >= 3 or recent_open_mouth >= 2:
-                counter['fatigue_level'] = 'medium'  # 中等疲劳
+                counter.fatigue_level = 'medium'  # 中等疲劳
             else:
-                counter['fatigue_level'] = 'low'  # 低等疲劳（正常）
+                counter.fatigue_level = 'low'  # 低等疲劳（正常）
 
-        return counter['fatigue_level']
+        return counter.fatigue_level
 
     def get_fatigue_statistics(self, session_id='default'):
         """
         获取疲劳统计信息
         """
         counter = self.fatigue_counters[session_id]
-        current_time = time.time()
-        recent_time = current_time - 60  # 最近1分钟
-
-        recent_closed_eyes = len([1 for timestamp, count in counter['closed_eyes']
-                                  if timestamp > recent_time and count > 0])
-        recent_open_mouth = len([1 for timestamp, count in counter['open_mouth']
-                                 if timestamp > recent_time and count > 0])
+        # 最近1分钟出现闭眼/张嘴的检测次数
+        recent = counter.window.totals(FATIGUE_STATS_WINDOW)
 
         return {
-            'fatigue_level': counter['fatigue_level'],
-            'closed_eyes_count': recent_closed_eyes,
-            'open_mouth_count': recent_open_mouth,
-            'last_check': counter['last_check']
+            'fatigue_level': counter.fatigue_level,
+            'closed_eyes_count': recent['closed_eyes_hits'],
+            'open_mouth_count': recent['open_mouth_hits'],
+            'last_check': counter.last_check
         }
 
     def detect_image(self, image_path, output_dir='static/uploads', session_id=None):
@@ -141,7 +234,8 @@ class YOLODetector:
         :param session_id: 会话ID
         :return: 检测结果字典
         """
-        if not self.model:
+        model = self.model
+        if not model:
             return {'success': False, 'message': '模型未加载'}
 
         if session_id is None:
@@ -158,7 +252,7 @@ class YOLODetector:
             output_path = os.path.join(output_dir, output_filename)
 
             # 执行检测
-            results = self.model(image_path)
+            results = get_inference_server(model).predict([image_path])
 
             # 分析疲劳程度
             fatigue_level = self.analyze_fatigue_level(results, session_id)
@@ -185,15 +279,19 @@ class YOLODetector:
         except Exception as e:
             return {'success': False, 'message': f'图片检测失败: {e}'}
 
-    def detect_video(self, video_path, output_dir='static/uploads', session_id=None):
+    def detect_video(self, video_path, output_dir='static/uploads', session_id=None,
+                     stage_workers=None, queue_size=PIPELINE_QUEUE_SIZE):
         """
         检测视频
         :param video_path: 输入视频路径
         :param output_dir: 输出目录
         :param session_id: 会话ID
+        :param stage_workers: 流水线各阶段线程数，如 {'infer': 1, 'annotate': 2}
+        :param queue_size: 流水线阶段之间的队列深度
         :return: 检测结果字典
         """
-        if not self.model:
+        model = self.model
+        if not model:
             return {'success': False, 'message': '模型未加载'}
 
         if session_id is None:
@@ -209,7 +307,7 @@ class YOLODetector:
             output_filename = f"detected_{timestamp}_{filename}"
             output_path = os.path.join(output_dir, output_filename)
 
-            # 执行视频检测（逐帧处理）
+            # 执行视频检测（解码 → 推理 → 绘制 → 编码 流水线处理）
             cap = cv2.VideoCapture(video_path)
             fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
             width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -218,22 +316,39 @@ class YOLODetector:
             # 视频编码器
             fourcc = cv2.VideoWriter_fourcc(*'mp4v')
             out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+            stage_workers = parse_stage_workers(PIPELINE_WORKERS) if stage_workers is None else stage_workers
 
-            frame_results = []
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
+            def decode():
+                while True:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    yield frame
 
-                # 检测当前帧
-                results = self.model(frame, verbose=False)
-                frame_results.extend(results)
+            server = get_inference_server(model)
 
-                # 分析疲劳程度
-                fatigue_level = self.analyze_fatigue_level(results, session_id)
+            def infer(frame):
+                # 检测当前帧，与其他会话共用推理服务
+                return server.predict([frame])
 
+            def annotate(results):
                 # 绘制检测结果
-                annotated_frame = results[0].plot()
+                return results, results[0].plot()
+
+            # 逐帧流式汇总，不保留每帧的 Results
+            accumulator = VideoResultAccumulator()
+            memory = {'start_rss_mb': _rss_mb(), 'job_peak_rss_mb': _rss_mb()}
+
+            def encode(item):
+                results, annotated_frame = item
+                accumulator.add(results)
+                if accumulator.total_frames % RSS_SAMPLE_INTERVAL == 0:
+                    rss = _rss_mb()
+                    if rss is not None and rss > (memory['job_peak_rss_mb'] or 0):
+                        memory['job_peak_rss_mb'] = rss
+
+                # 分析疲劳程度（依赖时间序列，需按帧顺序执行）
+                fatigue_level = self.analyze_fatigue_level(results, session_id)
 
                 # 添加疲劳状态信息
                 cv2.putText(annotated_frame, f"Fatigue: {fatigue_level}", (10, 30),
@@ -241,13 +356,29 @@ class YOLODetector:
 
                 out.write(annotated_frame)
 
-            cap.release()
-            out.release()
+            pipeline = VideoPipeline(decode, [
+                PipelineStage('infer', infer, stage_workers.get('infer', 1)),
+                PipelineStage('annotate', annotate, stage_workers.get('annotate', 1)),
+                PipelineStage('encode', encode, ordered=True),
+            ], queue_size=queue_size)
+
+            try:
+                with model_registry.pinned(model):
+                    pipeline_stats = pipeline.run()
+            finally:
+                cap.release()
+                out.release()
+            print(f"[DEBUG] 流水线瓶颈阶段: {pipeline_stats['bottleneck']}")
 
             # 分析检测结果
-            detection_info = self._analyze_video_results(frame_results)
-            final_fatigue_level = self.fatigue_counters[session_id]['fatigue_level']
+            detection_info = accumulator.summary()
+            memory['process_peak_rss_mb'] = _peak_rss_mb()
+            memory = {key: round(value, 1) if value is not None else None for key, value in memory.items()}
+            print(f"[DEBUG] 视频检测内存: {memory}")
+            final_fatigue_level = self.fatigue_counters[session_id].fatigue_level
             detection_info['fatigue_level'] = final_fatigue_level
+            detection_info['pipeline_stats'] = pipeline_stats
+            detection_info['memory'] = memory
 
             return {
                 'success': True,
@@ -268,10 +399,11 @@ class YOLODetector:
         :param session_id: 会话ID
         :return: 检测结果
         """
-        if not self.model:
+        model = self.model
+        if not model:
             return None
         try:
-            results = self.model(frame, verbose=False)
+            results = get_inference_server(model).predict([frame])
             # 分析疲劳程度
             fatigue_level = self.analyze_fatigue_level(results, session_id)
             print(f"[DEBUG] 当前疲劳等级: {fatigue_level}")  # 添加调试信息
@@ -295,56 +427,24 @@ class YOLODetector:
             'fatigue_indicators': []
         }
 
-        # 标签映射：0=闭眼，1=闭嘴，2=睁眼，3=张嘴
-        class_names = {0: 'closed_eyes', 1: 'closed_mouth', 2: 'open_eyes', 3: 'open_mouth'}
-
         for result in results:
             if result.boxes is not None:
-                boxes = result.boxes
-                detection_info['total_objects'] = len(boxes)
-
-                for box in boxes:
-                    # 获取类别和置信度
-                    cls = int(box.cls[0])
-                    conf = float(box.conf[0])
-                    class_name = class_names.get(cls, f'class_{cls}')
-
-                    detection_info['objects_detected'].append({
-                        'class': class_name,
-                        'confidence': conf,
-                        'class_id': cls
-                    })
-
-                    # 疲劳指标：闭眼(0)和张嘴(3)
-                    if cls in [0, 3]:  # 闭眼或张嘴
-                        detection_info['fatigue_indicators'].append({
-                            'type': class_name,
-                            'confidence': conf
-                        })
+                detection_info['total_objects'] = len(result.boxes)
+
+        # 类别与置信度整批取出后批量构造，疲劳指标为闭眼(0)和张嘴(3)
+        _, cls, conf = batch_arrays(results)
+        detection_info['objects_detected'] = build_detections(cls, conf)
+        detection_info['fatigue_indicators'] = build_fatigue_indicators(cls, conf)
 
         return detection_info
 
     def _analyze_video_results(self, results):
         """
-        分析视频检测结果
+        分析视频检测结果（已有完整结果列表时使用，视频检测过程中由 VideoResultAccumulator 流式汇总）
         """
-        detection_info = {
-            'total_frames': len(results),
-            'frames_with_detections': 0,
-            'total_objects': 0,
-            'fatigue_indicators': []
-        }
-
-        for result in results:
-            if result.boxes is not None and len(result.boxes) > 0:
-                detection_info['frames_with_detections'] += 1
-                detection_info['total_objects'] += len(result.boxes)
-
-                # 分析每一帧的检测结果
-                frame_info = self._analyze_detection_results([result])
-                detection_info['fatigue_indicators'].extend(frame_info['fatigue_indicators'])
-
-        return detection_info
+        accumulator = VideoResultAccumulator()
+        accumulator.add(results)
+        return accumulator.summary()
 
 
 # 全局检测器实例
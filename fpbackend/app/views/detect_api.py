@@ -1,47 +1,73 @@
 from flask import Blueprint, request, jsonify, Response, stream_with_context, session
 from app.utils.database import get_db
 from app.utils.yolo_detector import detector
+from app.utils.model_registry import model_registry, file_sha256
+from app.utils.quantization import quantize_int8, load_int8_report, sample_calibration_frames, CALIBRATION_MAX_FRAMES
+from app.utils.roi_tracker import RoiTracker
+from app.utils.camera_capture import camera_captures, CaptureReader
+from app.utils.postprocess import (count_batch, count_classes, count_arrays, result_arrays, result_xyxy,
+                                   build_detections, CLOSED_EYES, CLOSED_MOUTH, OPEN_EYES, OPEN_MOUTH)
+from app.utils.overlay import overlay_renderer, OverlaySidecar
+from app.utils.video_jobs import video_job_manager, JobQueueFull
+from app.utils.video_io import probe_video, open_video_reader, open_video_writer, io_backend_name, FFMPEG_PRESETS
+from app.utils.sliding_window import SlidingWindowCounter
+from app.utils.session_store import SessionStore, StripedCounterStore, session_registry
+from app.utils.session_records import CameraSessionStats, VideoSessionStats, RealtimeSessionData
+from app.utils.result_cache import result_cache, make_cache_key, RESULT_CACHE_ENABLED
+from app.utils.video_segments import (segment_executor, plan_video_segments, open_segment, SegmentMismatchError,
+                                      MAX_VIDEO_SEGMENTS)
+from app.utils.frame_sampler import AdaptiveFrameSampler, ADAPTIVE_MIN_STRIDE, ADAPTIVE_MAX_STRIDE
+from app.utils.inference_server import get_inference_server, get_inference_stats
+from app.utils.video_pipeline import VideoPipeline, PipelineStage, parse_stage_workers, PIPELINE_QUEUE_SIZE, PIPELINE_WORKERS
 import os
 import cv2
 import uuid
-import shutil
+import base64
+import hashlib
+import numpy as np
 from datetime import datetime
-from ultralytics import YOLO
 import tempfile
 import json
+import zipfile
+import queue
+import threading
 import time
-from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 detect_api = Blueprint('detect_api', __name__)
 
 # 全局变量用于存储检测状态和结果
-# 摄像头检测数据，累计统计
-camera_detection_data = {}  
-# 视频检测数据，累计统计
-video_detection_data = {}   
+# 各会话数据保存在 SessionStore 中，空闲过期或超出上限时自动清理（SESSION_TTL / SESSION_MAX_ENTRIES）；
+# 累计计数使用 session_records 中的 __slots__ 记录，读写方式与 dict 相同
+# 摄像头检测数据，累计统计；检测流线程与各接口并发访问，计数的读改写与读取都经由 camera_counters
+camera_detection_data = SessionStore('camera_detection_data')
+camera_counters = StripedCounterStore(
+    camera_detection_data, lambda: CameraSessionStats(start_time=time.time(), last_update=time.time()))
+# 视频检测数据，累计统计；检测进行中的会话不过期
+video_detection_data = SessionStore('video_detection_data', keep_alive=lambda stats: stats.get('detection_active'))
+video_counters = StripedCounterStore(video_detection_data, lambda: VideoSessionStats(detection_active=True))
 # 摄像头检测开始时间
-camera_start_times = {}     
+camera_start_times = SessionStore('camera_start_times')
 # 存储实时检测结果
-real_time_detection_results = {}
-# 缓存已加载模型，避免重复加载耗时
-_model_cache = {}
+real_time_detection_results = SessionStore('real_time_detection_results')
 # 在文件顶部添加全局变量
 last_play_time = 0
 
-# 实时检测数据存储 - 每0.5秒更新一次
-real_time_detection_data = defaultdict(lambda: {
-    'closed_eyes': deque(maxlen=200),  # 最多保存100秒的数据(200 * 0.5s)
-    'open_mouth': deque(maxlen=200),
-    'open_eyes': deque(maxlen=200),
-    'closed_mouth': deque(maxlen=200),
-    'last_update': 0.0,
-    'last_fatigue_check': 0.0,
-    'current_fatigue_level': 'low',
-    'detection_active': False
-})
+# 实时检测最近时段统计的窗口长度（秒）
+REALTIME_WINDOWS = (10, 60)
+REALTIME_FIELDS = ('closed_eyes', 'open_mouth', 'open_eyes', 'closed_mouth')
+
+
+def _new_realtime_data():
+    """实时检测数据：按秒分桶的滑动窗口，O(1) 查询最近10秒/60秒各类别的检测数"""
+    return RealtimeSessionData(window=SlidingWindowCounter(REALTIME_FIELDS, windows=REALTIME_WINDOWS))
+
+
+# 实时检测数据存储
+real_time_detection_data = SessionStore('real_time_detection_data', default_factory=_new_realtime_data)
 
 # 每5秒生成的完整检测记录
-fatigue_records = defaultdict(list)
+fatigue_records = SessionStore('fatigue_records', default_factory=list)
 
 # 添加全局session管理
 current_detection_session = {
@@ -50,33 +76,43 @@ current_detection_session = {
     'start_time': None
 }
 
-# 全局变量控制检测流状态
-camera_stream_control = {}
+# 全局变量控制检测流状态；检测流运行中的会话不过期
+camera_stream_control = SessionStore('camera_stream_control', keep_alive=lambda control: control.get('active'))
+
+
+@session_registry.on_session_end
+def _on_camera_session_end(session_id, value, reason, store_name):
+    """摄像头统计因空闲过期或超出上限被清理时，一并清理该会话在其他存储中的数据"""
+    if store_name == 'camera_detection_data' and reason != 'ended':
+        session_registry.end_session(session_id)
+
+# 视频检测每批送入模型的帧数，可通过环境变量或请求参数 batch_size 调整
+VIDEO_BATCH_SIZE = int(os.getenv('VIDEO_BATCH_SIZE', 8))
+MAX_VIDEO_BATCH_SIZE = 64
+# 视频流水线参数上限，防止单个请求占用过多线程和内存
+MAX_PIPELINE_QUEUE_SIZE = 32
+MAX_PIPELINE_STAGE_WORKERS = 8
+# 分段并行处理时，等待分段结果期间上报进度（并检查取消）的间隔（秒）
+VIDEO_SEGMENT_POLL_INTERVAL = 0.5
+# 批量图片检测：单次请求的图片数上限、单张图片大小上限、每批推理张数与并行解码线程数
+BATCH_MAX_IMAGES = int(os.getenv('BATCH_MAX_IMAGES', 500))
+BATCH_MAX_IMAGE_MB = float(os.getenv('BATCH_MAX_IMAGE_MB', 20))
+IMAGE_BATCH_SIZE = int(os.getenv('IMAGE_BATCH_SIZE', 16))
+BATCH_DECODE_WORKERS = int(os.getenv('BATCH_DECODE_WORKERS', min(8, os.cpu_count() or 1)))
+IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.bmp'}
+# NDJSON 逐帧结果流的缓冲记录数，消费端读取慢时处理端阻塞等待，不在内存中无限堆积
+NDJSON_QUEUE_SIZE = int(os.getenv('NDJSON_QUEUE_SIZE', 64))
+# NDJSON 流结束标记
+_STREAM_END = object()
 
-def _get_model(model_filename):
-    """按文件名加载或复用YOLO模型"""
-    if model_filename in _model_cache:
-        return _model_cache[model_filename]
-    
-    # 在fpbackend中查找模型文件
-    model_paths = [
-        os.path.join('models', 'uploads', model_filename),
-        os.path.join('..', 'fpdemo', 'models', 'uploads', model_filename),
-        model_filename
-    ]
-    
-    model_path = None
-    for path in model_paths:
-        if os.path.exists(path):
-            model_path = path
-            break
-    
-    if not model_path:
-        raise FileNotFoundError(f"模型文件不存在: {model_filename}")
-    
-    model = YOLO(model_path)
-    _model_cache[model_filename] = model
-    return model
+
+class _StreamClosed(Exception):
+    """NDJSON 结果流的客户端已断开"""
+
+
+def _get_model(model_filename, backend=None):
+    """按文件名从统一模型注册表加载或复用YOLO模型，backend 为空时使用该模型的默认后端"""
+    return model_registry.get(model_filename, backend)
 
 def _analyze_fatigue_level_camera(total_seconds, closed_eyes_count, open_mouth_count):
     """摄像头检测疲劳分析 - 基于每秒行为频率的四级判断"""
@@ -124,24 +160,13 @@ def _analyze_fatigue_level_simple(results):
     for result in results:
         if result.boxes is not None:
             current_stats['total_objects'] = len(result.boxes)
-            for box in result.boxes:
-                # 安全地访问tensor数据
-                try:
-                    cls = int(box.cls.item()) if hasattr(box.cls, 'item') else int(box.cls[0] if len(box.cls.shape) > 0 else box.cls)
-                    conf = float(box.conf.item()) if hasattr(box.conf, 'item') else float(box.conf[0] if len(box.conf.shape) > 0 else box.conf)
-                    
-                    if conf > 0.5:  # 置信度阈值
-                        if cls == 0:  # 闭眼
-                            current_stats['closed_eyes'] += 1
-                        elif cls == 1:  # 闭嘴
-                            current_stats['closed_mouth'] += 1
-                        elif cls == 2:  # 睁眼
-                            current_stats['open_eyes'] += 1
-                        elif cls == 3:  # 张嘴
-                            current_stats['open_mouth'] += 1
-                except (IndexError, RuntimeError, ValueError) as e:
-                    print(f"[DEBUG] 跳过无效的检测结果: {e}")
-                    continue
+    
+    # 置信度阈值 0.5
+    counts = count_classes(results)
+    current_stats['closed_eyes'] = int(counts[CLOSED_EYES])
+    current_stats['closed_mouth'] = int(counts[CLOSED_MOUTH])
+    current_stats['open_eyes'] = int(counts[OPEN_EYES])
+    current_stats['open_mouth'] = int(counts[OPEN_MOUTH])
     
     # 简单的疲劳程度判断 - 基于当前检测结果
     if current_stats['closed_eyes'] >= 2 or current_stats['open_mouth'] >= 1:
@@ -169,7 +194,8 @@ def _analyze_fatigue_level_simple(results):
 
 def _get_video_detection_stats(session_id):
     """获取视频检测统计数据"""
-    if session_id not in video_detection_data:
+    stats = video_counters.snapshot(session_id)
+    if stats is None:
         return {
             'total_detections': 0,
             'closed_eyes_count': 0,
@@ -182,8 +208,10 @@ def _get_video_detection_stats(session_id):
             'fatigue_level': 'none'
         }
     
-    stats = video_detection_data[session_id]
-    
+    return _summarize_video_stats(stats)
+
+def _summarize_video_stats(stats):
+    """由累计计数生成视频统计摘要（疲劳等级、疲劳指标等）"""
     # 基于总帧数和FPS估算总时长
     total_seconds = stats['total_frames'] / 25.0  # 假设25FPS
     
@@ -208,9 +236,15 @@ def _get_video_detection_stats(session_id):
         'open_eyes_count': stats['open_eyes_count'],
         'closed_mouth_count': stats['closed_mouth_count'],
         'fatigue_indicators': fatigue_indicators,
-        'detection_active': stats['detection_active'],
+        'detection_active': stats.get('detection_active', False),
         'total_frames': stats['total_frames'],
-        'fatigue_level': fatigue_level
+        'frames_with_detections': stats.get('frames_with_detections', 0),
+        'fatigue_level': fatigue_level,
+        'pipeline_stats': stats.get('pipeline_stats', {}),
+        'segment_stats': stats.get('segment_stats', {}),
+        'video_io': stats.get('video_io', {}),
+        'sampling_stats': stats.get('sampling_stats', {}),
+        'roi_stats': stats.get('roi_stats', {})
     }
 
 def _save_detection_result(username, method, result, fatigue_level, details, confidence=0.0, duration=0.0):
@@ -239,13 +273,38 @@ def _save_detection_result(username, method, result, fatigue_level, details, con
         print(f"保存检测结果失败: {e}")
         return False
 
+def _save_detection_results(records):
+    """
+    批量保存检测结果，一次写入数据库
+    :param records: [(username, method, result, fatigue_level, details, confidence, duration)]
+    """
+    try:
+        db = get_db()
+        if db:
+            sql = """
+            INSERT INTO detection_record 
+            (username, timestamp, method, result, fatigue_level, status, details, confidence, duration) 
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """
+            now = datetime.now()
+            db.execute_many(sql, [
+                (username, now, method, result, fatigue_level, 'completed', details, confidence, duration)
+                for username, method, result, fatigue_level, details, confidence, duration in records
+            ])
+            return True
+    except Exception as e:
+        print(f"批量保存检测结果失败: {e}")
+        return False
+
 @detect_api.route('/api/detect', methods=['POST'])
 def detect_file():
     """通用检测接口：支持图片/视频文件，使用指定.pt模型"""
+    session_id = None
     try:
         upload_file = request.files.get('file')
         stream_url = request.form.get('url', '').strip()
         model_name = request.form.get('model', '').strip()
+        backend = request.form.get('backend', '').strip() or None
         
         # 获取用户信息
         username = request.form.get('username', '').strip()
@@ -260,9 +319,67 @@ def detect_file():
         if not username:
             return jsonify({'success': False, 'message': '缺少用户信息'}), 400
         
-        # 准备临时路径
+        # 视频批量推理的批大小
+        try:
+            batch_size = int(request.form.get('batch_size', VIDEO_BATCH_SIZE))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'batch_size 必须为整数'}), 400
+        batch_size = min(max(batch_size, 1), MAX_VIDEO_BATCH_SIZE)
+        
+        # 视频流水线配置：队列深度与各阶段线程数
+        try:
+            queue_size = int(request.form.get('pipeline_queue_size', PIPELINE_QUEUE_SIZE))
+            stage_workers = parse_stage_workers(PIPELINE_WORKERS)
+            stage_workers.update(parse_stage_workers(request.form.get('pipeline_workers', '')))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': f'流水线参数无效: {e}'}), 400
+        queue_size = min(max(queue_size, 1), MAX_PIPELINE_QUEUE_SIZE)
+        stage_workers = {name: min(count, MAX_PIPELINE_STAGE_WORKERS) for name, count in stage_workers.items()}
+        
+        # 视频采样模式：full 逐帧处理，adaptive 按疲劳状态自适应跳帧
+        sampling = request.form.get('sampling', 'full').strip().lower()
+        if sampling not in ('full', 'adaptive'):
+            return jsonify({'success': False, 'message': f'不支持的采样模式: {sampling}'}), 400
+        try:
+            min_stride = int(request.form.get('min_stride', ADAPTIVE_MIN_STRIDE))
+            max_stride = int(request.form.get('max_stride', ADAPTIVE_MAX_STRIDE))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'min_stride/max_stride 必须为整数'}), 400
+        
+        # 人脸区域跟踪：整帧定位后只在人脸附近的裁剪区域推理
+        roi_mode = request.form.get('roi', '').strip().lower() in ('1', 'true', 'yes')
+        
+        # 视频输出模式：video 输出标注视频，stats 只返回统计和逐秒时间线，
+        # sidecar 保留原视频并输出叠加层旁路文件，由前端在画布上绘制
+        output_mode = request.form.get('output_mode', 'video').strip().lower()
+        if output_mode not in ('video', 'stats', 'sidecar'):
+            return jsonify({'success': False, 'message': f'不支持的输出模式: {output_mode}'}), 400
+        
+        # 长视频分段并行处理的分段数，默认 1 不分段；需要时显式传入，如 segments=VIDEO_SEGMENT_WORKERS
+        try:
+            segments = int(request.form.get('segments', 1))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'segments 必须为整数'}), 400
+        segments = min(max(segments, 1), MAX_VIDEO_SEGMENTS)
+        
+        # 输出视频的 H.264 编码参数（使用 ffmpeg 编码时生效）：速度预设与 CRF 质量
+        encoder = {}
+        video_preset = request.form.get('video_preset', '').strip().lower()
+        if video_preset:
+            if video_preset not in FFMPEG_PRESETS:
+                return jsonify({'success': False, 'message': f'不支持的编码预设: {video_preset}'}), 400
+            encoder['preset'] = video_preset
+        if request.form.get('video_crf', '').strip():
+            try:
+                encoder['crf'] = min(max(int(request.form.get('video_crf')), 0), 51)
+            except ValueError:
+                return jsonify({'success': False, 'message': 'video_crf 必须为整数'}), 400
+        
+        # 准备临时路径，图片不落盘，只有视频保存到上传目录
         tmp_dir = 'static/uploads'
         os.makedirs(tmp_dir, exist_ok=True)
+        video_exts = {'.mp4', '.avi', '.mov', '.mkv'}
+        tmp_path = image_bytes = None
         
         # 如果是文件上传
         if upload_file:
@@ -289,9 +406,12 @@ def detect_file():
             if ext not in supported_formats:
                 return jsonify({'success': False, 'message': f'不支持的文件格式: {ext}，支持的格式: {list(supported_formats)}'}), 400
             
-            tmp_filename = f"detect_{uuid.uuid4().hex}{ext}"
-            tmp_path = os.path.join(tmp_dir, tmp_filename)
-            upload_file.save(tmp_path)
+            if ext in video_exts:
+                tmp_filename = f"detect_{uuid.uuid4().hex}{ext}"
+                tmp_path = os.path.join(tmp_dir, tmp_filename)
+                upload_file.save(tmp_path)
+            else:
+                image_bytes = upload_file.read()
         else:
             # 通过 URL 下载
             import requests as _req
@@ -299,120 +419,135 @@ def detect_file():
             if ext == '' or ext not in {'.jpg', '.jpeg', '.png', '.bmp', '.mp4', '.avi', '.mov', '.mkv'}:
                 ext = '.jpg'  # 默认按图片处理
             
-            tmp_filename = f"detect_{uuid.uuid4().hex}{ext}"
-            tmp_path = os.path.join(tmp_dir, tmp_filename)
-            
             try:
                 r = _req.get(stream_url, timeout=10, stream=True)
                 r.raise_for_status()
-                with open(tmp_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
+                if ext in video_exts:
+                    tmp_filename = f"detect_{uuid.uuid4().hex}{ext}"
+                    tmp_path = os.path.join(tmp_dir, tmp_filename)
+                    with open(tmp_path, 'wb') as f:
+                        for chunk in r.iter_content(chunk_size=8192):
+                            f.write(chunk)
+                else:
+                    image_bytes = r.content
             except Exception as dl_e:
                 return jsonify({'success': False, 'message': f'URL 下载失败: {dl_e}'}), 400
         
-        # 判断是否为视频文件
-        video_exts = {'.mp4', '.avi', '.mov', '.mkv'}
-        is_video = os.path.splitext(tmp_path)[1].lower() in video_exts
+        # 判断是否为视频文件；图片直接从内存解码
+        is_video = tmp_path is not None
+        image = None
+        if not is_video:
+            image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                return jsonify({'success': False, 'message': '无法解码图片文件'}), 400
+        # inline 时结果图片以 base64 随响应返回，不写文件
+        inline = not is_video and request.form.get('inline', '').strip().lower() in ('1', 'true', 'yes')
+        source_name = upload_file.filename if upload_file else stream_url
         
-        model = _get_model(model_name)
         session_id = str(uuid.uuid4())
+        async_mode = is_video and request.form.get('async', '').strip().lower() in ('1', 'true', 'yes')
+        
+        try:
+            if async_mode:
+                # 异步任务在工作进程中加载模型，这里只校验模型和后端
+                model = None
+                model_registry.resolve_backend(model_name, backend)
+                model_registry.resolve_path(model_name)
+            else:
+                model = _get_model(model_name, backend)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        options = {}
+        if is_video:
+            options = {
+                'batch_size': batch_size,
+                'stage_workers': stage_workers,
+                'queue_size': queue_size,
+                'sampling': sampling,
+                'min_stride': min_stride,
+                'max_stride': max_stride,
+                'roi': roi_mode,
+                'output_mode': output_mode,
+                'segments': segments,
+                'encoder': encoder,
+                'model_name': model_name,
+                'backend': backend
+            }
+        
+        # 相同文件、模型和参数的检测直接返回已有结果，并发的相同请求只处理一次
+        # 内联返回的结果不产生文件，不进入缓存；旁路文件模式的结果引用本次上传的原视频（不在结果目录中），也不缓存
+        use_cache = RESULT_CACHE_ENABLED and not inline and not (is_video and output_mode == 'sidecar') and \
+            request.form.get('cache', '1').strip().lower() not in ('0', 'false', 'no')
+        if use_cache:
+            content_hash = file_sha256(tmp_path) if is_video else hashlib.sha256(image_bytes).hexdigest()
+            cache_key = make_cache_key(content_hash, model_registry.resolve(model_name)[1],
+                                       _result_cache_params(is_video, model_registry.resolve_backend(model_name, backend),
+                                                            options))
+            cached = _get_cached_result(cache_key, session_id, async_mode, tmp_path, username, source_name,
+                                        'video' if is_video else 'image')
+            if cached is not None:
+                return cached
         
         if is_video:
             # 视频检测
-            static_dest_dir = os.path.join('static', 'uploads', 'results')
-            processed_path = _predict_video(tmp_path, model, static_dest_dir, session_id)
-            
-            # 生成相对于后端服务的URL路径
-            relative_path = os.path.relpath(processed_path, 'static').replace('\\', '/')
-            output_url = f'/static/{relative_path}'
-            
-            # 获取视频检测的最终统计结果
-            final_stats = _get_video_detection_stats(session_id)
-            
-            # 判断疲劳级别 - 使用统一的分析函数
-            total_frames = final_stats.get('total_frames', 0)
-            total_seconds = total_frames / 25.0  # 假设25FPS
-            fatigue_level = _analyze_fatigue_level_camera(
-                total_seconds,
-                final_stats['closed_eyes_count'],
-                final_stats['open_mouth_count']
-            )
-            
-            # 保存检测结果（所有用户都可以保存）
-            _save_detection_result(
-                username,
-                'video',
-                'completed',
-                fatigue_level,
-                f'视频检测完成，文件: {upload_file.filename if upload_file else stream_url}',
-                0.8,
-                0.0
-            )
+            if not async_mode:
+                response = _run_video_detection(session_id, tmp_path, model, username, source_name, options)
+                result_cache.complete(session_id, response, _result_files(response))
+                return jsonify(response)
             
+            # 异步任务：立即返回任务ID，由进程池处理，进度通过 /api/get_video_stats 或 /api/detect/jobs 查询
+            try:
+                job = video_job_manager.submit(session_id, _run_video_job, {
+                    'session_id': session_id,
+                    'video_path': tmp_path,
+                    'model_name': model_name,
+                    'backend': backend,
+                    'username': username,
+                    'source_name': source_name,
+                    'options': options
+                }, on_done=_on_video_job_done)
+            except JobQueueFull as e:
+                result_cache.abandon(session_id)
+                return jsonify({'success': False, 'message': str(e)}), 429
             return jsonify({
                 'success': True,
-                'message': '视频检测完成',
-                'output_path': output_url,
-                'fatigue_level': fatigue_level,
-                'detection_info': final_stats,
-                'method': 'video',
-                'session_id': session_id
-            })
+                'message': '视频检测任务已提交',
+                'job_id': session_id,
+                'session_id': session_id,
+                'status': job['status'],
+                'method': 'video'
+            }), 202
         
-        # 图片检测
-        results = model.predict(source=tmp_path, save=True, conf=0.5, imgsz=(640, 640), show_conf=True)
+        # 图片检测：在内存中推理并直接在解码图上绘制检测框，不经过 runs/detect
+        with model_registry.pinned(model):
+            results = [get_inference_server(model).submit(image, conf=0.5, imgsz=(640, 640)).result()]
         
         # 分析疲劳程度 - 使用简单分析方法
         analysis_result = _analyze_fatigue_level_simple(results)
         fatigue_level = analysis_result['fatigue_level']
         
-        # 处理图片检测结果
-        output_url = None
-        
-        # YOLO 会把输出保存到 runs/detect/predict* 目录，找到最新生成的文件
-        output_dir = None
-        run_root = os.path.join(os.getcwd(), 'runs', 'detect')
-        if os.path.exists(run_root):
-            output_dirs = sorted([os.path.join(run_root, d) for d in os.listdir(run_root)], 
-                               key=os.path.getmtime, reverse=True)
-            if output_dirs:
-                output_dir = output_dirs[0]
-        
-        if output_dir:
-            # 创建结果目录
-            static_dest_dir = os.path.join('static', 'uploads', 'results')
-            os.makedirs(static_dest_dir, exist_ok=True)
-            
-            # 查找并复制检测结果图片
-            for fname in os.listdir(output_dir):
-                if fname.startswith(os.path.splitext(os.path.basename(tmp_path))[0]):
-                    output_path = os.path.join(output_dir, fname)
-                    
-                    # 生成新的文件名，避免冲突
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    new_filename = f"result_{timestamp}_{fname}"
-                    dest_path = os.path.join(static_dest_dir, new_filename)
-                    
-                    # 复制文件
-                    shutil.copy(output_path, dest_path)
-                    
-                    # 生成相对于后端服务的URL路径
-                    relative_path = os.path.relpath(dest_path, 'static').replace('\\', '/')
-                    output_url = f'/static/{relative_path}'
-                    break
-        
-        # 如果没有找到YOLO输出，使用原始图片
-        if not output_url:
-            # 直接使用原始图片作为输出
+        cls, conf = result_arrays(results[0])
+        overlay_renderer.draw_boxes(image, result_xyxy(results[0]), cls, conf, results[0].names)
+        out_ext = '.jpg' if ext in ('.jpg', '.jpeg') else ext
+        ok, encoded = cv2.imencode(out_ext, image)
+        if not ok:
+            raise RuntimeError("结果图片编码失败")
+        
+        # 只写出一个结果文件，或以 base64 内联返回
+        output_url = output_image = None
+        if inline:
+            mime = 'jpeg' if out_ext == '.jpg' else out_ext[1:]
+            output_image = f"data:image/{mime};base64," + base64.b64encode(encoded.tobytes()).decode('ascii')
+        else:
             static_dest_dir = os.path.join('static', 'uploads', 'results')
             os.makedirs(static_dest_dir, exist_ok=True)
             
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            new_filename = f"result_{timestamp}_{os.path.basename(tmp_path)}"
+            new_filename = f"result_{timestamp}_detect_{uuid.uuid4().hex}{out_ext}"
             dest_path = os.path.join(static_dest_dir, new_filename)
-            
-            shutil.copy(tmp_path, dest_path)
+            with open(dest_path, 'wb') as f:
+                f.write(encoded.tobytes())
             
             relative_path = os.path.relpath(dest_path, 'static').replace('\\', '/')
             output_url = f'/static/{relative_path}'
@@ -423,12 +558,12 @@ def detect_file():
             'image',
             'completed',
             fatigue_level,
-            f'图片检测完成，文件: {upload_file.filename if upload_file else stream_url}',
+            f'图片检测完成，文件: {source_name}',
             0.8,
             0.0
         )
         
-        return jsonify({
+        response = {
             'success': True,
             'message': '图片检测完成',
             'output_path': output_url,
@@ -446,186 +581,867 @@ def detect_file():
                 ],
                 'fatigue_indicators': analysis_result['fatigue_indicators']
             }
-        })
+        }
+        if output_image:
+            response['output_image'] = output_image
+        result_cache.complete(session_id, response, _result_files(response))
+        return jsonify(response)
         
     except Exception as e:
         print(f"检测失败: {e}")
+        if session_id:
+            result_cache.abandon(session_id)
         return jsonify({'success': False, 'message': f'检测失败: {e}'}), 500
 
-def _predict_video(video_path: str, model, dest_dir: str, session_id: str) -> str:
-    """逐帧推理视频并累计统计，返回结果视频绝对路径"""
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise RuntimeError("无法打开视频文件")
+def _result_cache_params(is_video, backend, options):
+    """参与缓存键的检测参数：只包含影响检测结果或输出文件的参数，批大小、流水线和分段等不影响结果的参数不计入"""
+    params = {'kind': 'video' if is_video else 'image', 'backend': backend, 'conf': 0.5, 'imgsz': 640}
+    if is_video:
+        params.update({
+            'output_mode': options['output_mode'],
+            'sampling': options['sampling'],
+            'roi': options['roi']
+        })
+        if options['sampling'] == 'adaptive':
+            params.update({'min_stride': options['min_stride'], 'max_stride': options['max_stride']})
+        if options['output_mode'] == 'video':
+            params['encoder'] = options.get('encoder') or {}
+    return params
+
+def _result_files(response):
+    """响应引用的本地结果文件（输出视频/图片、旁路文件）"""
+    return [os.path.join('static', url[len('/static/'):])
+            for url in (response.get('output_path'), response.get('sidecar_path'))
+            if url and url.startswith('/static/')]
+
+def _get_cached_result(cache_key, session_id, async_mode, upload_path, username, source_name, method):
+    """
+    查询结果缓存并合并相同请求
+    命中缓存或等到相同请求的结果时返回 Flask 响应；否则由本请求处理，返回 None
+    （已登记为处理方时完成后写入缓存，未登记时独立处理，不影响正在处理的请求）
+    """
+    response = result_cache.get(cache_key)
+    if response is None:
+        leader = result_cache.acquire(cache_key, session_id, is_job=async_mode)
+        if leader is None:
+            return None
+        if leader['is_job']:
+            # 相同视频已有异步任务在处理，同步请求也直接返回该任务，由前端轮询，不在请求中长时间等待
+            job = video_job_manager.get(leader['owner'])
+            if job is None:
+                print(f"[DEBUG] 合并的任务不存在，独立处理: {leader['owner']}")
+                return None
+            _discard_upload(upload_path)
+            print(f"[DEBUG] 合并相同视频任务: {leader['owner']}")
+            return jsonify({
+                'success': True,
+                'message': '相同视频正在检测中',
+                'job_id': leader['owner'],
+                'session_id': leader['owner'],
+                'status': job['status'],
+                'method': 'video',
+                'coalesced': True
+            }), 202
+        if async_mode:
+            # 异步请求不等待同步处理中的请求，独立提交任务
+            return None
+        response = result_cache.wait(cache_key)
+        if response is None:
+            # 被合并的请求失败或超时：重新登记；已有其他请求接手时独立处理
+            leader = result_cache.acquire(cache_key, session_id, is_job=async_mode)
+            if leader is not None:
+                print(f"[DEBUG] 相同请求已由 {leader['owner']} 接手处理，独立处理")
+            return None
     
+    # 本次上传与缓存结果内容相同，不再保留
+    _discard_upload(upload_path)
+    print(f"[DEBUG] 检测结果缓存命中: {cache_key[:12]}")
+    _save_detection_result(
+        username,
+        method,
+        'completed',
+        response.get('fatigue_level', 'none'),
+        f"{'视频' if method == 'video' else '图片'}检测完成（缓存结果），文件: {source_name}",
+        0.8,
+        0.0
+    )
+    return jsonify(dict(response, cached=True))
+
+def _discard_upload(path):
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+@detect_api.route('/api/detect/batch', methods=['POST'])
+def detect_batch():
+    """批量图片检测：接收多张图片（files）或 zip 包，并行解码、分批推理，返回逐张疲劳结果和标注图片压缩包"""
+    try:
+        uploads = request.files.getlist('files') + request.files.getlist('file')
+        model_name = request.form.get('model', '').strip()
+        backend = request.form.get('backend', '').strip() or None
+        username = request.form.get('username', '').strip()
+        
+        if not uploads:
+            return jsonify({'success': False, 'message': '未检测到上传文件'}), 400
+        if not model_name:
+            return jsonify({'success': False, 'message': '缺少模型文件名'}), 400
+        if not username:
+            return jsonify({'success': False, 'message': '缺少用户信息'}), 400
+        
+        try:
+            batch_size = int(request.form.get('batch_size', IMAGE_BATCH_SIZE))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'batch_size 必须为整数'}), 400
+        batch_size = min(max(batch_size, 1), MAX_VIDEO_BATCH_SIZE)
+        
+        try:
+            model = _get_model(model_name, backend)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        static_dest_dir = os.path.join('static', 'uploads', 'results')
+        os.makedirs(static_dest_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        archive_path = os.path.join(static_dest_dir, f"batch_{timestamp}_{uuid.uuid4().hex}.zip")
+        
+        results, failed = [], []
+        server = get_inference_server(model)
+        with ThreadPoolExecutor(max_workers=max(1, BATCH_DECODE_WORKERS)) as pool, \
+                zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_STORED) as archive, \
+                model_registry.pinned(model):
+            chunk = []
+            for name, data, error in _iter_batch_images(uploads):
+                if error:
+                    failed.append({'name': name, 'message': error})
+                    continue
+                if len(results) + len(chunk) >= BATCH_MAX_IMAGES:
+                    failed.append({'name': name, 'message': f'超过单次批量检测上限 {BATCH_MAX_IMAGES} 张'})
+                    continue
+                chunk.append((name, data))
+                if len(chunk) >= batch_size:
+                    _detect_image_chunk(chunk, server, pool, archive, results, failed)
+                    chunk = []
+            if chunk:
+                _detect_image_chunk(chunk, server, pool, archive, results, failed)
+            
+            if results:
+                archive.writestr('results.json', json.dumps({'results': results, 'failed': failed},
+                                                            ensure_ascii=False, indent=2))
+        
+        if not results:
+            _discard_upload(archive_path)
+            return jsonify({'success': False, 'message': '没有可检测的图片', 'failed': failed}), 400
+        
+        # 所有检测记录一次写入数据库
+        _save_detection_results([
+            (username, 'image', 'completed', item['fatigue_level'], f"批量图片检测完成，文件: {item['name']}", 0.8, 0.0)
+            for item in results
+        ])
+        
+        summary = {level: 0 for level in ('low', 'medium', 'high')}
+        for item in results:
+            summary[item['fatigue_level']] = summary.get(item['fatigue_level'], 0) + 1
+        relative_path = os.path.relpath(archive_path, 'static').replace('\\', '/')
+        return jsonify({
+            'success': True,
+            'message': f'批量检测完成，成功 {len(results)} 张，失败 {len(failed)} 张',
+            'total': len(results),
+            'summary': summary,
+            'results': results,
+            'failed': failed,
+            'archive_path': f'/static/{relative_path}'
+        })
+    
+    except Exception as e:
+        print(f"批量检测失败: {e}")
+        return jsonify({'success': False, 'message': f'批量检测失败: {e}'}), 500
+
+def _iter_batch_images(uploads):
+    """展开上传的图片和 zip 包，逐个产出 (文件名, 图片字节, 错误信息)"""
+    max_bytes = int(BATCH_MAX_IMAGE_MB * 1024 * 1024)
+    for upload in uploads:
+        name = upload.filename or ''
+        ext = os.path.splitext(name)[1].lower()
+        if ext == '.zip':
+            try:
+                with zipfile.ZipFile(upload.stream) as archive:
+                    for info in archive.infolist():
+                        base_name = os.path.basename(info.filename)
+                        if info.is_dir() or base_name.startswith('.') or info.filename.startswith('__MACOSX/'):
+                            continue
+                        if os.path.splitext(base_name)[1].lower() not in IMAGE_EXTS:
+                            continue
+                        if info.file_size > max_bytes:
+                            yield info.filename, None, f'图片超过 {BATCH_MAX_IMAGE_MB:g}MB'
+                            continue
+                        # 声明的大小可被伪造，按实际解压出的字节数限制
+                        with archive.open(info) as f:
+                            data = f.read(max_bytes + 1)
+                        if len(data) > max_bytes:
+                            yield info.filename, None, f'图片超过 {BATCH_MAX_IMAGE_MB:g}MB'
+                            continue
+                        yield info.filename, data, None
+            except zipfile.BadZipFile:
+                yield name, None, '无效的 zip 文件'
+        elif ext in IMAGE_EXTS:
+            data = upload.read(max_bytes + 1)
+            if len(data) > max_bytes:
+                yield name, None, f'图片超过 {BATCH_MAX_IMAGE_MB:g}MB'
+            else:
+                yield name, data, None
+        else:
+            yield name, None, f'不支持的文件格式: {ext}'
+
+def _decode_image(data):
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+def _encode_image(item):
+    image, ext = item
+    ok, encoded = cv2.imencode(ext, image)
+    return encoded.tobytes() if ok else None
+
+def _detect_image_chunk(chunk, server, pool, archive, results, failed):
+    """
+    检测一批图片：线程池并行解码，整批送入推理服务，逐张分析疲劳程度并绘制检测框，
+    并行编码后写入结果压缩包；解码或编码失败的图片记入 failed，不出现在 results 中
+    :param chunk: [(文件名, 图片字节)]
+    """
+    images = []
+    for (name, _), image in zip(chunk, pool.map(_decode_image, [data for _, data in chunk])):
+        if image is None:
+            failed.append({'name': name, 'message': '无法解码图片文件'})
+        else:
+            images.append((name, image))
+    if not images:
+        return
+    
+    predictions = server.predict([image for _, image in images], conf=0.5, imgsz=(640, 640))
+    
+    analyses, outputs = [], []
+    for (name, image), result in zip(images, predictions):
+        analyses.append(_analyze_fatigue_level_simple([result]))
+        cls, conf = result_arrays(result)
+        overlay_renderer.draw_boxes(image, result_xyxy(result), cls, conf, result.names)
+        
+        ext = os.path.splitext(name)[1].lower()
+        outputs.append((image, '.jpg' if ext in ('.jpg', '.jpeg') else ext))
+    
+    # 编码成功写入压缩包后才记入结果，序号与压缩包中的文件一一对应
+    for (name, _), analysis_result, (_, out_ext), encoded in zip(images, analyses, outputs,
+                                                                 pool.map(_encode_image, outputs)):
+        if encoded is None:
+            failed.append({'name': name, 'message': '结果图片编码失败'})
+            continue
+        index = len(results)
+        output_name = f"{index + 1:04d}_{os.path.splitext(os.path.basename(name))[0]}{out_ext}"
+        archive.writestr(output_name, encoded)
+        results.append({
+            'index': index,
+            'name': name,
+            'output_name': output_name,
+            'fatigue_level': analysis_result['fatigue_level'],
+            'detection_info': dict(analysis_result['current_stats'],
+                                   fatigue_indicators=analysis_result['fatigue_indicators'])
+        })
+
+def _run_video_detection(session_id, video_path, model, username, source_name, options, progress=None):
+    """
+    执行一次视频检测并保存记录，返回 /api/detect 的响应内容
+    同步请求和异步任务（工作进程内）共用
+    :param model: 已加载的模型，为 None 时按 options 中的 model_name/backend 加载
+    :param options: 批大小、流水线、采样、ROI、输出模式与分段等检测参数
+    :param progress: 进度上报回调 progress(已处理帧数, 总帧数, 当前统计)
+    """
+    output_mode = options.get('output_mode', 'video')
+    static_dest_dir = os.path.join('static', 'uploads', 'results')
+    sampler = None
+    if options.get('sampling') == 'adaptive':
+        sampler = AdaptiveFrameSampler(options.get('min_stride', ADAPTIVE_MIN_STRIDE),
+                                       options.get('max_stride', ADAPTIVE_MAX_STRIDE))
+    
+    # 长视频分段并行推理；自适应采样和人脸区域跟踪依赖前序帧的状态，只能顺序处理
+    segments = [(0, None)]
+    keyframe_aligned = False
+    if sampler is None and not options.get('roi') and options.get('model_name'):
+        segments, keyframe_aligned = plan_video_segments(video_path, options.get('segments', 1))
+    
+    if len(segments) > 1:
+        try:
+            processed_path = _predict_video_segments(video_path, options['model_name'], options.get('backend'),
+                                                     static_dest_dir, session_id, segments,
+                                                     options.get('batch_size', VIDEO_BATCH_SIZE), output_mode,
+                                                     progress, keyframe_aligned, options.get('encoder'))
+        except SegmentMismatchError as e:
+            # 分段结果对不上时丢弃已拼接的统计，改为顺序处理整段视频
+            print(f"[ERROR] 分段处理结果不一致，改为顺序处理: {e}")
+            video_detection_data.pop(session_id, None)
+            segments = [(0, None)]
+    if len(segments) <= 1:
+        if model is None:
+            model = _get_model(options['model_name'], options.get('backend'))
+        processed_path = _predict_video(video_path, model, static_dest_dir, session_id,
+                                        options.get('batch_size', VIDEO_BATCH_SIZE),
+                                        options.get('stage_workers'),
+                                        options.get('queue_size', PIPELINE_QUEUE_SIZE), sampler,
+                                        RoiTracker() if options.get('roi') else None, output_mode, progress,
+                                        options.get('encoder'))
+    
+    # 生成相对于后端服务的URL路径，仅统计模式下没有输出视频
+    output_url = sidecar_url = None
+    if output_mode == 'sidecar':
+        # 旁路模式播放原视频，叠加层由前端根据旁路文件绘制
+        output_url = '/static/' + os.path.relpath(video_path, 'static').replace('\\', '/')
+        sidecar_url = '/static/' + os.path.relpath(processed_path, 'static').replace('\\', '/')
+    elif processed_path:
+        relative_path = os.path.relpath(processed_path, 'static').replace('\\', '/')
+        output_url = f'/static/{relative_path}'
+    
+    # 获取视频检测的最终统计结果
+    final_stats = _get_video_detection_stats(session_id)
+    
+    # 判断疲劳级别 - 使用统一的分析函数
+    total_frames = final_stats.get('total_frames', 0)
+    total_seconds = total_frames / 25.0  # 假设25FPS
+    fatigue_level = _analyze_fatigue_level_camera(
+        total_seconds,
+        final_stats['closed_eyes_count'],
+        final_stats['open_mouth_count']
+    )
+    
+    # 保存检测结果（所有用户都可以保存）
+    _save_detection_result(
+        username,
+        'video',
+        'completed',
+        fatigue_level,
+        f'视频检测完成，文件: {source_name}',
+        0.8,
+        0.0
+    )
+    
+    response = {
+        'success': True,
+        'message': '视频检测完成',
+        'output_path': output_url,
+        'fatigue_level': fatigue_level,
+        'detection_info': final_stats,
+        'method': 'video',
+        'output_mode': output_mode,
+        'session_id': session_id
+    }
+    if output_mode == 'stats':
+        response['timeline'] = video_detection_data[session_id].get('timeline', [])
+    if sidecar_url:
+        response['sidecar_path'] = sidecar_url
+    return response
+
+def _run_video_job(session_id, video_path, model_name, backend, username, source_name, options, progress=None):
+    """视频任务入口，在工作进程中执行：模型由 _run_video_detection 按需在进程内加载，分段处理时只在分段进程中加载"""
+    options = dict(options, model_name=model_name, backend=backend)
+    try:
+        return _run_video_detection(session_id, video_path, None, username, source_name, options, progress)
+    finally:
+        # 结果已随返回值回传，工作进程内不再保留该会话数据
+        video_detection_data.pop(session_id, None)
+
+def _on_video_job_done(job):
+    """任务结束后在 Web 进程中保存最终统计，供 /api/get_video_stats 查询，成功的结果同时写入结果缓存"""
+    stats = job.get('stats') or {}
+    if job['status'] == 'completed':
+        stats = job['result'].get('detection_info', stats)
+        result_cache.complete(job['job_id'], job['result'], _result_files(job['result']))
+    else:
+        result_cache.abandon(job['job_id'])
+    if stats:
+        video_detection_data[job['job_id']] = VideoSessionStats.from_dict(stats, detection_active=False)
+
+def _predict_video(video_path: str, model, dest_dir: str, session_id: str, batch_size: int = VIDEO_BATCH_SIZE,
+                   stage_workers=None, queue_size: int = PIPELINE_QUEUE_SIZE, sampler=None,
+                   roi_tracker=None, output_mode='video', progress=None, encoder=None, frame_sink=None):
+    """流水线方式推理视频并累计统计，返回结果视频绝对路径
+
+    解码 → 推理 → 绘制 → 编码 四个阶段通过有界队列衔接并发执行，
+    解码按 batch_size 凑批送入模型，编码阶段按原始帧顺序累计统计并写入。
+    传入 AdaptiveFrameSampler 时按疲劳状态自适应跳帧，未采样的帧只 grab() 不解码，
+    每个采样帧的统计按其代表的源帧数加权，使疲劳等级与逐帧处理可比；
+    此时解码与推理逐帧同步进行，每帧的检测结果立即决定其后跳过的帧数，不受队列中积压帧的影响。
+    传入 RoiTracker 时在人脸区域裁剪图上推理，跟踪状态依赖前序帧，推理阶段固定为单线程。
+    output_mode 为 stats 时不绘制也不写出视频，只累计统计和逐秒时间线，返回 None；
+    为 sidecar 时不改动原视频，只把逐帧检测框和疲劳等级写入 JSON 旁路文件，返回旁路文件路径。
+    progress(已处理帧数, 总帧数, 当前统计) 在编码阶段按帧序调用，抛出异常可中止处理（如任务取消）。
+    有 ffmpeg 时经管道多线程解码、按 encoder 中的 preset/crf 编码 H.264，否则使用 OpenCV（见 video_io）。
+    frame_sink(记录) 在编码阶段按帧序接收逐帧检测记录（见 _frame_record），阻塞时整条流水线随之等待
+    """
     # 获取视频参数
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    if not fps or fps < 1 or fps > 240:
-        fps = 25.0  # 默认FPS
+    info = probe_video(video_path)
+    fps, width, height, total_frames = info['fps'], info['width'], info['height'], info['total_frames']
+    cap = open_video_reader(video_path, width, height)
+    batch_size = max(1, int(batch_size))
+    if sampler is not None:
+        # 自适应采样逐帧推理，见 sample()
+        batch_size = 1
+    if stage_workers is None:
+        stage_workers = parse_stage_workers(PIPELINE_WORKERS)
     
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    out_path, writer, sidecar = _open_video_output(video_path, dest_dir, output_mode, fps, width, height, encoder,
+                                                   model.names)
+    _init_video_session(session_id, total_frames)
+    video_detection_data[session_id]['video_io'] = {
+        'decoder': io_backend_name(cap),
+        'encoder': io_backend_name(writer) if writer is not None else None
+    }
     
-    os.makedirs(dest_dir, exist_ok=True)
-    out_name = os.path.splitext(os.path.basename(video_path))[0] + '_result.mp4'
-    out_path = os.path.join(dest_dir, out_name)
+    stage_workers = dict(stage_workers or {})
+    if roi_tracker is not None:
+        stage_workers['infer'] = 1
     
-    # 视频编码器
-    fourcc_h264 = cv2.VideoWriter_fourcc(*'avc1')
-    writer = cv2.VideoWriter(out_path, fourcc_h264, fps, (width, height))
-    if not writer.isOpened():
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        writer = cv2.VideoWriter(out_path, fourcc, fps, (width, height))
+    print(f"[DEBUG] 开始视频检测，会话ID: {session_id}, 批大小: {batch_size}, 阶段线程: {stage_workers}")
+    server = get_inference_server(model)
+    
+    def decode():
+        """解码阶段：凑满一批帧后交给推理阶段，每帧附带其代表的源帧数"""
+        frames, weights = [], []
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+            weights.append(1)
+            if len(frames) >= batch_size:
+                yield frames, weights
+                frames, weights = [], []
+        if frames:
+            yield frames, weights
+    
+    # 没有写出端消费画面时整个绘制环节跳过
+    render = writer is not None
+    
+    def infer(batch):
+        """推理阶段：交给共享推理服务，与其他会话的帧一起动态凑批"""
+        frames, weights = batch
+        if roi_tracker is not None:
+            return frames, roi_tracker.predict(server, frames, conf=0.5, imgsz=(640, 640)), weights
+        return frames, server.predict(frames, conf=0.5, imgsz=(640, 640)), weights
+    
+    def annotate(item):
+        """绘制阶段：统计单帧检测结果，并直接在解码帧上绘制检测框"""
+        frames, results, weights = item
+        counts = _count_batch_detections(results)
+        boxes = [(result_xyxy(res),) + result_arrays(res) for res in results]
+        if render:
+            for frame, res, (xyxy, cls, conf) in zip(frames, results, boxes):
+                overlay_renderer.draw_boxes(frame, xyxy, cls, conf, res.names)
+        else:
+            # 不绘制时不再持有解码帧，尽早释放内存
+            frames = [None] * len(results)
+        return list(zip(counts, frames, weights, boxes))
+    
+    def sample():
+        """自适应采样的解码+推理阶段：逐帧解码并推理，按该帧的检测结果更新采样间隔后再跳帧"""
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames, results, _ = infer(([frame], [1]))
+            counts = _count_batch_detections(results)[0]
+            sampler.update(counts['closed_eyes_count'], counts['open_mouth_count'])
+            # 跳过采样间隔内的帧，只移动读取位置不解码
+            weight = 1
+            for _ in range(sampler.stride - 1):
+                if not cap.grab():
+                    break
+                weight += 1
+            sampler.record_sample(weight - 1)
+            yield frames, results, [weight]
     
     frame_count = 0
-    start_time = time.time()
+    timeline = []
     
-    # 初始化累计统计
-    if session_id not in video_detection_data:
-        video_detection_data[session_id] = {
-            'closed_eyes_count': 0,
-            'open_mouth_count': 0,
-            'open_eyes_count': 0,
-            'closed_mouth_count': 0,
-            'total_detections': 0,
-            'total_frames': 0,
-            'detection_active': True
-        }
+    def encode(frames):
+        """编码阶段：按帧顺序累计统计、叠加统计信息并写入视频"""
+        nonlocal frame_count
+        for counts, frame, weight, boxes in frames:
+            total_seconds, fatigue_level = _accumulate_video_frame_stats(counts, session_id, frame_count, fps, weight)
+            _add_timeline_frame(timeline, int(frame_count / fps), counts, weight, fatigue_level)
+            if sidecar is not None:
+                sidecar.add_frame(frame_count, weight, fatigue_level, *boxes)
+            if frame_sink is not None:
+                frame_sink(_frame_record(frame_count, frame_count / fps, counts, boxes, fatigue_level, weight))
+            if render:
+                values = _stats_overlay_values(video_detection_data[session_id],
+                                               f"{frame_count + 1}/{total_frames}", total_seconds)
+                overlay_renderer.draw_stats(frame, values, fatigue_level)
+                # 跳过的帧用最近的采样帧补齐，保持输出视频时长不变
+                for _ in range(weight):
+                    writer.write(frame)
+            frame_count += weight
+        if progress is not None:
+            progress(frame_count, total_frames, _progress_stats(session_id))
     
-    print(f"[DEBUG] 开始视频检测，会话ID: {session_id}")
+    stages = [
+        PipelineStage('infer', infer, stage_workers.get('infer', 1)),
+        PipelineStage('annotate', annotate, stage_workers.get('annotate', 1)),
+        PipelineStage('encode', encode, ordered=True),
+    ]
+    if sampler is None:
+        pipeline = VideoPipeline(decode, stages, queue_size=queue_size)
+    else:
+        # 推理在解码线程中同步完成，采样间隔不会因排队中的帧而滞后
+        pipeline = VideoPipeline(sample, stages[1:], queue_size=queue_size, source_name='decode_infer')
     
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        current_time = time.time()
-        
-        # 使用模型进行检测
-        result = model.predict(source=frame, conf=0.5, imgsz=(640, 640), verbose=False)
-        
-        # 提取检测结果并累计统计
-        detection_results = []
-        for res in result:
-            if res.boxes is not None:
-                for box in res.boxes:
-                    # 安全地访问tensor数据
-                    try:
-                        cls = int(box.cls.item()) if hasattr(box.cls, 'item') else int(box.cls[0] if len(box.cls.shape) > 0 else box.cls)
-                        conf = float(box.conf.item()) if hasattr(box.conf, 'item') else float(box.conf[0] if len(box.conf.shape) > 0 else box.conf)
-                        
-                        if conf > 0.5:  # 置信度阈值
-                            detection_results.append({
-                                'class': cls,
-                                'confidence': conf
-                            })
-                            
-                            # 累计统计
-                            stats = video_detection_data[session_id]
-                            if cls == 0:  # 闭眼
-                                stats['closed_eyes_count'] += 1
-                            elif cls == 1:  # 闭嘴
-                                stats['closed_mouth_count'] += 1
-                            elif cls == 2:  # 睁眼
-                                stats['open_eyes_count'] += 1
-                            elif cls == 3:  # 张嘴
-                                stats['open_mouth_count'] += 1
-                            
-                            stats['total_detections'] += 1
-                            
-                    except (IndexError, RuntimeError, ValueError) as e:
-                        print(f"[DEBUG] 跳过无效的检测结果: {e}")
-                        continue
-        
-        # 在帧上绘制检测结果
-        annotated = result[0].plot()
-        
-        # 添加统计信息到视频帧
-        stats = video_detection_data[session_id]
-        stats['total_frames'] = frame_count + 1
-        
-        # 计算视频总时长（基于帧数和FPS）
-        total_seconds = (frame_count + 1) / fps
-        
-        # 计算疲劳等级
-        fatigue_level = _analyze_fatigue_level_camera(
-            total_seconds,
-            stats['closed_eyes_count'],
-            stats['open_mouth_count']
-        )
-        
-        # 在视频上显示统计信息
-        cv2.putText(annotated, f"Frame: {frame_count+1}/{int(cap.get(cv2.CAP_PROP_FRAME_COUNT))}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-        cv2.putText(annotated, f"Time: {total_seconds:.1f}s", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-        cv2.putText(annotated, f"Total: {stats['total_detections']}", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-        cv2.putText(annotated, f"Eyes: {stats['closed_eyes_count']}/{stats['open_eyes_count']}", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-        cv2.putText(annotated, f"Mouth: {stats['open_mouth_count']}/{stats['closed_mouth_count']}", (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-        
-        # 显示疲劳等级
-        fatigue_colors = {
-            'none': (0, 255, 0),      # 绿色 - 不疲劳
-            'mild': (0, 255, 255),    # 黄色 - 轻度疲劳
-            'moderate': (0, 165, 255), # 橙色 - 中度疲劳
-            'severe': (0, 0, 255)     # 红色 - 重度疲劳
-        }
-        
-        fatigue_text = {
-            'none': 'No Fatigue',
-            'mild': 'Mild Fatigue', 
-            'moderate': 'Moderate Fatigue',
-            'severe': 'Severe Fatigue'
-        }.get(fatigue_level, fatigue_level)
-        
-        color = fatigue_colors.get(fatigue_level, (255, 255, 255))
-        cv2.putText(annotated, fatigue_text, (10, 180), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-        
-        writer.write(annotated)
-        frame_count += 1
+    # 处理期间占用模型，避免被注册表卸载
+    try:
+        with model_registry.pinned(model):
+            pipeline_stats = pipeline.run()
+    except BaseException:
+        # 处理失败或被取消时删除未写完的输出
+        if writer is not None:
+            writer.release()
+            writer = None
+        if out_path and os.path.exists(out_path):
+            os.remove(out_path)
+        raise
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.release()
     
-    cap.release()
-    writer.release()
+    if progress is not None:
+        progress(frame_count, total_frames, _progress_stats(session_id), force=True)
+    
+    video_detection_data[session_id]['pipeline_stats'] = pipeline_stats
+    video_detection_data[session_id]['timeline'] = timeline
+    video_detection_data[session_id]['finished_at'] = time.time()
+    video_detection_data[session_id]['detection_active'] = False
+    if sidecar is not None:
+        sidecar.save(out_path)
+    if sampler is not None:
+        video_detection_data[session_id]['sampling_stats'] = sampler.get_stats()
+    if roi_tracker is not None:
+        video_detection_data[session_id]['roi_stats'] = roi_tracker.get_stats()
     
     print(f"[DEBUG] 视频处理完成，总帧数: {frame_count}")
-    print(f"[DEBUG] 最终统计: {video_detection_data[session_id]}")
+    print(f"[DEBUG] 流水线瓶颈阶段: {pipeline_stats['bottleneck']}, 各阶段占用: {pipeline_stats['stages']}")
+    print(f"[DEBUG] 最终统计: { {k: v for k, v in video_detection_data[session_id].items() if k != 'timeline'} }")
     
     return out_path
 
-def _gen_stream(cap, model, session_id):
-    """生成视频流 - 逐帧检测并累计统计"""
+def _infer_video_segment(video_path, start, end, model_name, backend=None, batch_size=VIDEO_BATCH_SIZE,
+                         with_boxes=True):
+    """分段推理入口，在分段工作进程中执行：读取 [start, end) 帧并推理，不绘制也不编码
+    :param end: 结束帧（不含），None 表示读到视频末尾
+    :param with_boxes: 是否回传检测框，仅统计模式下不需要
+    :return: {'start': 起始帧, 'counts': 逐帧计数, 'boxes': 逐帧 (xyxy, cls, conf) 或 None, 'names': 模型类别名}
+    """
+    model = _get_model(model_name, backend)
+    server = get_inference_server(model)
+    batch_size = max(1, int(batch_size))
+    cap, pending = open_segment(video_path, start)
+    counts, boxes = [], []
+    frame_index = start
+    try:
+        with model_registry.pinned(model):
+            finished = False
+            while not finished:
+                # 定位时已解码的起始帧
+                frames = [pending] if pending is not None else []
+                pending = None
+                while len(frames) < batch_size and (end is None or frame_index + len(frames) < end):
+                    ret, frame = cap.read()
+                    if not ret:
+                        finished = True
+                        break
+                    frames.append(frame)
+                if not frames:
+                    break
+                results = server.predict(frames, conf=0.5, imgsz=(640, 640))
+                counts.extend(_count_batch_detections(results))
+                if with_boxes:
+                    boxes.extend((result_xyxy(res),) + result_arrays(res) for res in results)
+                frame_index += len(frames)
+    finally:
+        cap.release()
+    return {'start': start, 'counts': counts, 'boxes': boxes if with_boxes else None, 'names': dict(model.names)}
+
+def _predict_video_segments(video_path, model_name, backend, dest_dir, session_id, segments,
+                            batch_size=VIDEO_BATCH_SIZE, output_mode='video', progress=None, keyframe_aligned=False,
+                            encoder=None):
+    """分段并行推理长视频，返回值与 _predict_video 相同
+
+    各分段交给分段进程池，工作进程各自加载模型，只推理并回传逐帧计数和检测框；
+    主进程按分段顺序拼接结果，逐帧调用与顺序处理相同的累计函数，统计、时间线和疲劳等级与顺序处理完全一致。
+    输出标注视频时由主进程顺序解码原视频、绘制并写入同一个编码器，分段之间没有接缝；
+    主进程与分段进程都用 OpenCV 解码，帧序号一致。
+    前面的分段返回后即开始拼接，与后面分段的推理同时进行
+    :param segments: [(起始帧, 结束帧)]，见 video_segments.plan_segments
+    :raises SegmentMismatchError: 分段起始帧或帧数与拼接位置不一致，调用方应改为顺序处理
+    """
+    info = probe_video(video_path)
+    fps, width, height, total_frames = info['fps'], info['width'], info['height'], info['total_frames']
+
+    out_path, writer, sidecar = _open_video_output(video_path, dest_dir, output_mode, fps, width, height, encoder)
+    # 不输出标注视频时主进程无需解码；与分段进程使用同一种解码器，避免帧数不一致
+    cap = cv2.VideoCapture(video_path) if writer is not None else None
+    _init_video_session(session_id, total_frames)
+    video_detection_data[session_id]['video_io'] = {
+        'decoder': io_backend_name(cap) if cap is not None else None,
+        'encoder': io_backend_name(writer) if writer is not None else None
+    }
+
+    print(f"[DEBUG] 开始分段视频检测，会话ID: {session_id}, 分段: {segments}, 关键帧对齐: {keyframe_aligned}")
+    started_at = time.time()
+    futures = [
+        segment_executor.submit(_infer_video_segment, video_path, start, end, model_name, backend, batch_size,
+                                output_mode != 'stats')
+        for start, end in segments
+    ]
+
+    frame_count = 0
+    timeline = []
+    try:
+        for future in futures:
+            # 等待分段结果期间照常上报进度，任务取消时可及时中止
+            while True:
+                try:
+                    segment = future.result(timeout=VIDEO_SEGMENT_POLL_INTERVAL)
+                    break
+                except FutureTimeoutError:
+                    if progress is not None:
+                        progress(frame_count, total_frames, _progress_stats(session_id))
+
+            if segment['start'] != frame_count:
+                raise SegmentMismatchError(f"分段起始帧 {segment['start']} 与已拼接帧数 {frame_count} 不一致")
+            boxes = segment['boxes'] or [None] * len(segment['counts'])
+            # 模型只在分段进程中加载，类别名随分段结果回传
+            names = segment['names']
+            if sidecar is not None:
+                sidecar.names = names
+            for counts, frame_boxes in zip(segment['counts'], boxes):
+                total_seconds, fatigue_level = _accumulate_video_frame_stats(counts, session_id, frame_count, fps)
+                _add_timeline_frame(timeline, int(frame_count / fps), counts, 1, fatigue_level)
+                if sidecar is not None:
+                    sidecar.add_frame(frame_count, 1, fatigue_level, *frame_boxes)
+                if writer is not None:
+                    ret, frame = cap.read()
+                    if not ret:
+                        raise SegmentMismatchError(f"重新解码第 {frame_count} 帧失败，与分段推理的帧数不一致")
+                    overlay_renderer.draw_boxes(frame, *frame_boxes, names)
+                    values = _stats_overlay_values(video_detection_data[session_id],
+                                                   f"{frame_count + 1}/{total_frames}", total_seconds)
+                    overlay_renderer.draw_stats(frame, values, fatigue_level)
+                    writer.write(frame)
+                frame_count += 1
+            if progress is not None:
+                progress(frame_count, total_frames, _progress_stats(session_id))
+    except BaseException:
+        # 处理失败或被取消时撤销未开始的分段，并删除未写完的输出
+        for future in futures:
+            future.cancel()
+        if writer is not None:
+            writer.release()
+            writer = None
+        if out_path and os.path.exists(out_path):
+            os.remove(out_path)
+        raise
+    finally:
+        if cap is not None:
+            cap.release()
+        if writer is not None:
+            writer.release()
+
+    if progress is not None:
+        progress(frame_count, total_frames, _progress_stats(session_id), force=True)
+
+    video_detection_data[session_id]['segment_stats'] = {
+        'segments': [[start, frame_count if end is None else end] for start, end in segments],
+        'workers': segment_executor.max_workers,
+        'in_process': segment_executor.in_process,
+        'keyframe_aligned': keyframe_aligned,
+        'elapsed_seconds': round(time.time() - started_at, 2)
+    }
+    video_detection_data[session_id]['timeline'] = timeline
+    video_detection_data[session_id]['finished_at'] = time.time()
+    video_detection_data[session_id]['detection_active'] = False
+    if sidecar is not None:
+        sidecar.save(out_path)
+
+    print(f"[DEBUG] 分段视频处理完成，总帧数: {frame_count}, 分段统计: {video_detection_data[session_id]['segment_stats']}")
+    return out_path
+
+def _open_video_output(video_path, dest_dir, output_mode, fps, width, height, encoder=None, names=None):
+    """按输出模式准备输出：video 创建视频编码器，sidecar 创建叠加层旁路文件，stats 不输出
+    :param encoder: ffmpeg 编码参数 {'preset': ..., 'crf': ...}
+    :param names: 模型类别名，写入旁路文件
+    :return: (输出文件路径, 视频编码器, OverlaySidecar)
+    """
+    out_path = writer = sidecar = None
+    if output_mode == 'sidecar':
+        out_name = os.path.splitext(os.path.basename(video_path))[0] + '_overlay.json'
+        out_path = os.path.join(dest_dir, out_name)
+        source_url = '/static/' + os.path.relpath(video_path, 'static').replace('\\', '/')
+        sidecar = OverlaySidecar(source_url, fps, width, height, names)
+    elif output_mode == 'video':
+        os.makedirs(dest_dir, exist_ok=True)
+        out_name = os.path.splitext(os.path.basename(video_path))[0] + '_result.mp4'
+        out_path = os.path.join(dest_dir, out_name)
+        writer = open_video_writer(out_path, fps, width, height, **(encoder or {}))
+    return out_path, writer, sidecar
+
+def _init_video_session(session_id, total_frames):
+    """初始化视频会话的累计统计"""
+    if session_id not in video_detection_data:
+        video_detection_data[session_id] = VideoSessionStats(detection_active=True)
+    video_detection_data[session_id].update({
+        'video_total_frames': total_frames,
+        'started_at': time.time()
+    })
+
+def _count_batch_detections(results):
+    """统计一批帧中每帧置信度大于0.5的各类别数量"""
+    class_counts, totals = count_batch(results)
+    return [{
+        'closed_eyes_count': int(row[CLOSED_EYES]),
+        'open_mouth_count': int(row[OPEN_MOUTH]),
+        'open_eyes_count': int(row[OPEN_EYES]),
+        'closed_mouth_count': int(row[CLOSED_MOUTH]),
+        'total_detections': int(total)
+    } for row, total in zip(class_counts.tolist(), totals.tolist())]
+
+def _accumulate_video_frame_stats(counts, session_id, frame_count, fps, weight=1):
+    """累计单帧统计到视频会话，返回 (视频时长, 疲劳等级)
+
+    weight 为该帧代表的源帧数（自适应采样时大于1），计数按权重累计
+    """
+    def update(stats):
+        for key, value in counts.items():
+            stats[key] += value * weight
+        
+        stats['total_frames'] = frame_count + weight
+        if counts['total_detections'] > 0:
+            stats['frames_with_detections'] = stats.get('frames_with_detections', 0) + weight
+        return stats['closed_eyes_count'], stats['open_mouth_count']
+    
+    # 在会话锁内累加，/api/get_video_stats 读取时得到一致的计数
+    closed_eyes_count, open_mouth_count = video_counters.apply(session_id, update)
+    
+    # 计算视频总时长（基于帧数和FPS）
+    total_seconds = (frame_count + weight) / fps
+    
+    # 计算疲劳等级
+    fatigue_level = _analyze_fatigue_level_camera(
+        total_seconds,
+        closed_eyes_count,
+        open_mouth_count
+    )
+    return total_seconds, fatigue_level
+
+def _add_timeline_frame(timeline, second, counts, weight, fatigue_level):
+    """把单帧统计计入逐秒时间线，每秒一条，疲劳等级取该秒最后一帧的累计判断"""
+    if not timeline or timeline[-1]['second'] != second:
+        timeline.append({
+            'second': second,
+            'frames': 0,
+            'closed_eyes': 0,
+            'open_mouth': 0,
+            'open_eyes': 0,
+            'closed_mouth': 0,
+            'fatigue_level': fatigue_level
+        })
+    bucket = timeline[-1]
+    bucket['frames'] += weight
+    bucket['closed_eyes'] += counts['closed_eyes_count'] * weight
+    bucket['open_mouth'] += counts['open_mouth_count'] * weight
+    bucket['open_eyes'] += counts['open_eyes_count'] * weight
+    bucket['closed_mouth'] += counts['closed_mouth_count'] * weight
+    bucket['fatigue_level'] = fatigue_level
+
+def _frame_record(frame_index, timestamp, counts, boxes, fatigue_level, span=1):
+    """
+    逐帧检测记录（NDJSON 结果流的一行）
+    :param counts: 单帧计数，键同 _count_batch_detections
+    :param boxes: (xyxy, cls, conf)
+    :param span: 该帧代表的源帧数（自适应采样时大于1）
+    """
+    xyxy, cls, conf = boxes
+    return {
+        'type': 'frame',
+        'frame': frame_index,
+        'time': round(timestamp, 3),
+        'span': span,
+        'counts': {
+            'closed_eyes': counts['closed_eyes_count'],
+            'open_mouth': counts['open_mouth_count'],
+            'open_eyes': counts['open_eyes_count'],
+            'closed_mouth': counts['closed_mouth_count'],
+            'total': counts['total_detections']
+        },
+        # [x1, y1, x2, y2, 类别, 置信度]
+        'boxes': [[round(x1, 1), round(y1, 1), round(x2, 1), round(y2, 1), c, round(p, 3)]
+                  for (x1, y1, x2, y2), c, p in zip(np.asarray(xyxy).tolist(), cls.tolist(), conf.tolist())],
+        'fatigue_level': fatigue_level
+    }
+
+def _ndjson_line(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+def _progress_stats(session_id):
+    """任务进度中附带的累计计数"""
+    stats = video_counters.snapshot(session_id) or {}
+    return {key: stats.get(key, 0) for key in (
+        'closed_eyes_count', 'open_mouth_count', 'open_eyes_count', 'closed_mouth_count',
+        'total_detections', 'total_frames', 'frames_with_detections')}
+
+def _stats_overlay_values(stats, frame_text, total_seconds):
+    """统计信息各行的数值文字，与 overlay.STATS_LABELS 对应"""
+    return (
+        frame_text,
+        f"{total_seconds:.1f}s",
+        str(stats['total_detections']),
+        f"{stats['closed_eyes_count']}/{stats['open_eyes_count']}",
+        f"{stats['open_mouth_count']}/{stats['closed_mouth_count']}"
+    )
+
+def _gen_stream(cap, model, session_id, roi_tracker=None, view=True, ndjson=False):
+    """生成视频流 - 逐帧检测并累计统计
+
+    传入 RoiTracker 时，两次整帧检测之间只在人脸区域裁剪图上推理；
+    view 为 False 时不绘制画面，每帧只输出 JSON 统计；
+    ndjson 为 True 时每帧输出一行 JSON 检测记录（见 _frame_record），由客户端读取驱动，读得慢时检测随之放慢；
+    摄像头流的 cap 为采集线程的读取方（CaptureReader），每次取最新一帧，检测跟不上时丢弃旧帧而不是积压
+    """
     frame_count = 0
     start_time = time.time()
     
     print(f"[DEBUG] 开始摄像头流，会话ID: {session_id}")
+    server = get_inference_server(model)
+    # 实时流存续期间占用模型，避免被注册表卸载
+    pinned = model_registry.pin(model)
     
-    # 初始化流控制状态
+    # 初始化流控制状态；摄像头由采集线程读取时记录读取方，供查询丢帧统计
     camera_stream_control[session_id] = {
         'active': True,
-        'start_time': start_time
+        'start_time': start_time,
+        'capture': cap if isinstance(cap, CaptureReader) else None
     }
     
     # 初始化累计统计 - 如果数据不存在或者需要重新初始化
-    if session_id not in camera_detection_data:
+    existing_data = camera_counters.snapshot(session_id)
+    if existing_data is None:
         print(f"[DEBUG] 首次初始化摄像头检测数据: {session_id}")
-        camera_detection_data[session_id] = {
-            'closed_eyes_count': 0,
-            'open_mouth_count': 0,
-            'open_eyes_count': 0,
-            'closed_mouth_count': 0,
-            'total_detections': 0,
-            'start_time': start_time,
-            'last_update': start_time
-        }
+        camera_counters.replace(session_id, CameraSessionStats(start_time=start_time, last_update=start_time))
     else:
         # 如果数据已存在，检查是否需要重新初始化开始时间
         # 这处理了重置后重新启动检测流的情况
-        existing_data = camera_detection_data[session_id]
         if existing_data.get('start_time', 0) > start_time - 2:  # 如果开始时间是最近2秒内设置的，说明是重置后的重新启动
             print(f"[DEBUG] 检测到重置后重新启动，使用现有数据: {session_id}")
             print(f"[DEBUG] 现有数据: {existing_data}")
         else:
             print(f"[DEBUG] 长时间会话，保持现有数据: {session_id}")
     
-    print(f"[DEBUG] 当前会话数据: {camera_detection_data[session_id]}")
+    print(f"[DEBUG] 当前会话数据: {camera_counters.snapshot(session_id)}")
     
     try:
         while True:
@@ -641,43 +1457,41 @@ def _gen_stream(cap, model, session_id):
         
             current_time = time.time()
         
-            # 使用模型进行检测
-            results = model(frame)
-        
-            # 提取检测结果并累计统计
-            detection_results = []
-        
-            for result in results:
-                if result.boxes is not None:
-                    for box in result.boxes:
-                        # 安全地访问tensor数据
-                        try:
-                            cls = int(box.cls.item()) if hasattr(box.cls, 'item') else int(box.cls[0] if len(box.cls.shape) > 0 else box.cls)
-                            conf = float(box.conf.item()) if hasattr(box.conf, 'item') else float(box.conf[0] if len(box.conf.shape) > 0 else box.conf)
-                            
-                            if conf > 0.5:  # 置信度阈值
-                                detection_results.append({
-                                    'class': cls,
-                                    'confidence': conf
-                                })
-                                
-                                # 累计统计
-                                stats = camera_detection_data[session_id]
-                                if cls == 0:  # 闭眼
-                                    stats['closed_eyes_count'] += 1
-                                elif cls == 1:  # 闭嘴
-                                    stats['closed_mouth_count'] += 1
-                                elif cls == 2:  # 睁眼
-                                    stats['open_eyes_count'] += 1
-                                elif cls == 3:  # 张嘴
-                                    stats['open_mouth_count'] += 1
-                                
-                                stats['total_detections'] += 1
-                                stats['last_update'] = current_time
-                                
-                        except (IndexError, RuntimeError, ValueError) as e:
-                            print(f"[DEBUG] 跳过无效的检测结果: {e}")
-                            continue
+            # 提交到共享推理服务，与其他会话的帧合并推理
+            if roi_tracker is not None:
+                results = roi_tracker.predict(server, [frame])
+                camera_stream_control[session_id]['roi_stats'] = roi_tracker.get_stats()
+            else:
+                results = [server.submit(frame).result()]
+        
+            # 提取检测结果并累计统计（置信度阈值 0.5）
+            cls, conf = result_arrays(results[0])
+            detection_results = [
+                {'class': det['class_id'], 'confidence': det['confidence']}
+                for det in build_detections(cls, conf, threshold=0.5)
+            ]
+            
+            if detection_results:
+                counts = count_arrays(cls, conf, threshold=0.5)
+                # 原子累加，重置/保存接口替换或删除会话数据时不会丢失或写坏计数
+                stats = camera_counters.increment(session_id, {
+                    'closed_eyes_count': int(counts[CLOSED_EYES]),
+                    'closed_mouth_count': int(counts[CLOSED_MOUTH]),
+                    'open_eyes_count': int(counts[OPEN_EYES]),
+                    'open_mouth_count': int(counts[OPEN_MOUTH]),
+                    'total_detections': len(detection_results)
+                }, last_update=current_time)
+                
+                realtime = real_time_detection_data[session_id]
+                realtime.window.add({
+                    'closed_eyes': int(counts[CLOSED_EYES]),
+                    'open_mouth': int(counts[OPEN_MOUTH]),
+                    'open_eyes': int(counts[OPEN_EYES]),
+                    'closed_mouth': int(counts[CLOSED_MOUTH])
+                }, current_time)
+                realtime.last_update = current_time
+            else:
+                stats = camera_counters.snapshot(session_id, create=True)
         
             # 存储最新检测结果
             real_time_detection_results[session_id] = {
@@ -686,11 +1500,6 @@ def _gen_stream(cap, model, session_id):
                 'frame_count': frame_count
             }
             
-            # 在帧上绘制检测结果
-            annotated = results[0].plot()
-            
-            # 添加统计信息到视频帧
-            stats = camera_detection_data[session_id]
             total_seconds = current_time - stats['start_time']
             
             # 计算疲劳等级
@@ -700,30 +1509,33 @@ def _gen_stream(cap, model, session_id):
                 stats['open_mouth_count']
             )
             
-            # 在视频上显示统计信息
-            cv2.putText(annotated, f"Frame: {frame_count+1}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-            cv2.putText(annotated, f"Time: {total_seconds:.1f}s", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-            cv2.putText(annotated, f"Total: {stats['total_detections']}", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-            cv2.putText(annotated, f"Eyes: {stats['closed_eyes_count']}/{stats['open_eyes_count']}", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-            cv2.putText(annotated, f"Mouth: {stats['open_mouth_count']}/{stats['closed_mouth_count']}", (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
+            if ndjson:
+                frame_counts = count_arrays(cls, conf, threshold=0.5)
+                yield _ndjson_line(_frame_record(frame_count, total_seconds, {
+                    'closed_eyes_count': int(frame_counts[CLOSED_EYES]),
+                    'open_mouth_count': int(frame_counts[OPEN_MOUTH]),
+                    'open_eyes_count': int(frame_counts[OPEN_EYES]),
+                    'closed_mouth_count': int(frame_counts[CLOSED_MOUTH]),
+                    'total_detections': len(detection_results)
+                }, (result_xyxy(results[0]), cls, conf), fatigue_level))
+                frame_count += 1
+                continue
             
-            # 显示疲劳等级
-            fatigue_colors = {
-                'none': (0, 255, 0),      # 绿色 - 不疲劳
-                'mild': (0, 255, 255),    # 黄色 - 轻度疲劳
-                'moderate': (0, 165, 255), # 橙色 - 中度疲劳
-                'severe': (0, 0, 255)     # 红色 - 重度疲劳
-            }
-            
-            fatigue_text = {
-                'none': 'No Fatigue',
-                'mild': 'Mild Fatigue', 
-                'moderate': 'Moderate Fatigue',
-                'severe': 'Severe Fatigue'
-            }.get(fatigue_level, fatigue_level)
+            if not view:
+                # 无人观看画面时只输出统计，跳过绘制和JPEG编码
+                part = json.dumps({
+                    'frame': frame_count + 1,
+                    'time': round(total_seconds, 1),
+                    'fatigue_level': fatigue_level,
+                    'detections': detection_results
+                }).encode('utf-8')
+                yield b'--frame\r\nContent-Type: application/json\r\n\r\n' + part + b'\r\n'
+                frame_count += 1
+                continue
             
-            color = fatigue_colors.get(fatigue_level, (255, 255, 255))
-            cv2.putText(annotated, fatigue_text, (10, 180), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+            # 直接在当前帧上绘制检测结果和统计信息
+            values = _stats_overlay_values(stats, str(frame_count + 1), total_seconds)
+            annotated = overlay_renderer.render(frame, results[0], values, fatigue_level)
             
             _, jpeg = cv2.imencode('.jpg', annotated)
             yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
@@ -735,6 +1547,8 @@ def _gen_stream(cap, model, session_id):
         # 清理资源
         print(f"[DEBUG] 清理摄像头流资源: {session_id}")
         cap.release()
+        if pinned:
+            model_registry.release(model)
         
         # 标记流为非活跃状态
         if session_id in camera_stream_control:
@@ -746,26 +1560,36 @@ def stream_camera():
     """实时摄像头流"""
     index = int(request.args.get('index', 0))
     model_name = request.args.get('model', '')
+    backend = request.args.get('backend', '').strip() or None
+    roi_mode = request.args.get('roi', '').strip().lower() in ('1', 'true', 'yes')
+    view = request.args.get('view', '1').strip().lower() not in ('0', 'false', 'no')
+    ndjson = request.args.get('format', '').strip().lower() == 'ndjson'
     username = request.args.get('username', '')
     
     if not model_name:
         return 'Missing model parameter', 400
     
+    cap = None
     try:
-        model = _get_model(model_name)
+        model = _get_model(model_name, backend)
         # 使用与统计API一致的session_id格式
         session_id = f"camera_{username}"
         
         print(f"[DEBUG] 启动摄像头流，用户: {username}, 会话ID: {session_id}")
         
-        # Windows 用 CAP_DSHOW
-        cap = cv2.VideoCapture(index, cv2.CAP_DSHOW)
+        # 摄像头由独立采集线程读取，检测循环每次取最新一帧（Windows 用 CAP_DSHOW）
+        cap = camera_captures.open(index, lambda: cv2.VideoCapture(index, cv2.CAP_DSHOW))
         
-        return Response(
-            stream_with_context(_gen_stream(cap, model, session_id)),
-            mimetype='multipart/x-mixed-replace; boundary=frame'
+        response = Response(
+            stream_with_context(_gen_stream(cap, model, session_id, RoiTracker() if roi_mode else None, view, ndjson)),
+            mimetype='application/x-ndjson' if ndjson else 'multipart/x-mixed-replace; boundary=frame'
         )
+        # 客户端在生成器开始前断开时 _gen_stream 的 finally 不会执行，响应关闭时再释放一次（重复释放无影响）
+        response.call_on_close(cap.release)
+        return response
     except Exception as e:
+        if cap is not None:
+            cap.release()
         return f'stream error: {e}', 500
 
 @detect_api.route('/api/stream/video')
@@ -773,6 +1597,10 @@ def stream_video():
     """实时视频文件流"""
     video_path = request.args.get('path', '')
     model_name = request.args.get('model', '')
+    backend = request.args.get('backend', '').strip() or None
+    roi_mode = request.args.get('roi', '').strip().lower() in ('1', 'true', 'yes')
+    view = request.args.get('view', '1').strip().lower() not in ('0', 'false', 'no')
+    ndjson = request.args.get('format', '').strip().lower() == 'ndjson'
     
     if not video_path or not os.path.exists(video_path):
         return 'video not found', 404
@@ -780,19 +1608,124 @@ def stream_video():
     if not model_name:
         return 'Missing model parameter', 400
     
+    cap = None
     try:
-        model = _get_model(model_name)
+        model = _get_model(model_name, backend)
         session_id = str(uuid.uuid4())
         
         cap = cv2.VideoCapture(os.path.abspath(video_path))
         
-        return Response(
-            stream_with_context(_gen_stream(cap, model, session_id)),
-            mimetype='multipart/x-mixed-replace; boundary=frame'
+        response = Response(
+            stream_with_context(_gen_stream(cap, model, session_id, RoiTracker() if roi_mode else None, view, ndjson)),
+            mimetype='application/x-ndjson' if ndjson else 'multipart/x-mixed-replace; boundary=frame'
         )
+        response.call_on_close(cap.release)
+        return response
     except Exception as e:
+        if cap is not None:
+            cap.release()
         return f'stream error: {e}', 500
 
+@detect_api.route('/api/detect/stream', methods=['POST'])
+def detect_stream():
+    """
+    逐帧检测结果流（NDJSON）：上传视频，边处理边返回每帧的检测记录
+    第一行为 start（视频参数），之后每帧一行 frame 记录，最后一行为 summary（最终统计）或 error。
+    处理端与响应之间是有界队列，客户端读取慢时流水线阻塞等待，断开后处理随即中止
+    """
+    upload_file = request.files.get('file')
+    model_name = request.form.get('model', '').strip()
+    backend = request.form.get('backend', '').strip() or None
+    
+    if not upload_file or upload_file.filename == '':
+        return jsonify({'success': False, 'message': '未检测到上传文件'}), 400
+    if not model_name:
+        return jsonify({'success': False, 'message': '缺少模型文件名'}), 400
+    ext = os.path.splitext(upload_file.filename)[1].lower()
+    if ext not in {'.mp4', '.avi', '.mov', '.mkv'}:
+        return jsonify({'success': False, 'message': f'不支持的视频格式: {ext}'}), 400
+    
+    try:
+        batch_size = min(max(int(request.form.get('batch_size', VIDEO_BATCH_SIZE)), 1), MAX_VIDEO_BATCH_SIZE)
+        min_stride = int(request.form.get('min_stride', ADAPTIVE_MIN_STRIDE))
+        max_stride = int(request.form.get('max_stride', ADAPTIVE_MAX_STRIDE))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'batch_size/min_stride/max_stride 必须为整数'}), 400
+    sampler = None
+    if request.form.get('sampling', 'full').strip().lower() == 'adaptive':
+        sampler = AdaptiveFrameSampler(min_stride, max_stride)
+    roi_tracker = RoiTracker() if request.form.get('roi', '').strip().lower() in ('1', 'true', 'yes') else None
+    
+    try:
+        model = _get_model(model_name, backend)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    tmp_dir = 'static/uploads'
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, f"detect_{uuid.uuid4().hex}{ext}")
+    upload_file.save(tmp_path)
+    try:
+        info = probe_video(tmp_path)
+    except RuntimeError as e:
+        _discard_upload(tmp_path)
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    session_id = str(uuid.uuid4())
+    records = queue.Queue(maxsize=max(1, NDJSON_QUEUE_SIZE))
+    closed = threading.Event()
+    
+    def emit(record):
+        """放入有界队列，队列满时等待消费端读取；客户端已断开则中止处理"""
+        while True:
+            if closed.is_set():
+                raise _StreamClosed()
+            try:
+                records.put(record, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+    
+    def run():
+        try:
+            _predict_video(tmp_path, model, os.path.join('static', 'uploads', 'results'), session_id, batch_size,
+                           sampler=sampler, roi_tracker=roi_tracker, output_mode='stats', frame_sink=emit)
+            final_stats = _get_video_detection_stats(session_id)
+            emit({
+                'type': 'summary',
+                'session_id': session_id,
+                'fatigue_level': final_stats['fatigue_level'],
+                'detection_info': final_stats
+            })
+        except _StreamClosed:
+            print(f"[DEBUG] NDJSON 客户端已断开，中止处理: {session_id}")
+        except Exception as e:
+            print(f"[ERROR] NDJSON 检测失败 {session_id}: {e}")
+            try:
+                emit({'type': 'error', 'message': str(e)})
+            except _StreamClosed:
+                pass
+        finally:
+            try:
+                emit(_STREAM_END)
+            except _StreamClosed:
+                pass
+    
+    def generate():
+        # 客户端开始读取时才启动处理
+        threading.Thread(target=run, name=f'ndjson-{session_id[:8]}', daemon=True).start()
+        try:
+            yield _ndjson_line(dict(info, type='start', session_id=session_id))
+            while True:
+                record = records.get()
+                if record is _STREAM_END:
+                    break
+                yield _ndjson_line(record)
+        finally:
+            closed.set()
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @detect_api.route('/api/detect/camera/stop', methods=['POST'])
 def stop_camera_detection():
     """停止摄像头检测"""
@@ -855,8 +1788,9 @@ def get_detected_objects():
         
         print(f"[DEBUG] 用户: {username}, 会话ID: {session_id}")
         
-        # 检查是否有检测数据
-        if session_id not in camera_detection_data:
+        # 检查是否有检测数据（取一致快照，不受检测流同时累加的影响）
+        stats = camera_counters.snapshot(session_id)
+        if stats is None:
             print(f"[DEBUG] 没有找到摄像头检测数据")
             return jsonify({
                 'success': True,
@@ -874,7 +1808,6 @@ def get_detected_objects():
             })
         
         # 获取累计统计数据
-        stats = camera_detection_data[session_id]
         current_time = time.time()
         total_seconds = current_time - stats['start_time']
         
@@ -902,6 +1835,15 @@ def get_detected_objects():
             'detection_active': True,
             'total_seconds': round(total_seconds, 1)
         }
+        # 摄像头采集统计：采集帧率与因检测跟不上而丢弃的帧数
+        control = camera_stream_control.get(session_id)
+        if control and control.get('capture') is not None:
+            detection_info['capture'] = control['capture'].get_stats()
+        # 最近10秒/60秒各类别的检测数
+        if session_id in real_time_detection_data:
+            window = real_time_detection_data[session_id].window
+            detection_info['recent'] = {f'{seconds}s': window.totals(seconds, current_time)
+                                        for seconds in REALTIME_WINDOWS}
         
         print(f"[DEBUG] 返回摄像头检测统计:")
         print(f"[DEBUG] 疲劳级别: {fatigue_level}")
@@ -947,10 +1889,8 @@ def get_detected_objects():
 
 @detect_api.route('/api/get_video_stats', methods=['GET'])
 def get_video_stats():
-    """获取视频检测统计信息（用于实时显示）"""
+    """获取视频检测统计与处理进度（已处理帧数、处理速度、预计剩余时间）"""
     try:
-        print("[DEBUG] get_video_stats API 被调用")
-        
         session_id = request.args.get('session_id', '')
         if not session_id:
             print("[DEBUG] 缺少session_id参数")
@@ -959,29 +1899,31 @@ def get_video_stats():
                 'message': '缺少session_id参数'
             }), 400
         
-        # 如果没有对应的视频检测会话，返回默认值
-        if session_id not in video_detection_data:
-            print(f"[DEBUG] 没有找到视频检测会话: {session_id}")
-            return jsonify({
-                'success': True,
-                'fatigue_level': 'low',
-                'detection_info': {
-                    'closed_eyes_count': 0,
-                    'open_mouth_count': 0,
-                    'open_eyes_count': 0,
-                    'closed_mouth_count': 0,
-                    'total_detections': 0,
-                    'fatigue_indicators': [],
-                    'detection_active': False,
-                    'total_frames': 0,
-                    'frames_with_detections': 0
-                }
+        job = video_job_manager.get(session_id)
+        if session_id in video_detection_data:
+            stats = _get_video_detection_stats(session_id)
+            progress = _session_progress(session_id)
+        elif job is not None and job['stats']:
+            # 异步任务运行中，统计来自工作进程上报的进度
+            stats = _summarize_video_stats(dict(job['stats'], detection_active=True))
+            progress = None
+        else:
+            stats = _summarize_video_stats({
+                'closed_eyes_count': 0,
+                'open_mouth_count': 0,
+                'open_eyes_count': 0,
+                'closed_mouth_count': 0,
+                'total_detections': 0,
+                'total_frames': 0,
+                'detection_active': False
             })
+            stats['fatigue_level'] = 'low'
+            progress = None
         
-        # 使用视频统计函数
-        stats = _get_video_detection_stats(session_id)
-        
-        print(f"[DEBUG] 视频检测统计: {stats}")
+        if job is not None:
+            progress = {key: job[key] for key in (
+                'status', 'frames_done', 'total_frames', 'percent', 'fps', 'eta_seconds')}
+            progress['error'] = job['error']
         
         return jsonify({
             'success': True,
@@ -996,7 +1938,8 @@ def get_video_stats():
                 'detection_active': stats['detection_active'],
                 'total_frames': stats['total_frames'],
                 'frames_with_detections': stats['frames_with_detections']
-            }
+            },
+            'progress': progress
         })
     except Exception as e:
         print(f"[ERROR] get_video_stats 失败: {e}")
@@ -1016,6 +1959,47 @@ def get_video_stats():
             }
         })
 
+def _session_progress(session_id):
+    """同步视频检测会话的处理进度"""
+    stats = video_counters.snapshot(session_id) or {}
+    frames_done = stats.get('total_frames', 0)
+    total_frames = stats.get('video_total_frames', 0)
+    started_at = stats.get('started_at')
+    elapsed = (stats.get('finished_at') or time.time()) - started_at if started_at else 0.0
+    fps = frames_done / elapsed if elapsed > 0 else 0.0
+    running = stats.get('detection_active', False)
+    return {
+        'status': 'running' if running else 'completed',
+        'frames_done': frames_done,
+        'total_frames': total_frames,
+        'percent': round(min(frames_done * 100.0 / total_frames, 100.0), 1) if total_frames else 0.0,
+        'fps': round(fps, 2),
+        'eta_seconds': round((total_frames - frames_done) / fps, 1) if running and fps > 0 and total_frames > frames_done else None
+    }
+
+@detect_api.route('/api/detect/jobs', methods=['GET'])
+def list_video_jobs():
+    """视频检测任务列表"""
+    jobs = video_job_manager.list_jobs()
+    for job in jobs:
+        job.pop('result', None)
+    return jsonify({'success': True, 'jobs': jobs})
+
+@detect_api.route('/api/detect/jobs/<job_id>', methods=['GET'])
+def get_video_job(job_id):
+    """视频检测任务状态，完成后附带检测结果"""
+    job = video_job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@detect_api.route('/api/detect/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_video_job(job_id):
+    """取消视频检测任务"""
+    if not video_job_manager.cancel(job_id):
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+    return jsonify({'success': True, 'message': '已请求取消任务', 'job': video_job_manager.get(job_id)})
+
 @detect_api.route('/api/models', methods=['GET'])
 def get_models():
     """获取所有可用的模型列表"""
@@ -1043,6 +2027,7 @@ def get_models():
                             'size_mb': round(file_size / (1024 * 1024), 2),
                             'upload_time': file_time.strftime('%Y-%m-%d %H:%M:%S'),
                             'path': file_path,
+                            'backend': model_registry.resolve_backend(filename),
                             'timestamp': os.path.getmtime(file_path)
                         })
         
@@ -1063,6 +2048,93 @@ def get_models():
         print(f"获取模型列表失败: {e}")
         return jsonify({'success': False, 'message': '获取模型列表失败'})
 
+@detect_api.route('/api/inference/stats', methods=['GET'])
+def inference_stats():
+    """共享推理服务的凑批统计"""
+    return jsonify({'success': True, 'servers': get_inference_stats()})
+
+@detect_api.route('/api/detect/cache', methods=['GET'])
+def get_result_cache_stats():
+    """检测结果缓存统计：条目数、占用空间与命中情况"""
+    return jsonify({'success': True, 'cache': result_cache.get_stats()})
+
+@detect_api.route('/api/stream/captures', methods=['GET'])
+def get_capture_stats():
+    """摄像头采集线程统计：各摄像头的读取方数量、采集帧数与采集帧率"""
+    return jsonify({'success': True, 'captures': camera_captures.get_stats()})
+
+@detect_api.route('/api/sessions', methods=['GET'])
+def get_session_stats():
+    """会话数据存储统计：各存储的会话数与过期清理次数"""
+    session_registry.cleanup()
+    return jsonify({'success': True, 'sessions': session_registry.get_stats()})
+
+@detect_api.route('/api/models/loaded', methods=['GET'])
+def get_loaded_models():
+    """获取注册表中已加载模型的内存与占用情况"""
+    return jsonify({'success': True, **model_registry.get_stats()})
+
+@detect_api.route('/api/models/backend', methods=['POST'])
+def set_model_backend():
+    """设置模型的默认推理后端（torch / onnx）"""
+    try:
+        data = request.get_json() or {}
+        model_name = data.get('model_name', '').strip()
+        backend = data.get('backend', '').strip()
+        
+        if not model_name or not backend:
+            return jsonify({'success': False, 'message': '模型名称和后端不能为空'}), 400
+        
+        model_registry.set_model_backend(model_name, backend)
+        return jsonify({'success': True, 'message': '推理后端设置成功', 'model_name': model_name, 'backend': backend})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'设置推理后端失败: {e}'})
+
+@detect_api.route('/api/models/quantize', methods=['POST'])
+def quantize_model():
+    """对上传的模型做INT8训练后量化，标定帧取自历史上传，返回四个疲劳类别的精度变化与延迟收益"""
+    try:
+        data = request.get_json() or {}
+        model_name = data.get('model_name', '').strip()
+        if not model_name:
+            return jsonify({'success': False, 'message': '模型名称不能为空'}), 400
+        
+        max_frames = min(max(int(data.get('max_frames', CALIBRATION_MAX_FRAMES)), 2), 2000)
+        eval_ratio = min(max(float(data.get('eval_ratio', 0.2)), 0.05), 0.5)
+        
+        model_path, content_hash = model_registry.resolve(model_name)
+        frames = sample_calibration_frames(max_frames=max_frames)
+        report = quantize_int8(model_path, content_hash, frames, eval_ratio=eval_ratio)
+        
+        return jsonify({
+            'success': True,
+            'message': 'INT8量化完成，可通过 /api/models/backend 设置 onnx-int8 后端启用',
+            'report': report
+        })
+    except (ValueError, FileNotFoundError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        print(f"[ERROR] INT8量化失败: {e}")
+        return jsonify({'success': False, 'message': f'INT8量化失败: {e}'}), 500
+
+@detect_api.route('/api/models/quantize/report', methods=['GET'])
+def get_quantize_report():
+    """获取模型最近一次INT8量化的评估报告"""
+    try:
+        model_name = request.args.get('model_name', '').strip()
+        if not model_name:
+            return jsonify({'success': False, 'message': '模型名称不能为空'}), 400
+        
+        model_path, content_hash = model_registry.resolve(model_name)
+        report = load_int8_report(model_path, content_hash)
+        if report is None:
+            return jsonify({'success': False, 'message': '该模型尚未量化'}), 404
+        return jsonify({'success': True, 'report': report})
+    except FileNotFoundError as e:
+        return jsonify({'success': False, 'message': str(e)}), 404
+
 @detect_api.route('/api/models/current', methods=['GET'])
 def get_current_model():
     """获取当前使用的模型"""
@@ -1102,21 +2174,16 @@ def save_camera_recording():
         
         print(f"[DEBUG] 保存摄像头录制，用户: {username}, 会话ID: {session_id}")
         
-        # 检查是否有检测数据，如果没有则创建默认数据
-        if session_id not in camera_detection_data:
+        # 原子取出并结束会话统计，之后检测流的累加不会计入本次保存的结果
+        stats = camera_counters.pop(session_id)
+        if stats is None:
             print(f"[DEBUG] 没有找到检测数据，创建默认数据")
-            camera_detection_data[session_id] = {
-                'closed_eyes_count': 0,
-                'open_mouth_count': 0,
-                'open_eyes_count': 0,
-                'closed_mouth_count': 0,
-                'total_detections': 0,
-                'start_time': time.time() - 10,  # 假设运行了10秒
-                'detection_active': False
-            }
+            stats = CameraSessionStats(
+                start_time=time.time() - 10,  # 假设运行了10秒
+                detection_active=False
+            ).to_dict()
         
         # 获取统计数据
-        stats = camera_detection_data[session_id]
         current_time = time.time()
         total_seconds = current_time - stats['start_time']
         
@@ -1151,11 +2218,9 @@ def save_camera_recording():
             total_seconds
         )
         
-        # 清理检测数据
-        if session_id in camera_detection_data:
-            del camera_detection_data[session_id]
-        if session_id in real_time_detection_results:
-            del real_time_detection_results[session_id]
+        # 清理检测数据（检测流控制状态由流自身结束时更新，这里不清理）
+        for store in (camera_detection_data, real_time_detection_results, real_time_detection_data, fatigue_records):
+            store.end(session_id)
         
         return jsonify({
             'success': True,
@@ -1178,7 +2243,10 @@ def reset_camera_detection():
         username = data.get('username', 'camera_user')
         session_id = f"camera_{username}"
         print(f"[DEBUG] 重置摄像头检测数据，用户: {username}, 会话ID: {session_id}")
-        stats = camera_detection_data.get(session_id)
+        # 原子替换为新的统计，返回替换前的数据用于保存，期间检测流的累加不会丢失
+        now = time.time()
+        stats = camera_counters.replace(session_id, CameraSessionStats(start_time=now, last_update=now),
+                                        only_existing=True)
         if stats:
             start_time = stats.get('start_time', None)
             if start_time:
@@ -1222,33 +2290,15 @@ def reset_camera_detection():
         # 实际清理和重置数据
         print(f"[DEBUG] 开始清理和重置数据，会话ID: {session_id}")
 
-        # 1. 重置摄像头检测数据
-        if session_id in camera_detection_data:
-            print(f"[DEBUG] 重置前的数据: {camera_detection_data[session_id]}")
-            camera_detection_data[session_id] = {
-                'closed_eyes_count': 0,
-                'open_mouth_count': 0,
-                'open_eyes_count': 0,
-                'closed_mouth_count': 0,
-                'total_detections': 0,
-                'start_time': time.time(),
-                'last_update': time.time()
-            }
-            print(f"[DEBUG] 重置后的数据: {camera_detection_data[session_id]}")
+        # 1. 重置摄像头检测数据（已在读取统计时原子替换）
+        if stats:
+            print(f"[DEBUG] 重置前的数据: {stats}")
+            print(f"[DEBUG] 重置后的数据: {camera_counters.snapshot(session_id)}")
 
         # 2. 重置实时检测数据
         if session_id in real_time_detection_data:
             print(f"[DEBUG] 清理实时检测数据: {session_id}")
-            real_time_detection_data[session_id] = {
-                'closed_eyes': deque(maxlen=200),
-                'open_mouth': deque(maxlen=200),
-                'open_eyes': deque(maxlen=200),
-                'closed_mouth': deque(maxlen=200),
-                'last_update': 0.0,
-                'last_fatigue_check': 0.0,
-                'current_fatigue_level': 'low',
-                'detection_active': False
-            }
+            real_time_detection_data[session_id] = _new_realtime_data()
 
         # 3. 清理实时检测结果
         if session_id in real_time_detection_results:
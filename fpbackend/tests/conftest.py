@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 与 run.py 一致，把后端根目录加入 Python 路径，测试中可直接导入 app 包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,124 @@
+import random
+import sys
+import threading
+
+import pytest
+
+from app.utils.session_records import CameraSessionStats
+from app.utils.session_store import SessionStore, StripedCounterStore
+
+SESSIONS = [f'camera_user{i}' for i in range(8)]
+UPDATERS = 200
+READERS = 100
+RESETTERS = 20
+ITERATIONS = 200
+
+
+@pytest.fixture
+def counters():
+    store = SessionStore('test_counters', ttl=0, max_entries=10000)
+    return StripedCounterStore(store, lambda: CameraSessionStats(start_time=0.0, last_update=0.0), stripes=4)
+
+
+@pytest.fixture(autouse=True)
+def fast_switching():
+    # 缩短线程切换间隔，放大并发交错
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def _run_threads(targets):
+    barrier = threading.Barrier(len(targets))
+    errors = []
+
+    def wrap(target):
+        def run():
+            barrier.wait()
+            try:
+                target()
+            except Exception as e:  # 线程内异常记录后在主线程断言
+                errors.append(e)
+        return run
+
+    threads = [threading.Thread(target=wrap(target)) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+
+
+def test_concurrent_increment_snapshot_replace_pop(counters):
+    """数百个线程并发累加、读取、替换、取出：计数守恒，快照不出现只更新了一部分字段的状态"""
+    lock = threading.Lock()
+    added = dict.fromkeys(SESSIONS, 0)
+    removed = dict.fromkeys(SESSIONS, 0)
+    torn = []
+
+    def updater():
+        rng = random.Random()
+        local = dict.fromkeys(SESSIONS, 0)
+        for _ in range(ITERATIONS):
+            session_id = rng.choice(SESSIONS)
+            closed_eyes, open_mouth = rng.randint(0, 3), rng.randint(1, 2)
+            counters.increment(session_id, {
+                'closed_eyes_count': closed_eyes,
+                'open_mouth_count': open_mouth,
+                'total_detections': closed_eyes + open_mouth
+            }, last_update=1.0)
+            local[session_id] += closed_eyes + open_mouth
+        with lock:
+            for session_id, value in local.items():
+                added[session_id] += value
+
+    def reader():
+        rng = random.Random()
+        for _ in range(ITERATIONS):
+            snap = counters.snapshot(rng.choice(SESSIONS))
+            if snap is not None and snap['total_detections'] != snap['closed_eyes_count'] + snap['open_mouth_count']:
+                torn.append(snap)
+
+    def resetter():
+        rng = random.Random()
+        for _ in range(ITERATIONS // 4):
+            session_id = rng.choice(SESSIONS)
+            if rng.random() < 0.7:
+                old = counters.replace(session_id, CameraSessionStats(start_time=1.0, last_update=1.0),
+                                       only_existing=True)
+            else:
+                old = counters.pop(session_id)
+            if old is not None:
+                assert old['total_detections'] == old['closed_eyes_count'] + old['open_mouth_count']
+                with lock:
+                    removed[session_id] += old['total_detections']
+
+    _run_threads([updater] * UPDATERS + [reader] * READERS + [resetter] * RESETTERS)
+
+    assert not torn, torn[:3]
+    for session_id in SESSIONS:
+        final = counters.snapshot(session_id)
+        final_total = final['total_detections'] if final else 0
+        assert added[session_id] == removed[session_id] + final_total, session_id
+    assert sum(added.values()) > 0
+
+
+def test_concurrent_apply_read_modify_write(counters):
+    """apply 内的读改写在会话锁内串行执行，不丢失更新"""
+    def bump(record):
+        value = record['total_detections']
+        record['closed_eyes_count'] = record['closed_eyes_count'] + 1
+        record['total_detections'] = value + 1
+
+    def updater():
+        for session_id in SESSIONS:
+            for _ in range(ITERATIONS // 10):
+                counters.apply(session_id, bump)
+
+    _run_threads([updater] * UPDATERS)
+
+    for session_id in SESSIONS:
+        snap = counters.snapshot(session_id)
+        assert snap['total_detections'] == UPDATERS * (ITERATIONS // 10)
+        assert snap['closed_eyes_count'] == snap['total_detections']
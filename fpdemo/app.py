@@ -17,6 +17,11 @@ if sys.platform.startswith('win'):
 BACKEND_URL = 'http://127.0.0.1:5001'
 # BACKEND_URL ='http://10.236.12.10:5001'
 
+# 透传给后端 /api/detect 的可选检测参数
+DETECT_OPTION_FIELDS = ('backend', 'batch_size', 'pipeline_queue_size', 'pipeline_workers',
+                        'sampling', 'min_stride', 'max_stride', 'roi', 'output_mode', 'async',
+                        'segments', 'video_preset', 'video_crf', 'cache')
+
 app = Flask(__name__)
 app.secret_key = 'fatigue_detection_system'  # 用于加密会话数据
 app.config['UPLOAD_FOLDER'] = 'static/uploads'  # 上传文件存储路径
@@ -575,6 +580,9 @@ def detect_file():
             'username': session.get('username', ''),
             'user_role': session.get('role', '')
         }
+        for field in DETECT_OPTION_FIELDS:
+            if request.form.get(field):
+                data[field] = request.form.get(field)
         
         print(f"[Frontend DEBUG] Forward data: {data}")
         
@@ -624,6 +632,10 @@ def detect_file():
                 result['output_path'] = backend_url
                 print(f"[Frontend DEBUG] Converted URL: {backend_url}")
         
+        # sidecar 模式的叠加层旁路文件同样由后端提供
+        if result.get('success') and str(result.get('sidecar_path', '')).startswith('/'):
+            result['sidecar_path'] = f"{BACKEND_URL}{result['sidecar_path']}"
+        
         return jsonify(result)
         
     except requests.exceptions.Timeout:
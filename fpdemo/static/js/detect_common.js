@@ -176,4 +176,192 @@ function resetDetection() {
       }
     });
   });
-}
\ No newline at end of file
+}
+
+// ==================== 叠加层旁路文件 ====================
+// 视频以 sidecar 模式检测时，后端不重新编码标注视频，只返回原视频和逐帧检测框的 JSON，
+// 由前端在原视频上方的画布上绘制检测框和疲劳等级，可随时开关叠加层而无需重新处理
+
+const OVERLAY_BOX_COLORS = {
+  0: '#FF0000',  // 闭眼
+  1: '#0080FF',  // 闭嘴
+  2: '#00C800',  // 睁眼
+  3: '#FFA500'   // 张嘴
+};
+const OVERLAY_LEVEL_TEXT = {
+  'none': ['No Fatigue', '#00FF00'],
+  'mild': ['Mild Fatigue', '#FFFF00'],
+  'moderate': ['Moderate Fatigue', '#FFA500'],
+  'severe': ['Severe Fatigue', '#FF0000']
+};
+
+// 二分查找起始帧不大于 frame 的最后一条记录
+function findOverlayEntry(entries, frame) {
+  let lo = 0, hi = entries.length - 1, found = -1;
+  while (lo <= hi) {
+    const mid = (lo + hi) >> 1;
+    if (entries[mid][0] <= frame) {
+      found = mid;
+      lo = mid + 1;
+    } else {
+      hi = mid - 1;
+    }
+  }
+  return found === -1 ? null : entries[found];
+}
+
+// 在视频上方叠加画布并按播放进度绘制旁路文件中的检测结果
+function attachDetectionOverlay(video, sidecarUrl) {
+  const canvas = document.createElement('canvas');
+  canvas.className = 'detection-overlay';
+  canvas.style.position = 'absolute';
+  canvas.style.pointerEvents = 'none';
+  const wrapper = document.createElement('div');
+  wrapper.style.position = 'relative';
+  wrapper.style.display = 'inline-block';
+  video.parentNode.insertBefore(wrapper, video);
+  wrapper.appendChild(video);
+  wrapper.appendChild(canvas);
+
+  const overlay = { canvas: canvas, data: null, visible: true };
+  video.detectionOverlay = overlay;
+
+  function draw() {
+    const ctx = canvas.getContext('2d');
+    canvas.width = video.clientWidth;
+    canvas.height = video.clientHeight;
+    canvas.style.left = video.offsetLeft + 'px';
+    canvas.style.top = video.offsetTop + 'px';
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+    const data = overlay.data;
+    if (!data || !overlay.visible) {
+      return;
+    }
+
+    const frame = Math.floor(video.currentTime * data.fps);
+    const sx = canvas.width / data.width;
+    const sy = canvas.height / data.height;
+
+    const entry = findOverlayEntry(data.frames, frame);
+    if (entry && frame < entry[0] + entry[1]) {
+      const boxes = entry[2];
+      ctx.lineWidth = 2;
+      ctx.font = '12px sans-serif';
+      for (let i = 0; i < boxes.length; i += 6) {
+        const cls = boxes[i + 4];
+        const color = OVERLAY_BOX_COLORS[cls] || '#C8C8C8';
+        const x = boxes[i] * sx, y = boxes[i + 1] * sy;
+        ctx.strokeStyle = color;
+        ctx.strokeRect(x, y, (boxes[i + 2] - boxes[i]) * sx, (boxes[i + 3] - boxes[i + 1]) * sy);
+        const label = (data.names[cls] || ('class_' + cls)) + ' ' + (boxes[i + 5] / 100).toFixed(2);
+        ctx.fillStyle = color;
+        ctx.fillRect(x, Math.max(0, y - 16), ctx.measureText(label).width + 6, 16);
+        ctx.fillStyle = '#FFFFFF';
+        ctx.fillText(label, x + 3, Math.max(12, y - 4));
+      }
+    }
+
+    const change = findOverlayEntry(data.level_changes, frame);
+    const level = change && change[1] >= 0 ? data.levels[change[1]] : null;
+    if (level && OVERLAY_LEVEL_TEXT[level]) {
+      ctx.font = 'bold 18px sans-serif';
+      ctx.fillStyle = OVERLAY_LEVEL_TEXT[level][1];
+      ctx.fillText(OVERLAY_LEVEL_TEXT[level][0], 10, 24);
+    }
+  }
+
+  function loop() {
+    draw();
+    if (!video.paused && !video.ended) {
+      requestAnimationFrame(loop);
+    }
+  }
+
+  video.addEventListener('play', loop);
+  video.addEventListener('seeked', draw);
+  video.addEventListener('loadedmetadata', draw);
+  window.addEventListener('resize', draw);
+
+  $.getJSON(sidecarUrl).done(function(data) {
+    overlay.data = data;
+    draw();
+  }).fail(function() {
+    console.error('加载叠加层旁路文件失败:', sidecarUrl);
+  });
+
+  overlay.redraw = draw;
+  return overlay;
+}
+
+// 显示或隐藏视频叠加层
+function setDetectionOverlayVisible(video, visible) {
+  if (video && video.detectionOverlay) {
+    video.detectionOverlay.visible = visible;
+    video.detectionOverlay.redraw();
+  }
+}
+
+
+// ==================== 视频后台任务 ====================
+
+// 把后端返回的 /static/... 相对路径转换为后端完整地址
+function toBackendUrl(path) {
+  if (path && path.indexOf('/') === 0) {
+    return API_BASE_URL + path;
+  }
+  return path;
+}
+
+// 轮询视频检测任务进度，完成后把检测结果交给 onDone 处理
+function waitForVideoJob(jobId, onDone) {
+  const timer = setInterval(function() {
+    $.ajax({
+      url: `${API_BASE_URL}/api/detect/jobs/${encodeURIComponent(jobId)}`,
+      type: 'GET',
+      timeout: 5000,
+      success: function(response) {
+        if (!response.success) {
+          clearInterval(timer);
+          layer.closeAll();
+          layer.msg('检测任务不存在', {icon: 2});
+          return;
+        }
+        const job = response.job;
+        if (job.status === 'queued') {
+          layer.msg('视频检测任务排队中...', {icon: 16, time: 0, shade: 0.3});
+        } else if (job.status === 'running') {
+          let text = `视频检测中 ${job.percent}%`;
+          if (job.eta_seconds !== null && job.eta_seconds !== undefined) {
+            text += `，预计剩余 ${Math.ceil(job.eta_seconds)} 秒`;
+          }
+          layer.msg(text, {icon: 16, time: 0, shade: 0.3});
+        } else {
+          clearInterval(timer);
+          layer.closeAll();
+          if (job.status === 'completed') {
+            const result = job.result;
+            result.output_path = toBackendUrl(result.output_path);
+            result.sidecar_path = toBackendUrl(result.sidecar_path);
+            onDone(result);
+          } else if (job.status === 'cancelled') {
+            layer.msg('检测任务已取消', {icon: 0});
+          } else {
+            layer.msg('视频检测失败: ' + (job.error || '未知错误'), {icon: 2});
+          }
+        }
+      },
+      error: function(xhr, status, error) {
+        console.error('获取检测任务进度失败:', error);
+      }
+    });
+  }, 1000);
+  return timer;
+}
+
+// 取消视频检测任务
+function cancelVideoJob(jobId) {
+  return $.ajax({
+    url: `${API_BASE_URL}/api/detect/jobs/${encodeURIComponent(jobId)}/cancel`,
+    type: 'POST'
+  });
+}